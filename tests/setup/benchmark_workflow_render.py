@@ -0,0 +1,92 @@
+# benchmark workflow file generation: the old cp/sed subprocess path against in memory rendering
+# only file generation is timed, the github api lookups are not part of either path
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from workflow_template import load_workflow_template, render_workflow, write_workflow_files
+
+parser = argparse.ArgumentParser()
+# comma separated number of models to generate workflow files for
+parser.add_argument("--model_counts", type=str, default="1000,10000")
+# workflow-template.yml file to use as template for generating workflow files
+parser.add_argument("--workflow_template", type=str, default="../config/workflow-template-huggingface.yml")
+# skip the old path, useful for quick runs with large model counts
+parser.add_argument("--skip_legacy", type=str, default="false")
+args = parser.parse_args()
+
+# same values create_queue.py uses with default arguments
+TEST_SET = "huggingface-all"
+TEST_SKU_TYPE = "cpu"
+TEST_TRIGGER_NEXT_MODEL = "true"
+TEST_KEEP_LOOPING = "false"
+SECRET_NAME = "AZURE_CREDENTIALS"
+
+
+def get_models(count):
+    return [f"MLFlow-org{i % 100}/model-{i}" for i in range(count)]
+
+# the old write_single_workflow_file path: rm, cp, one sed per field, then read and rewrite in python
+def legacy_write_single_workflow_file(workflow_dir, model, q):
+    workflowname=model.replace('/','-')
+    workflow_file=f"{workflow_dir}/{workflowname}.yml"
+    os.system(f"rm -rf {workflow_dir}/demo_{workflowname}.yml")
+    os.system(f"cp {args.workflow_template} {workflow_file}")
+    test_model_name=model.replace("MLFlow-"," ").strip()
+    os.system(f"sed -i 's/test_queue: .*/test_queue: {q}/g' {workflow_file}")
+    os.system(f"sed -i 's/test_sku_type: .*/test_sku_type: {TEST_SKU_TYPE}/g' {workflow_file}")
+    os.system(f"sed -i 's/test_trigger_next_model: .*/test_trigger_next_model: {TEST_TRIGGER_NEXT_MODEL}/g' {workflow_file}")
+    os.system(f"sed -i 's/test_keep_looping: .*/test_keep_looping: {TEST_KEEP_LOOPING}/g' {workflow_file}")
+    os.system(f"sed -i 's=test_model_name: .*=test_model_name: {test_model_name}=g' {workflow_file}")
+    os.system(f"sed -i 's/test_set: .*/test_set: {TEST_SET}/g' {workflow_file}")
+    os.system(f"sed -i 's/test_secret_name: .*/test_secret_name: {SECRET_NAME}/g' {workflow_file}")
+    with open(workflow_file, 'rt') as f:
+        yaml_content = f.read()
+    with open(workflow_file, 'w') as f:
+        f.write(yaml_content.replace("distl", model))
+
+def run_legacy(workflow_dir, models):
+    for i, model in enumerate(models):
+        legacy_write_single_workflow_file(workflow_dir, model, f"test-queue-{i % 4}")
+
+def run_in_memory(workflow_dir, models):
+    template = load_workflow_template(args.workflow_template)
+    workflow_files = {}
+    for i, model in enumerate(models):
+        workflowname=model.replace('/','-')
+        workflow_files[f"{workflow_dir}/{workflowname}.yml"] = render_workflow(template, {
+            "name": model,
+            "test_queue": f"test-queue-{i % 4}",
+            "test_sku_type": TEST_SKU_TYPE,
+            "test_trigger_next_model": TEST_TRIGGER_NEXT_MODEL,
+            "test_keep_looping": TEST_KEEP_LOOPING,
+            "test_model_name": model.replace("MLFlow-"," ").strip(),
+            "test_set": TEST_SET,
+            "test_secret_name": SECRET_NAME,
+        })
+    write_workflow_files(workflow_files)
+
+def time_path(path, models):
+    workflow_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        path(workflow_dir, models)
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(workflow_dir)
+
+def main():
+    print ("Models|Old path (s)|In memory (s)|Speedup")
+    print ("------|------------|-------------|-------")
+    for count in args.model_counts.split(","):
+        models = get_models(int(count))
+        new_time = time_path(run_in_memory, models)
+        if args.skip_legacy == "true":
+            print (f"{count}|-|{new_time:.2f}|-")
+            continue
+        old_time = time_path(run_legacy, models)
+        print (f"{count}|{old_time:.2f}|{new_time:.2f}|{old_time / new_time:.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+from azure.ai.ml import MLClient
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from util import call_with_retry
+# shared with the deploy scripts in tests/src
+sys.path.append("../src")
+from registry_cache import RegistryCache
+from sku_index import build_template_index, get_sku_template_name, resolve_instance_type
+from model_manifest import get_manifest_file
+from credential_cache import get_credential
+
+# resolves the metadata the deploy scripts need for every model of a test set once, and writes it to
+# ../config/model-manifest/<test_set>.json. see model_manifest.py for how the deploy scripts read it.
+parser = argparse.ArgumentParser()
+# test set to build the manifest for, models are read from the queue files of the test set
+parser.add_argument("--test_set", type=str, default="huggingface-all")
+parser.add_argument("--queue_dir", type=str, default="../config/queue")
+# source of the model metadata - options are registry or huggingface
+# registry resolves version, task and instance types from the registry, for the deploy scripts
+# huggingface resolves the task from the hugging face hub, for the constant library automation
+parser.add_argument("--source", type=str, default="registry")
+# registry name, defaults to the registry of the queue files
+parser.add_argument("--registry_name", type=str, default=None)
+# comma separated sku types to resolve instance types for
+parser.add_argument("--sku_types", type=str, default="cpu,gpu")
+# number of models resolved in parallel
+parser.add_argument("--workers", type=int, default=8)
+# manifest file to write, defaults to ../config/model-manifest/<test_set>.json
+parser.add_argument("--manifest_file", type=str, default=None)
+args = parser.parse_args()
+
+
+# function to load the models of the test set and the registry of its queues
+def load_test_set_models():
+    models = []
+    registry = None
+    for queue_file in sorted(glob.glob(f"{args.queue_dir}/{args.test_set}/*.json")):
+        with open(queue_file) as f:
+            queue = json.load(f)
+        models.extend(queue["models"])
+        registry = registry or queue.get("registry")
+    return models, registry
+
+# function to get the sample input file of a task, relative to the config directory, None if there is none
+def get_sample_input(registry, task):
+    sample_input = f"sample_inputs/{registry}/{task}.json"
+    if task is None or not os.path.exists(f"../config/{sample_input}"):
+        return None
+    return sample_input
+
+# function to resolve the manifest entry of a registry model
+def resolve_registry_entry(registry_ml_client, registry_name, registry_cache, template_index, model_name, sku_types):
+    versions = call_with_retry(lambda: registry_cache.list_versions(registry_ml_client, registry_name, model_name))
+    if len(versions) == 0:
+        print (f"::warning:: Could not find {model_name} in {registry_name}")
+        return None
+    latest_model = sorted(versions, key=lambda x: x.creation_context.created_at, reverse=True)[0]
+    task = latest_model.tags.get("task")
+    instance_types = {}
+    for sku_type in sku_types:
+        try:
+            template_name = get_sku_template_name(latest_model, sku_type)
+        except Exception as ex:
+            print (f"::warning:: Could not read sku templates of {model_name}: {ex}")
+            break
+        if template_name is None:
+            continue
+        instance_type = resolve_instance_type(model_name, template_name, template_index, None, registry_ml_client, registry_name, registry_cache)
+        if instance_type is not None:
+            instance_types[sku_type] = instance_type
+    created_at = latest_model.creation_context.created_at
+    return {
+        "name": latest_model.name,
+        "version": str(latest_model.version),
+        "id": latest_model.id,
+        "created_at": created_at.isoformat() if hasattr(created_at, "isoformat") else created_at,
+        "task": task,
+        "instance_types": instance_types,
+        "sample_input": get_sample_input(registry_name, task),
+    }
+
+# function to resolve the manifest entry of a hugging face model, the task replaces the full hub listing
+# generic_model_download_and_register.py does at runtime. queue entries are MLFlow-<model>
+def resolve_huggingface_entry(hf_api, registry_name, model_name):
+    hf_model_name = model_name[len("MLFlow-"):] if model_name.startswith("MLFlow-") else model_name
+    try:
+        task = call_with_retry(lambda: hf_api.model_info(hf_model_name).pipeline_tag)
+    except Exception as ex:
+        print (f"::warning:: Could not find {hf_model_name} on the hugging face hub: {ex}")
+        return None
+    return {
+        "name": hf_model_name,
+        "task": task,
+        "sample_input": get_sample_input(registry_name, task),
+    }
+
+def main():
+    models, registry = load_test_set_models()
+    registry_name = args.registry_name or registry
+    if len(models) == 0:
+        print (f"::error:: No models found in {args.queue_dir}/{args.test_set}")
+        exit (1)
+    print (f"Found {len(models)} models in test set {args.test_set}")
+
+    if args.source == "registry":
+        try:
+            credential = get_credential()
+        except Exception as ex:
+            print (f"::error:: Auth failed, DefaultAzureCredential not working: \n{ex}")
+            exit (1)
+        registry_ml_client = MLClient(credential, registry_name=registry_name)
+        registry_cache = RegistryCache()
+        template_index = build_template_index(registry_ml_client, registry_name, registry_cache)
+        sku_types = args.sku_types.split(",")
+        resolve = lambda model_name: resolve_registry_entry(
+            registry_ml_client, registry_name, registry_cache, template_index, model_name, sku_types)
+    elif args.source == "huggingface":
+        from huggingface_hub import HfApi
+        hf_api = HfApi()
+        resolve = lambda model_name: resolve_huggingface_entry(hf_api, registry_name, model_name)
+    else:
+        print (f"::error:: Invalid source {args.source}")
+        exit (1)
+
+    counter = 0
+    progress_lock = threading.Lock()
+    def resolve_with_progress(model_name):
+        nonlocal counter
+        entry = resolve(model_name)
+        with progress_lock:
+            counter = counter + 1
+            sys.stdout.write(f'{counter}/{len(models)}\r')
+            sys.stdout.flush()
+        return entry
+
+    entries = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for model_name, entry in zip(models, executor.map(resolve_with_progress, models)):
+            if entry is not None:
+                # keyed the way the deploy scripts get test_model_name
+                entries[entry["name"] if args.source == "huggingface" else model_name] = entry
+
+    manifest_file = args.manifest_file or get_manifest_file(args.test_set)
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    with open(manifest_file, "w") as f:
+        json.dump({
+            "test_set": args.test_set,
+            "registry": registry_name,
+            "source": args.source,
+            "built_at": datetime.now().strftime('%d%b%Y-%H%M%S'),
+            "models": entries,
+        }, f, indent=4)
+
+    print ("\nSummary:")
+    print (f"  Models in manifest: {len(entries)} of {len(models)}")
+    print (f"  Models without task: {len([m for m in entries if not entries[m]['task']])}")
+    print (f"  Models without sample input: {len([m for m in entries if not entries[m]['sample_input']])}")
+    if args.source == "registry":
+        for sku_type in sku_types:
+            print (f"  Models without {sku_type} instance type: {len([m for m in entries if sku_type not in entries[m]['instance_types']])}")
+    print (f"  Manifest: {manifest_file}")
+
+if __name__ == "__main__":
+    main()
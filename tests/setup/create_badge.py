@@ -15,12 +15,15 @@ from azure.ai.ml.entities import (
 import json
 import os
 import argparse
+from dashboard import load_model_tasks, build_status_data, write_dashboard
 
 # argument, markdown file name
 parser = argparse.ArgumentParser()
 parser.add_argument("--markdown_file", type=str, default="../../dashboard/HuggingFace/README.md")
 # argument, models list json, logged by create_queue.py
 parser.add_argument("--models_list_json", type=str, default="../logs/get_model_containers/17May2023-231031.json")
+# argument, model manifest written by build_manifest.py, to show the task of each model
+parser.add_argument("--model_manifest", type=str, default=None)
 args = parser.parse_args()
 
 templates=['transformers-cpu-small', 'transformers-cpu-medium', 'transformers-cpu-large','transformers-cpu-extra-large', 'transformers-gpu-medium']
@@ -29,20 +32,12 @@ templates=['transformers-cpu-small', 'transformers-cpu-medium', 'transformers-cp
 with open(args.models_list_json) as f:
     model_containers = json.load(f)
 
-lines=[]
-i=0  
-# Getting latest model version from registry is not working, so get all versions and find latest
-for model in model_containers:
-    lines.append(f"{model}|[![{model}](https://github.com/Azure/azureml-oss-models/actions/workflows/{model}.yml/badge.svg)](https://github.com/Azure/azureml-oss-models/actions/workflows/{model}.yml)")
-    i= i + 1
+# status of the models is not known here, so every model is listed as not tested with the task from the model manifest
+results_per_model = {model: {"not_tested": 1} for model in model_containers}
+summary = {"total": len(model_containers)}
+write_dashboard(os.path.dirname(args.markdown_file), build_status_data(results_per_model, summary, load_model_tasks(args.model_manifest)), "Models")
 
-# write to markdown file
+# write to markdown file, the dashboard page lists the models instead of one badge per model
 with open(args.markdown_file, 'w') as f:
-    f.write(f"### Total models: {i}\n")
-    f.write("|Model|Status|\n")
-    f.write("|-----|------|\n")   
-    for line in lines:
-        f.write(line + "\n")
-
-
-
+    f.write(f"### Total models: {len(model_containers)}\n")
+    f.write("Browse the models on the [dashboard](index.html) ([status.json](status.json))\n")
@@ -1,5 +1,4 @@
 from azure.ai.ml import MLClient
-from azure.identity import DefaultAzureCredential
 import time, sys
 from azure.ai.ml.entities import (
     ManagedOnlineEndpoint,
@@ -10,10 +9,14 @@ import json
 import os
 import argparse
 import sys
-from util import load_model_list_file, get_model_containers
+from util import get_model_containers, load_latest_changelog
+from credential_cache import get_credential
+from scheduling import load_model_list_file, load_durations, assign_round_robin, assign_by_duration, predict_queue_durations
+from workflow_template import load_workflow_template, render_workflow, render_model_steps
+from github_api import GITHUB_REPO_API, create_github_session, get_tree_sha_index, get_blob_sha
+from output_manifest import load_manifest, plan_outputs, print_plan, apply_plan
 from pathlib import Path
 import yaml
-import requests
 import textwrap
 # from github import Github
 # constants
@@ -24,6 +27,12 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--mode", type=str, default="file")
 # registry name if model is in registry
 parser.add_argument("--registry_name", type=str, default="HuggingFace")
+# number of threads used to query model versions from the registry in registry mode
+parser.add_argument("--registry_workers", type=int, default=8)
+# registry sync - options are full or delta. delta only lists versions of containers changed since the last run
+parser.add_argument("--registry_sync", type=str, default="full")
+# queue only the models added or changed in the registry since the last snapshot, in registry mode
+parser.add_argument("--changed_models_only", type=str, default="false")
 # argument to specify Github workflow directory. can write to local dir for testing
 # !!! main workflow files will be overwritten if set to "../../.github/workflows" !!!
 parser.add_argument("--workflow_dir", type=str, default="../../.github/workflows")
@@ -45,15 +54,38 @@ parser.add_argument("--test_sku_type", type=str, default="cpu")
 parser.add_argument("--parallel_tests", type=int, default=4)
 # workflow-template.yml file to use as template for generating workflow files
 parser.add_argument("--workflow_template", type=str, default="../config/workflow-template-huggingface.yml")
+# workflow_mode - options are model or queue
+# model generates one workflow per model, chained with gh workflow run. queue generates one workflow per queue
+# that tests the models of the queue one after the other in a single runner
+parser.add_argument("--workflow_mode", type=str, default="model")
+# workflow-template-queue.yml file to use as template for generating queue workflow files
+parser.add_argument("--queue_workflow_template", type=str, default="../config/workflow-template-queue.yml")
 # workspace_list file get workspace metadata
 parser.add_argument("--workspace_list", type=str, default="../config/workspaces.json")
+# manifest with a hash per generated file, defaults to <queue_dir>/<test_set>.manifest.json
+# only changed files are written and files generated by the last run but not this one are deleted
+parser.add_argument("--manifest_file", type=str, default=None)
+# plan_only, to print the files that would be added, changed or deleted without writing them
+parser.add_argument("--plan_only", type=str, default="false")
+# workers, number of threads used to write and delete workflow files, rendering is cpu bound and runs on one thread
+parser.add_argument("--workers", type=int, default=1)
+# github repository api url to look up checked in workflow files, can point to a local stub server for testing
+parser.add_argument("--github_api_url", type=str, default=GITHUB_REPO_API)
+# branch or commit to look up checked in workflow files in
+parser.add_argument("--github_ref", type=str, default="main")
 # directory to write logs
 parser.add_argument("--log_dir", type=str, default="../logs")
+# scheduling - options are round_robin or duration
+# duration packs the longest models first onto the least loaded queue, using durations_file
+parser.add_argument("--scheduling", type=str, default="round_robin")
+# per-model durations in minutes, the results_per_model json logged by test_status_v2.py
+parser.add_argument("--durations_file", type=str, default=None)
+# duration in minutes to assume for models without history, defaults to the median of known durations
+parser.add_argument("--default_duration", type=float, default=None)
 args = parser.parse_args()
 parallel_tests = int(args.parallel_tests)
 try:
-    credential = DefaultAzureCredential()
-    credential.get_token("https://management.azure.com/.default")
+    credential = get_credential()
 except Exception as ex:
     print ("::error Auth failed, DefaultAzureCredential not working: \n{e}")
     exit (1)
@@ -69,16 +101,10 @@ def load_workspace_config():
 # function to assign models to queues
 # assign each model from models to a thread per workspace in a round robin fashion by appending to a list called 'models' in the queue dictionary
 # function to create queue files
+# returns a dictionary of queue file name to content, files are written by write_outputs
 def create_queue_files(queue, workspace_list):
     print (f"\nCreating queue files")
-    # create folder queue if it does not exist
-    if not os.path.exists(args.queue_dir):
-        os.makedirs(args.queue_dir)
-    # check if test_set folder exists
-    if not os.path.exists(f"{args.queue_dir}/{args.test_set}"):
-        os.makedirs(f"{args.queue_dir}/{args.test_set}")
-    # delete any files in test_set folder
-    # os.system(f"rm -rf {args.queue_dir}/{args.test_set}/*")
+    queue_files = {}
     # generate queue files
     for workspace in queue:
         for thread in queue[workspace]:
@@ -92,162 +118,171 @@ def create_queue_files(queue, workspace_list):
             q_dict["environment"] = workspace_list[workspace]["environment"]
             q_dict["compute"] = workspace_list[workspace]["compute"]
             q_dict["instance_type"] = workspace_list[workspace]["instance_type"]
-            print("q_dict",q_dict)
-            print("workspace",q_dict["workspace"])
-            print("subscription",q_dict["subscription"])   
-            print("resource_group",q_dict["resource_group"])
-            print("registry",q_dict["registry"])
-            with open(f"{args.queue_dir}/{args.test_set}/{workspace}-{thread}.json", 'w') as f:
-                print("enterred write file")
-                json.dump(q_dict,f,indent=4)
-                
+            queue_files[f"{args.queue_dir}/{args.test_set}/{workspace}-{thread}.json"] = json.dumps(q_dict, indent=4)
+    return queue_files
+
+# function to get the leftover demo_ copies of the workflow files in outputs, they are deleted with the stale files
+def get_leftover_workflow_files(outputs):
+    return [f"{os.path.dirname(path)}/demo_{os.path.basename(path)}" for path in outputs
+            if path.endswith(".yml") and os.path.exists(f"{os.path.dirname(path)}/demo_{os.path.basename(path)}")]
+
+# function to write generated files that changed since the last run and delete stale ones
+# the manifest stores a hash per generated file, unchanged files are not rewritten
+def write_outputs(outputs):
+    manifest_file = args.manifest_file or f"{args.queue_dir}/{args.test_set}.manifest.json"
+    plan = plan_outputs(outputs, load_manifest(manifest_file), get_leftover_workflow_files(outputs))
+    print_plan(plan)
+    if args.plan_only == "true":
+        print ("plan_only is set, no files written")
+        return plan
+    apply_plan(plan, outputs, manifest_file, args.workers)
+    print (f"Updated manifest {manifest_file}")
+    return plan
                     
-def assign_models_to_queues(models, workspace_list):
-    queue = {}
-    i=0
-    while i < len(models):
-        for workspace in workspace_list:
-            print (f"workspace instance: {workspace}")
-            for thread in range(parallel_tests):
-                print (f"thread instance: {thread}")
-                if i < len(models):
-                    if workspace not in queue:
-                        queue[workspace] = {}
-                        print("queue[workspace]",queue[workspace])
-                    if thread not in queue[workspace]:
-                        queue[workspace][thread] = []
-                    queue[workspace][thread].append("MLFlow-"+models[i])
-                    print("queue[workspace][thread]",queue[workspace][thread])
-                    i=i+1
-                    #print (f"Adding model {models[i]} at index {i} to queue {workspace}-{thread}")
-                else:
-                    #print (f"Reached end of models list, breaking out of loop")
-                    if LOG:
-                        print("current working directory is:", os.getcwd())
-                        # if assign_models_to_queues under log_dir does not exist, create it
-                        print("args.log_dir:", args.log_dir)
-                        
-                        if not os.path.exists(f"{args.log_dir}/assign_models_to_queues"):
-                            logpath=Path(f"{args.log_dir}/assign_models_to_queues")
-                            os.makedirs(logpath)
-                            print("logs created:" f"{args.log_dir}/assign_models_to_queues")
-                        # generate filename as DDMMMYYYY-HHMMSS.json
-                        timestamp = time.strftime("%d%b%Y-%H%M%S.json")
-                        # write queue to file
-                        with open(f"{args.log_dir}/assign_models_to_queues/{timestamp}", 'w') as f:
-                            json.dump(queue, f, indent=4)
-                    # validate that count of models across all queues is equal to count of models in models list
-                    model_count=0
-                    for workspace in queue:
-                        for thread in queue[workspace]:
-                            model_count=model_count+len(queue[workspace][thread])
-                    if model_count != len(models):
-                        print (f"Error: Model count mismatch. Expected {len(models)} but found {model_count}")
-                        exit (1)
-                    else:
-                        print (f"Found {model_count} models across {len(queue)} queues, which is equal to count of models in models list")
-                    return queue
+def assign_models_to_queues(models, workspace_list, durations):
+    # queue entries are the workflow names, which are prefixed with MLFlow-
+    models = ["MLFlow-"+model for model in models]
+    if args.scheduling == "round_robin":
+        queue = assign_round_robin(models, workspace_list, parallel_tests)
+    elif args.scheduling == "duration":
+        if len(durations) == 0:
+            print ("::warning:: No historical durations found, all models will be treated as equal")
+        queue = assign_by_duration(models, workspace_list, parallel_tests, durations, args.default_duration)
+    else:
+        print (f"::error Invalid scheduling {args.scheduling}")
+        exit (1)
+    if LOG:
+        print("current working directory is:", os.getcwd())
+        # if assign_models_to_queues under log_dir does not exist, create it
+        print("args.log_dir:", args.log_dir)
+        
+        if not os.path.exists(f"{args.log_dir}/assign_models_to_queues"):
+            logpath=Path(f"{args.log_dir}/assign_models_to_queues")
+            os.makedirs(logpath)
+            print("logs created:" f"{args.log_dir}/assign_models_to_queues")
+        # generate filename as DDMMMYYYY-HHMMSS.json
+        timestamp = time.strftime("%d%b%Y-%H%M%S.json")
+        # write queue to file
+        with open(f"{args.log_dir}/assign_models_to_queues/{timestamp}", 'w') as f:
+            json.dump(queue, f, indent=4)
+    # validate that count of models across all queues is equal to count of models in models list
+    model_count=0
+    for workspace in queue:
+        for thread in queue[workspace]:
+            model_count=model_count+len(queue[workspace][thread])
+    if model_count != len(models):
+        print (f"Error: Model count mismatch. Expected {len(models)} but found {model_count}")
+        exit (1)
+    else:
+        print (f"Found {model_count} models across {len(queue)} queues, which is equal to count of models in models list")
+    return queue
 # function to create workflow files
 # !!! any existing workflow files in workflow_dir will be overwritten. backup... !!!
+# returns a dictionary of workflow file name to content, files are written by write_outputs
 def create_workflow_files(q,workspace_list):
-    counter=0
+    if args.workflow_mode == "queue":
+        return create_queue_workflow_files(q, workspace_list)
+    elif args.workflow_mode != "model":
+        print (f"::error Invalid workflow_mode {args.workflow_mode}")
+        exit (1)
     print (f"Creating workflow files")
-    # check if workflow_dir exists
-    if not os.path.exists(args.workflow_dir):
-        os.makedirs(args.workflow_dir)
-    # generate workflow files
+    # parse the template once and render every workflow file in memory
+    template = load_workflow_template(args.workflow_template)
+    sha_index = get_workflow_sha_index()
+    # one job per model, in queue order
+    jobs = []
     for workspace in q:
-        print("entered q loop:",workspace)
         for thread in q[workspace]:
-            print("entered q of workspace loop:",thread)
             for model in q[workspace][thread]:
-                # for model in models:
-                print("entered q of workspace of thread loop:",model)
-                # print("entered model of workspace of thread loop:",workflownames)
-                write_single_workflow_file(model,f"{workspace}-{thread}", workspace_list[workspace]['secret_name'])
-                # print progress
-                counter=counter+1
-                print("counter:",counter)
-                sys.stdout.write(f'{counter}\r')
-                sys.stdout.flush()
-    print (f"\nCreated {counter} workflow files")
-# function to write a single workflow file
-def write_single_workflow_file(model, q, secret_name):
-    # print a single dot without a newline to show progress
-    print (".", end="", flush=True)
+                jobs.append((model, f"{workspace}-{thread}", workspace_list[workspace]['secret_name']))
+    # rendering holds the GIL, threads measured no faster than one thread, so files are rendered in order here
+    # and only the writes in write_outputs are spread over args.workers threads
+    workflow_files = {}
+    counter = 0
+    for model, queue_name, secret_name in jobs:
+        workflow_file, content = render_single_workflow_file(template, model, queue_name, secret_name)
+        workflow_files[workflow_file] = content
+        # print progress
+        counter=counter+1
+        sys.stdout.write(f'{counter}\r')
+        sys.stdout.flush()
+    # validate that there is one workflow file per model across all queues
+    if len(workflow_files) != len(jobs):
+        print (f"Error: Workflow file count mismatch. Expected {len(jobs)} but found {len(workflow_files)}")
+        exit (1)
+    print (f"\nRendered {counter} workflow files")
+    print_checked_in_changes(workflow_files, sha_index)
+    return workflow_files
+# function to create one workflow per queue that tests all models of the queue in one runner
+# saves the runner start, checkout and pip installs for every model but the first
+def create_queue_workflow_files(q, workspace_list):
+    print ("Creating queue workflow files")
+    template = load_workflow_template(args.queue_workflow_template)
+    workflow_files = {}
+    for workspace in q:
+        for thread in q[workspace]:
+            queue_name = f"{workspace}-{thread}"
+            workflowname = f"queue-{args.test_set}-{queue_name}"
+            content = render_workflow(template, {
+                "name": workflowname,
+                "test_queue": queue_name,
+                "test_sku_type": args.test_sku_type,
+                # models are run one after the other by the steps of the job, there is no next workflow to trigger
+                "test_trigger_next_model": "false",
+                "test_keep_looping": args.test_keep_looping,
+                "test_set": args.test_set,
+                "test_secret_name": workspace_list[workspace]['secret_name'],
+            })
+            models = [(model, model.replace("MLFlow-"," ").strip()) for model in q[workspace][thread]]
+            content = render_model_steps(content, models, "python generic_initial_automation.py", "tests/src/automation_for_constant_library")
+            workflow_files[f"{args.workflow_dir}/{workflowname}.yml"] = content
+    # validate that there is one workflow file per queue
+    queue_count = sum(len(q[workspace]) for workspace in q)
+    if len(workflow_files) != queue_count:
+        print (f"Error: Workflow file count mismatch. Expected {queue_count} but found {len(workflow_files)}")
+        exit (1)
+    print (f"Rendered {len(workflow_files)} queue workflow files")
+    return workflow_files
+# function to render a single workflow file, returns the file name and content
+def render_single_workflow_file(template, model, q, secret_name):
     workflowname=model.replace('/','-')
-    # workflowname=model.replace('/','-')
-    # os.system(f"sed -i 's/name: .*/name: {model}/g' {args.workflow_template}")
     workflow_file=f"{args.workflow_dir}/{workflowname}.yml"
-    os.system(f"rm -rf {args.workflow_dir}/demo_{workflowname}.yml") 
-    # print("yml file----------------------------------------",workflow_file)
-    # # print(workflow_file['env']['test_queue'])
-    print (f"Generating workflow file: {workflow_file}")
-    os.system(f"cp {args.workflow_template} {workflow_file}")
     test_Model=model.replace("MLFlow-"," ")
     test_model_name=test_Model.strip()
-    print(test_model_name)
-    MLmodel="MLFlow-"+model
-    print("MLmodel:",model)
-    os.system(f"sed -i s/name: .*/name: {model}/g' {workflow_file}")
-    # replace <test_queue> with q
-    os.system(f"sed -i 's/test_queue: .*/test_queue: {q}/g' {workflow_file}")
-    # os.system(f"sed -i 's/test-norwayeast-02/{q}/g' {workflow_file}")
-    # replace <test_sku_type> with test_sku_type in workflow_file
-    os.system(f"sed -i 's/test_sku_type: .*/test_sku_type: {args.test_sku_type}/g' {workflow_file}")
-    # replace <test_registry> with test_registry in workflow_file
-    os.system(f"sed -i 's/test_trigger_next_model: .*/test_trigger_next_model: {args.test_trigger_next_model}/g' {workflow_file}")
-    # replace <test_keep_looping> with test_keep_looping in workflow_file
-    os.system(f"sed -i 's/test_keep_looping: .*/test_keep_looping: {args.test_keep_looping}/g' {workflow_file}")
-    # replace <test_model_name> with model_container.name in workflow_file
-    os.system(f"sed -i 's=test_model_name: .*=test_model_name: {test_model_name}=g' {workflow_file}")
-    # replace <test_set> with test_set in workflow_file
-    os.system(f"sed -i 's/test_set: .*/test_set: {args.test_set}/g' {workflow_file}")
-    # replace <test_secret_name> 
-    os.system(f"sed -i 's/test_secret_name: .*/test_secret_name: {secret_name}/g' {workflow_file}")
-    # # Read in the file
-    # github_token="GITHUB_TOKEN"
-    repository_owner="Konjarla-Vindya"
-    repository_name="son-azureml-oss-models"
-    workflow_filename=f".github/workflows/{workflowname}.yml"
-    # workflow_sha="main"  # You need to provide the correct SHA
-    new_workflow_name={model}
-    new_job_name={model}
-    # Construct the API URL
-    api_url = f"https://api.github.com/repositories/655633575/contents/{workflow_filename}"
-    print("api url is genrating:--------------------",api_url)
-    print("type of api_url=============",type(api_url))
-    print("type of workflow_file=============",type(workflow_file))
-    github_token = os.environ.get("GITHUB_TOKEN")
-    # print("github_token: is ------------------------------------",github_token)
-   
-    # Prepare the request headers
-    headers = {
-        "Authorization": f"Bearer {github_token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-    print("header---------------------",headers)
-    # Make the GET request
-    response = requests.get(api_url, headers=headers)
-    print("response is genrating:--------------------",response)
-    
-    if response.status_code == 200:
-        file_info = response.json()
-        file_sha = file_info["sha"]
-        print(f"SHA of '{workflow_filename}': {file_sha}")
-    else:
-        print(f"Failed to fetch file info. Status code: {response.status_code}")
-    
-    with open(workflow_file, 'rt') as f:
-        yaml_content = f.read()
-        # yaml_content=yaml.safe_load(f)
-    
-    updated_yaml_content = yaml_content.replace("distl", model)
-    yml_content='"""'+'\n'+updated_yaml_content+'\n'+'"""'
-    print("updated_yaml_content-----------------------",yml_content)
-    modified_yaml_content = yml_content.replace('"""', '')
-    with open(workflow_file, 'w') as yaml_file:
-        yaml_file.write(updated_yaml_content)
+    content = render_workflow(template, {
+        # the workflow name is the model name with the MLFlow- prefix, test_status_v2.py matches runs on it
+        "name": model,
+        "test_queue": q,
+        "test_sku_type": args.test_sku_type,
+        "test_trigger_next_model": args.test_trigger_next_model,
+        "test_keep_looping": args.test_keep_looping,
+        "test_model_name": test_model_name,
+        "test_set": args.test_set,
+        "test_secret_name": secret_name,
+    })
+    return workflow_file, content
+# function to print how the rendered workflow files differ from the files checked in at github_ref
+# a file is unchanged when the git blob SHA of its rendered content is the SHA in the index built by get_workflow_sha_index
+def print_checked_in_changes(workflow_files, sha_index):
+    new_files = []
+    changed_files = []
+    for workflow_file in workflow_files:
+        file_sha = sha_index.get(os.path.basename(workflow_file))
+        if file_sha is None:
+            new_files.append(workflow_file)
+        elif file_sha != get_blob_sha(workflow_files[workflow_file]):
+            changed_files.append(workflow_file)
+    print (f"Compared to {args.github_ref}: {len(new_files)} new, {len(changed_files)} changed, {len(workflow_files) - len(new_files) - len(changed_files)} unchanged workflow files")
+    for workflow_file in new_files:
+        print (f"  new: {workflow_file}")
+    for workflow_file in changed_files:
+        print (f"  changed: {workflow_file}")
+# function to index the SHA of every checked in workflow file with a few git trees calls
+def get_workflow_sha_index():
+    session = create_github_session(os.environ.get("GITHUB_TOKEN"))
+    sha_index = get_tree_sha_index(session, args.github_api_url, args.github_ref, ".github/workflows")
+    print (f"Found {len(sha_index)} checked in workflow files in {args.github_ref}")
+    return sha_index
     
 def workflow_names(models):
     workflownames=[]
@@ -266,7 +301,15 @@ def main():
     
     # get list of models from registry
     if args.mode == "registry":
-        models = get_model_containers(args.registry_name)
+        models = get_model_containers(args.registry_name, templates, args.registry_workers, sync=args.registry_sync)
+        if args.changed_models_only == "true":
+            changelog = load_latest_changelog(args.registry_name)
+            changed_models = set(changelog["added"]) | {change["name"] for change in changelog["changed"]}
+            models = [model for model in models if model in changed_models]
+            print (f"Queueing {len(models)} models added or changed since {changelog['previous_snapshot']}")
+            if len(models) == 0:
+                print ("No models changed, nothing to queue")
+                exit (0)
     elif args.mode == "file":
         models = load_model_list_file(args.model_list_file)
     else:
@@ -280,25 +323,39 @@ def main():
     # load workspace_list_json
     workspace_list = load_workspace_config()
     print (f"Found {len(workspace_list)} workspaces")
+    # load historical per-model durations
+    durations = {}
+    if args.durations_file:
+        durations = load_durations(args.durations_file)
+        print (f"Found durations for {len(durations)} models")
     # assign models to queues
-    queue = assign_models_to_queues(models, workspace_list)
+    queue = assign_models_to_queues(models, workspace_list, durations)
     # q=assign_models_to_workflowq(workflownames, workspace_list)
     q=queue
     print("q",q)
     print("queue",queue)
     print (f"Created queues")
     # create queue files
-    create_queue_files(queue, workspace_list)
-    print (f"Created queue files")
+    outputs = create_queue_files(queue, workspace_list)
     # create workflow files
-    create_workflow_files(q, workspace_list)
-    print (f"Created workflow files")
+    outputs.update(create_workflow_files(q, workspace_list))
+    # write only the queue and workflow files that changed
+    plan = write_outputs(outputs)
+    print ("Created queue and workflow files")
     print (f"Summary:")
     print (f"  Models: {len(models)}")
     print (f"  Workspaces: {len(workspace_list)}")
     print (f"  Parallel tests: {parallel_tests}")
     print (f"  Total queues: {len(workspace_list)*parallel_tests}")
     print (f"  Average models per queue: {int(len(models)/(len(workspace_list)*parallel_tests))}")
+    print (f"  Files added: {len(plan['add'])}, changed: {len(plan['change'])}, deleted: {len(plan['delete'])}, unchanged: {len(plan['unchanged'])}")
+    if args.durations_file:
+        predicted = predict_queue_durations(queue, durations, args.default_duration)
+        print ("  Predicted wall-clock per queue:")
+        for queue_name in predicted:
+            print (f"    {queue_name}: {int(predicted[queue_name] / 60)}h {int(predicted[queue_name] % 60)}m")
+        makespan = max(predicted.values(), default=0)
+        print (f"  Predicted wall-clock for test set: {int(makespan / 60)}h {int(makespan % 60)}m")
         
 if __name__ == "__main__":
     main()
@@ -0,0 +1,73 @@
+import html
+import json
+import os
+import sys
+from datetime import datetime
+# model_manifest.py is shared with the scripts in tests/src
+sys.path.append("../src")
+from model_manifest import load_model_manifest
+
+# the dashboard is a status.json file with one row per model, and a static index.html that loads it and
+# filters and pages through the models in the browser. the markdown dashboard keeps the summary and links to it,
+# instead of one workflow badge per model that each view had to fetch from github.
+
+# constants
+WORKFLOW_URL = "https://github.com/Azure/azureml-oss-models/actions/workflows"
+DASHBOARD_TEMPLATE = "../config/dashboard-template.html"
+COLUMNS = ["model", "status", "task", "last_tested", "duration", "success_rate", "p50", "p95"]
+
+
+# function to get the status of a model from its calculate_test_status result
+def get_model_status(result):
+    for status in ["success", "failure", "unknown", "not_tested"]:
+        if result.get(status):
+            return status
+    return "not_tested"
+
+# function to get the task of every model from a model manifest written by build_manifest.py, {} without one
+def load_model_tasks(model_manifest_file):
+    manifest = load_model_manifest(model_manifest_file)
+    if manifest is None:
+        return {}
+    return {model: manifest["models"][model].get("task") for model in manifest["models"]}
+
+def round_minutes(minutes):
+    return round(minutes, 1) if minutes is not None else None
+
+# function to build the status data of the dashboard, models are rows in the order of COLUMNS to keep the file small
+# regressions - latest runs slower than their baseline, from test_status_v2.find_regressions
+def build_status_data(results_per_model, summary, model_tasks, regressions=None):
+    models = []
+    for model in results_per_model:
+        result = results_per_model[model]
+        # workflow names of the constant library automation are MLFlow-<model>
+        task = model_tasks.get(model) or model_tasks.get(model[len("MLFlow-"):] if model.startswith("MLFlow-") else model)
+        models.append([
+            model,
+            get_model_status(result),
+            task,
+            result.get("last_tested"),
+            round_minutes(result.get("duration")) if result.get("last_tested") else None,
+            result.get("success_rate"),
+            round_minutes(result.get("p50")),
+            round_minutes(result.get("p95")),
+        ])
+    return {
+        "generated_at": datetime.now().strftime('%d%b%Y-%H%M%S'),
+        "workflow_url": WORKFLOW_URL,
+        "summary": summary,
+        "columns": COLUMNS,
+        "models": models,
+        "regressions": regressions or [],
+    }
+
+# function to write status.json and index.html to dashboard_dir
+def write_dashboard(dashboard_dir, data, title, template=DASHBOARD_TEMPLATE):
+    os.makedirs(dashboard_dir, exist_ok=True)
+    with open(os.path.join(dashboard_dir, "status.json"), "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    with open(template) as f:
+        page = f.read().replace("{{title}}", html.escape(title))
+    with open(os.path.join(dashboard_dir, "index.html"), "w") as f:
+        f.write(page)
+    print (f"Wrote dashboard for {len(data['models'])} models to {dashboard_dir}")
@@ -0,0 +1,83 @@
+import hashlib
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# github rest api repository url, pass a local url to test against a stub server
+GITHUB_REPO_API = "https://api.github.com/repositories/655633575"
+
+
+# function to create a pooled requests session that retries failed GETs with exponential backoff
+# retries server errors, and 429 only when it has a Retry-After header (secondary rate limit). a 429 of the primary
+# rate limit has no Retry-After and is returned, so get_with_rate_limit can wait for X-RateLimit-Reset
+# the last response is returned instead of raising when the retries are used up
+def create_github_session(token=None, retries=5, backoff_factor=1, pool_maxsize=10):
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    })
+    if token:
+        session.headers["Authorization"] = f"Bearer {token}"
+    return session
+
+def get_tree(session, repo_api_url, tree_sha):
+    response = session.get(f"{repo_api_url}/git/trees/{tree_sha}")
+    if response.status_code != 200:
+        print (f"::warning:: Failed to fetch tree {tree_sha}. Status code: {response.status_code}")
+        return None
+    tree = response.json()
+    if tree.get("truncated"):
+        print (f"::warning:: Tree {tree_sha} was truncated by the github api, some files may be missing")
+    return tree
+
+# function to get a dictionary of file name to blob SHA for every file in a directory of the repo
+# walks the git trees from the root of ref, one call per path segment instead of one call per file
+def get_tree_sha_index(session, repo_api_url, ref, path):
+    tree = get_tree(session, repo_api_url, ref)
+    for segment in [s for s in path.split("/") if s]:
+        if tree is None:
+            return {}
+        entry = next((e for e in tree["tree"] if e["path"] == segment and e["type"] == "tree"), None)
+        if entry is None:
+            print (f"::warning:: Could not find {path} in {ref}")
+            return {}
+        tree = get_tree(session, repo_api_url, entry["sha"])
+    if tree is None:
+        return {}
+    return {e["path"]: e["sha"] for e in tree["tree"] if e["type"] == "blob"}
+
+# function to get the git blob SHA of content, which is the SHA the git trees api reports for a file with that content
+def get_blob_sha(content):
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+# function to GET a github api url, waiting for the rate limit to reset when it is exhausted
+# github answers 403 or 429 with X-RateLimit-Remaining 0 and the reset time in X-RateLimit-Reset when the
+# primary rate limit is used up. sessions from create_github_session return those responses instead of retrying them
+# waits at most max_wait seconds per call, returns the last response either way
+def get_with_rate_limit(session, url, params=None, max_wait=15 * 60, retries=3):
+    for attempt in range(retries + 1):
+        response = session.get(url, params=params)
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if response.status_code not in [403, 429] or remaining != "0" or attempt == retries:
+            return response
+        wait = max(int(response.headers.get("X-RateLimit-Reset", time.time())) - time.time(), 0) + 1
+        if wait > max_wait:
+            print (f"::warning:: Github rate limit resets in {int(wait)}s, more than {max_wait}s, giving up")
+            return response
+        print (f"::warning:: Github rate limit exhausted, waiting {int(wait)}s for it to reset")
+        time.sleep(wait)
+    return response
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# the manifest records the sha256 of every file a create_queue.py run generated for a test set
+# paths are stored relative to the manifest file, so runs from different directories share it
+
+
+def hash_content(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# function to load the manifest as a dictionary of file path to hash, empty if there is no manifest yet
+def load_manifest(manifest_file):
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as f:
+        files = json.load(f)["files"]
+    manifest_dir = os.path.dirname(manifest_file) or "."
+    return {os.path.normpath(os.path.join(manifest_dir, path)): files[path] for path in files}
+
+def save_manifest(manifest_file, hashes):
+    manifest_dir = os.path.dirname(manifest_file) or "."
+    os.makedirs(manifest_dir, exist_ok=True)
+    files = {os.path.relpath(path, manifest_dir): hashes[path] for path in sorted(hashes)}
+    with open(manifest_file, "w") as f:
+        json.dump({"files": files}, f, indent=4)
+
+# function to compare generated outputs, a dictionary of file path to content, against the manifest
+# returns the hash of every output and the files to add, change, keep and delete
+# leftovers - files that are deleted when they exist although the manifest doesn't list them, such as old copies of outputs
+def plan_outputs(outputs, manifest, leftovers=()):
+    plan = {"add": [], "change": [], "unchanged": [], "delete": [], "hashes": {}}
+    for path in outputs:
+        path_hash = hash_content(outputs[path])
+        plan["hashes"][os.path.normpath(path)] = path_hash
+        previous_hash = manifest.get(os.path.normpath(path))
+        if previous_hash is None or not os.path.exists(path):
+            plan["add"].append(path)
+        elif previous_hash != path_hash:
+            plan["change"].append(path)
+        else:
+            plan["unchanged"].append(path)
+    for path in manifest:
+        if path in plan["hashes"] or not os.path.exists(path):
+            continue
+        # only delete stale files that still have the content we generated, another test set
+        # or a manual edit may have rewritten the file since
+        if hash_file(path) == manifest[path]:
+            plan["delete"].append(path)
+    for path in leftovers:
+        if os.path.exists(path) and os.path.normpath(path) not in plan["hashes"] and path not in plan["delete"]:
+            plan["delete"].append(path)
+    return plan
+
+def print_plan(plan):
+    print ("Plan:")
+    for path in plan["add"]:
+        print (f"  + {path}")
+    for path in plan["change"]:
+        print (f"  ~ {path}")
+    for path in plan["delete"]:
+        print (f"  - {path}")
+    print (f"  {len(plan['add'])} to add, {len(plan['change'])} to change, {len(plan['delete'])} to delete, {len(plan['unchanged'])} unchanged")
+
+def write_output(path, content):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+# function to write added and changed files, delete stale files and save the new manifest
+# files are written on a pool of workers threads, the manifest is only saved once all writes succeeded
+def apply_plan(plan, outputs, manifest_file, workers=1):
+    paths = plan["add"] + plan["change"]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises the first failed write
+        list(executor.map(lambda path: write_output(path, outputs[path]), paths))
+        list(executor.map(os.remove, plan["delete"]))
+    save_manifest(manifest_file, plan["hashes"])
@@ -0,0 +1,161 @@
+import argparse
+import json
+import time
+from scheduling import (load_model_list_file, load_durations, get_default_duration, assign_round_robin, assign_by_duration,
+                        get_workspace_regions, format_minutes, simulate_queues)
+
+# finds the fewest test runners, workspaces x parallel_tests, that test a model list within a target wall-clock.
+# every combination is simulated with scheduling.py the way create_queue.py would assign the models, smallest
+# first, and the workspaces of the first one that meets the target are written as a workspaces.json subset to
+# pass to create_queue.py --workspace_list.
+parser = argparse.ArgumentParser()
+# file containing list of models to test, one per line, or a json list
+parser.add_argument("--model_list_file", type=str, default="../config/modellist.txt")
+# per-model durations in minutes, the results_per_model json logged by test_status_v2.py or {model: minutes}
+parser.add_argument("--durations_file", type=str, default=None)
+# duration in minutes to assume for models without history, defaults to the median of known durations
+parser.add_argument("--default_duration", type=float, default=None)
+# workspaces to choose from, in order of preference
+parser.add_argument("--workspace_list", type=str, default="../config/workspaces.json")
+# target makespan in hours
+parser.add_argument("--target_hours", type=float, default=6)
+# most tests to run in parallel per workspace, a workspace can set its own max_parallel_tests
+parser.add_argument("--max_parallel_tests", type=int, default=8)
+# cores of quota per region, shared by the workspaces of the region. limits the tests of the workspaces of a region
+# to the deployments of their instance_type that fit in it together
+parser.add_argument("--quota_cores", type=int, default=None)
+# scheduling and policy to plan for, see create_queue.py and simulate_queues.py
+parser.add_argument("--scheduling", type=str, default="duration")
+parser.add_argument("--policy", type=str, default="static")
+# json file of {region: minutes} added to every model tested in a workspace of the region, for endpoint provisioning
+parser.add_argument("--provisioning_file", type=str, default=None)
+# minutes to start a runner, check out the repo and install dependencies
+parser.add_argument("--runner_startup", type=float, default=0)
+# workflow_mode - model pays runner_startup for every model, queue once per queue
+parser.add_argument("--workflow_mode", type=str, default="model")
+# workspaces.json subset to write for the plan
+parser.add_argument("--output_file", type=str, default="../config/workspaces-plan.json")
+args = parser.parse_args()
+
+# constants
+# vCPUs of the instance types in workspaces.json, to fit deployments in the quota of a region
+INSTANCE_TYPE_CORES = {
+    "Standard_DS2_v2": 2,
+    "Standard_DS3_v2": 4,
+    "Standard_DS4_v2": 8,
+    "Standard_DS5_v2": 16,
+    "Standard_E4s_v3": 4,
+    "Standard_E8s_v3": 8,
+    "Standard_E16s_v3": 16,
+    "Standard_E32s_v3": 32,
+    "Standard_E64s_v3": 64,
+    "Standard_F16s_v2": 16,
+    "Standard_NC6s_v3": 6,
+    "Standard_NC12s_v3": 12,
+    "Standard_NC24s_v3": 24,
+}
+
+
+# function to get the cores of one deployment of a workspace, None when the quota doesn't limit the workspace
+def get_workspace_cores(workspace):
+    if args.quota_cores is None:
+        return None
+    cores = INSTANCE_TYPE_CORES.get(workspace.get("instance_type"))
+    if cores is None:
+        print (f"::warning:: Unknown cores of instance type {workspace.get('instance_type')}, not limiting it by quota")
+    return cores
+
+# function to get the most tests a workspace can run in parallel, on its own in its region
+def get_max_parallel_tests(workspace, cores):
+    max_parallel_tests = workspace.get("max_parallel_tests", args.max_parallel_tests)
+    if cores is not None:
+        max_parallel_tests = min(max_parallel_tests, args.quota_cores // cores)
+    return max_parallel_tests
+
+# function to get the workspaces that can each run parallel_tests tests, in order
+# workspaces of a region share its quota, a workspace is left out when the deployments of the workspaces before it
+# in the same region leave no room for its own
+def get_eligible_workspaces(workspace_list, parallel_tests, max_parallel_tests, workspace_cores, regions):
+    eligible = []
+    region_cores = {}
+    for workspace in workspace_list:
+        if max_parallel_tests[workspace] < parallel_tests:
+            continue
+        cores = workspace_cores[workspace]
+        if cores is not None:
+            used = region_cores.get(regions[workspace], 0)
+            if used + parallel_tests * cores > args.quota_cores:
+                continue
+            region_cores[regions[workspace]] = used + parallel_tests * cores
+        eligible.append(workspace)
+    return eligible
+
+# function to assign the models to the workspaces the way create_queue.py does
+def assign(models, workspaces, parallel_tests, durations):
+    if args.scheduling == "round_robin":
+        return assign_round_robin(models, workspaces, parallel_tests)
+    elif args.scheduling == "duration":
+        return assign_by_duration(models, workspaces, parallel_tests, durations, args.default_duration)
+    print (f"::error:: Invalid scheduling {args.scheduling}")
+    exit (1)
+
+def main():
+    start = time.time()
+    # queue entries are the workflow names, which are prefixed with MLFlow-
+    models = ["MLFlow-" + model for model in load_model_list_file(args.model_list_file)]
+    durations = load_durations(args.durations_file) if args.durations_file else {}
+    if len(durations) == 0 and args.default_duration is None:
+        print ("::error:: No durations to plan with, pass durations_file or default_duration")
+        exit (1)
+    with open(args.workspace_list) as f:
+        workspace_list = json.load(f)
+    provisioning = {}
+    if args.provisioning_file:
+        with open(args.provisioning_file) as f:
+            provisioning = json.load(f)
+    regions = get_workspace_regions(workspace_list, workspace_list)
+    workspace_cores = {workspace: get_workspace_cores(workspace_list[workspace]) for workspace in workspace_list}
+    max_parallel_tests = {workspace: get_max_parallel_tests(workspace_list[workspace], workspace_cores[workspace]) for workspace in workspace_list}
+    target = args.target_hours * 60
+    print (f"Planning {len(models)} models on up to {len(workspace_list)} workspaces for {format_minutes(target)}, "
+           f"models without history take {get_default_duration(durations, args.default_duration):.1f}m")
+
+    # every workspaces x parallel_tests combination, fewest runners first and then fewest workspaces
+    # the workspaces are the first ones in workspace_list that can run parallel_tests tests within the quota of their region
+    combinations = []
+    for parallel_tests in range(1, max(max_parallel_tests.values(), default=0) + 1):
+        eligible = get_eligible_workspaces(workspace_list, parallel_tests, max_parallel_tests, workspace_cores, regions)
+        for workspace_count in range(1, len(eligible) + 1):
+            combinations.append((workspace_count * parallel_tests, workspace_count, parallel_tests, eligible[:workspace_count]))
+    combinations.sort(key=lambda combination: combination[:3])
+
+    best = None
+    simulated = 0
+    for runners, workspace_count, parallel_tests, workspaces in combinations:
+        result = simulate_queues(assign(models, workspaces, parallel_tests, durations), durations, args.default_duration,
+                                 regions, provisioning, args.policy, args.runner_startup,
+                                 startup_per_model=args.workflow_mode == "model")
+        simulated += 1
+        if best is None or result["makespan"] < best[1]["makespan"]:
+            best = ((workspace_count, parallel_tests, workspaces), result)
+        if result["makespan"] <= target:
+            break
+    print (f"Simulated {simulated} of {len(combinations)} combinations in {time.time() - start:.1f}s")
+    if best is None:
+        print (f"::error:: No workspaces to plan with in {args.workspace_list}")
+        exit (1)
+    (workspace_count, parallel_tests, workspaces), result = best
+    if result["makespan"] > target:
+        print (f"::error:: Target of {format_minutes(target)} can't be met, the fastest plan is {workspace_count} workspaces x {parallel_tests} parallel_tests in {format_minutes(result['makespan'])}")
+        exit (1)
+
+    print ("Workspaces|parallel_tests|Runners|Makespan|Utilization|Idle runner time")
+    print ("----------|--------------|-------|--------|-----------|----------------")
+    print (f"{workspace_count}|{parallel_tests}|{result['runners']}|{format_minutes(result['makespan'])}|{result['utilization'] * 100:.1f}%|{format_minutes(result['idle'])}")
+    with open(args.output_file, "w") as f:
+        json.dump({workspace: workspace_list[workspace] for workspace in workspaces}, f, indent=2)
+    print (f"Wrote {len(workspaces)} workspaces to {args.output_file}, create the queues with:")
+    print (f"python create_queue.py --workspace_list {args.output_file} --parallel_tests {parallel_tests} --scheduling {args.scheduling}")
+
+if __name__ == "__main__":
+    main()
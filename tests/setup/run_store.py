@@ -0,0 +1,239 @@
+import glob
+import gzip
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+# sqlite store of github workflow runs, used by test_status_v2.py to compute the dashboard
+# runs are kept across dashboard builds and indexed by workflow name and creation time, so the latest run and
+# the history of each model are index lookups instead of scans of the full run list.
+# runs of queue workflows are expanded into one run per model step that share the id of the queue run,
+# so a run is keyed by id and name.
+
+# constants
+RUN_STORE_FILE = "../logs/run_store.sqlite"
+RUNS_DIR = "../logs/get_github_workflows"
+# an incremental fetch goes back at most this many hours before the newest completed run to update runs in progress
+INCREMENTAL_LOOKBACK_HOURS = 48
+
+
+# function to get the name of a new runs dump, ../logs/get_github_workflows/runs-DDMMMYYYY-HHMMSS.jsonl.gz
+# every full fetch writes its own dump, so dumps that earlier builds appended to are kept
+def get_new_runs_file(runs_dir=RUNS_DIR):
+    return f"{runs_dir}/runs-{datetime.now().strftime('%d%b%Y-%H%M%S')}.jsonl.gz"
+
+# function to get the most recently written runs dump, None if there is none
+def get_latest_runs_file(runs_dir=RUNS_DIR):
+    runs_files = glob.glob(f"{runs_dir}/*.jsonl.gz")
+    if len(runs_files) == 0:
+        return None
+    return max(runs_files, key=os.path.getmtime)
+
+# function to write runs to a gzip compressed jsonl file, one run per line, returns the number of runs written
+# mode "at" appends, each call then adds a gzip member and readers read the members one after the other
+def write_runs(runs_file, runs, mode="at"):
+    if os.path.dirname(runs_file):
+        os.makedirs(os.path.dirname(runs_file), exist_ok=True)
+    count = 0
+    with gzip.open(runs_file, mode) as f:
+        for run in runs:
+            f.write(json.dumps(run) + "\n")
+            count += 1
+    return count
+
+# generator over the runs of a dump, jsonl.gz dumps are read a line at a time
+# dumps from before jsonl, one json list per file, are still read but loaded whole
+# offset - size of the file before runs were appended to it, to only read the gzip members appended since
+def iter_runs(runs_file, offset=0):
+    if runs_file.endswith(".json"):
+        with open(runs_file) as f:
+            yield from json.load(f)
+        return
+    with open(runs_file, "rb") as raw:
+        raw.seek(offset)
+        with gzip.open(raw, "rt") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+# function to get the duration of a completed run in minutes, None for runs that have not completed
+def get_run_duration(run):
+    if run['status'] != "completed" or not run['created_at'] or not run['updated_at']:
+        return None
+    updated_at = datetime.strptime(run['updated_at'], "%Y-%m-%dT%H:%M:%SZ")
+    created_at = datetime.strptime(run['created_at'], "%Y-%m-%dT%H:%M:%SZ")
+    return (updated_at - created_at).total_seconds() / 60
+
+# function to get the p-th percentile of sorted values with the nearest rank method
+def percentile(sorted_values, p):
+    if len(sorted_values) == 0:
+        return None
+    rank = max(int(-(-p * len(sorted_values) // 100)), 1)
+    return sorted_values[rank - 1]
+
+
+class RunStore:
+    def __init__(self, db_file=RUN_STORE_FILE) -> None:
+        if os.path.dirname(db_file):
+            os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        self.connection = sqlite3.connect(db_file)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                status TEXT,
+                conclusion TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                duration REAL,
+                queue_run TEXT,
+                PRIMARY KEY (id, name)
+            );
+            CREATE INDEX IF NOT EXISTS runs_name_created_at ON runs (name, created_at);
+            CREATE TABLE IF NOT EXISTS phases (
+                id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                phase TEXT NOT NULL,
+                created_at TEXT,
+                duration REAL,
+                PRIMARY KEY (id, name, phase)
+            );
+            CREATE INDEX IF NOT EXISTS phases_name_phase_created_at ON phases (name, phase, created_at);
+        """)
+
+    # function to add or update runs, a run fetched again replaces the stored one
+    # runs can be any iterable, such as iter_runs, and are inserted as they are read
+    def add_runs(self, runs):
+        self.connection.executemany("""
+            INSERT OR REPLACE INTO runs (id, name, status, conclusion, created_at, updated_at, duration, queue_run)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", (
+            (run['id'], run['name'], run['status'], run['conclusion'], run['created_at'], run['updated_at'],
+             get_run_duration(run), run.get('queue_run')) for run in runs))
+        self.connection.commit()
+
+    # function to get the creation time to fetch runs from for an incremental update, None if the store is empty
+    # that is the oldest run that had not completed when it was stored, so its conclusion gets updated, else the newest run.
+    # runs in progress are only looked back to within lookback_hours of the newest completed run, so a run that never
+    # completes doesn't pin every incremental fetch to its creation time. older runs are updated by a full fetch
+    def get_incremental_since(self, lookback_hours=INCREMENTAL_LOOKBACK_HOURS):
+        latest = self.connection.execute("SELECT MAX(created_at) FROM runs WHERE status = 'completed'").fetchone()[0]
+        if latest is None:
+            latest = self.connection.execute("SELECT MAX(created_at) FROM runs").fetchone()[0]
+            if latest is None:
+                return None
+        cutoff = (datetime.strptime(latest, "%Y-%m-%dT%H:%M:%SZ") - timedelta(hours=lookback_hours)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        pending = self.connection.execute(
+            "SELECT MIN(created_at) FROM runs WHERE status != 'completed' AND created_at >= ?", (cutoff,)).fetchone()[0]
+        return pending or self.connection.execute("SELECT MAX(created_at) FROM runs").fetchone()[0]
+
+    # function to check if the model runs of a queue run are stored and all completed, so its jobs need not be fetched again
+    def is_queue_run_expanded(self, run_id):
+        count, pending = self.connection.execute(
+            "SELECT COUNT(*), SUM(status != 'completed') FROM runs WHERE id = ? AND queue_run IS NOT NULL", (run_id,)).fetchone()
+        return count > 0 and pending == 0
+
+    def count_runs(self):
+        return self.connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    # models are loaded into a temporary table, so the queries below join on it instead of testing each run
+    def set_models(self, models):
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS models (name TEXT PRIMARY KEY)")
+        self.connection.execute("DELETE FROM models")
+        self.connection.executemany("INSERT OR IGNORE INTO models (name) VALUES (?)", [(model,) for model in models])
+
+    # function to get the latest run of each model by created_at, {model: run}
+    def get_latest_runs(self, models):
+        self.set_models(models)
+        rows = self.connection.execute("""
+            SELECT name, status, conclusion, created_at, updated_at, duration FROM (
+                SELECT runs.*, ROW_NUMBER() OVER (PARTITION BY runs.name ORDER BY runs.created_at DESC, runs.id DESC) AS row_number
+                FROM runs JOIN models ON runs.name = models.name)
+            WHERE row_number = 1""").fetchall()
+        return {row[0]: {"status": row[1], "conclusion": row[2], "created_at": row[3], "updated_at": row[4], "duration": row[5]}
+                for row in rows}
+
+    # function to get the history of each model, {model: {"runs", "successful_runs", "success_rate", "p50", "p95"}}
+    # success_rate is over completed runs, percentiles are over the durations of completed runs in minutes
+    # completed runs are read in one pass ordered by model and duration, only the durations of one model are held
+    def get_model_history(self, models):
+        self.set_models(models)
+        history = {}
+        def add_model_history(name, runs, successful_runs, durations):
+            history[name] = {"runs": runs, "successful_runs": successful_runs,
+                             "success_rate": round(successful_runs / runs * 100, 2),
+                             "p50": percentile(durations, 50), "p95": percentile(durations, 95)}
+        current, runs, successful_runs, durations = None, 0, 0, []
+        for name, conclusion, duration in self.connection.execute("""
+                SELECT runs.name, runs.conclusion, runs.duration FROM runs JOIN models ON runs.name = models.name
+                WHERE runs.status = 'completed' ORDER BY runs.name, runs.duration"""):
+            if name != current:
+                if current is not None:
+                    add_model_history(current, runs, successful_runs, durations)
+                current, runs, successful_runs, durations = name, 0, 0, []
+            runs += 1
+            successful_runs += conclusion == "success"
+            if duration is not None:
+                durations.append(duration)
+        if current is not None:
+            add_model_history(current, runs, successful_runs, durations)
+        return history
+
+    # function to add the phase durations of runs, rows of (id, name, phase, created_at, duration in minutes)
+    # a phase is a step of the run's job, such as the pip installs or the deploy step
+    def add_phases(self, phases):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO phases (id, name, phase, created_at, duration) VALUES (?, ?, ?, ?, ?)", phases)
+        self.connection.commit()
+
+    # function to get the latest window completed runs of each model that have no phase durations yet, [(id, name, created_at)]
+    # runs expanded from queue workflows are steps themselves and have no phases
+    def get_runs_without_phases(self, models, window):
+        self.set_models(models)
+        return self.connection.execute("""
+            SELECT latest.id, latest.name, latest.created_at FROM (
+                SELECT runs.id, runs.name, runs.created_at, runs.queue_run,
+                ROW_NUMBER() OVER (PARTITION BY runs.name ORDER BY runs.created_at DESC, runs.id DESC) AS row_number
+                FROM runs JOIN models ON runs.name = models.name WHERE runs.status = 'completed') AS latest
+            WHERE latest.row_number <= ? AND latest.queue_run IS NULL
+            AND NOT EXISTS (SELECT 1 FROM phases WHERE phases.id = latest.id AND phases.name = latest.name)""", (window,)).fetchall()
+
+    # function to get the duration of the latest successful run of each model and the baseline of the window
+    # successful runs before it, {model: {"duration", "created_at", "median", "p95", "baseline_runs"}}
+    # failed and cancelled runs often stop early, so they would pull the baseline down and flag the next healthy run
+    # by_phase - the same per phase of the successful runs, keyed by (model, phase)
+    def get_duration_baselines(self, models, window, by_phase=False):
+        self.set_models(models)
+        if by_phase:
+            query = """
+                SELECT name, phase, created_at, duration FROM (
+                    SELECT phases.*, ROW_NUMBER() OVER (PARTITION BY phases.name, phases.phase ORDER BY phases.created_at DESC, phases.id DESC) AS row_number
+                    FROM phases JOIN models ON phases.name = models.name
+                    JOIN runs ON runs.id = phases.id AND runs.name = phases.name
+                    WHERE phases.duration IS NOT NULL AND runs.conclusion = 'success')
+                WHERE row_number <= ? ORDER BY name, phase, row_number"""
+        else:
+            query = """
+                SELECT name, NULL, created_at, duration FROM (
+                    SELECT runs.*, ROW_NUMBER() OVER (PARTITION BY runs.name ORDER BY runs.created_at DESC, runs.id DESC) AS row_number
+                    FROM runs JOIN models ON runs.name = models.name
+                    WHERE runs.duration IS NOT NULL AND runs.conclusion = 'success')
+                WHERE row_number <= ? ORDER BY name, row_number"""
+        baselines = {}
+        def add_baseline(key, rows):
+            baseline = sorted(duration for _, duration in rows[1:])
+            baselines[key] = {"duration": rows[0][1], "created_at": rows[0][0], "median": percentile(baseline, 50),
+                              "p95": percentile(baseline, 95), "baseline_runs": len(baseline)}
+        # rows of a model come latest first, only the rows of one model are held at a time
+        current, rows = None, []
+        for name, phase, created_at, duration in self.connection.execute(query, (window + 1,)):
+            key = (name, phase) if by_phase else name
+            if key != current:
+                if current is not None:
+                    add_baseline(current, rows)
+                current, rows = key, []
+            rows.append((created_at, duration))
+        if current is not None:
+            add_baseline(current, rows)
+        return baselines
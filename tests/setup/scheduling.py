@@ -0,0 +1,168 @@
+import collections
+import glob
+import heapq
+import json
+import statistics
+
+
+# function to load model_list_file
+def load_model_list_file(model_list_file):
+    # if model_list_file is extension is json, load json file
+    if model_list_file.endswith(".json"):
+        with open(model_list_file) as f:
+            return json.load(f)
+    # read all other files as text files, assuming one model per line
+    with open(model_list_file) as f:
+        return f.read().splitlines()
+
+# function to load per-model durations in minutes
+# accepts the results_per_model json dumped by test_status_v2.py ({model: {"duration": .., "last_tested": ..}})
+# or a plain {model: minutes} dictionary
+def load_durations(durations_file):
+    with open(durations_file) as f:
+        data = json.load(f)
+    durations = {}
+    for model in data:
+        value = data[model]
+        if isinstance(value, dict):
+            # only completed runs have a meaningful duration
+            if not value.get("last_tested"):
+                continue
+            value = value.get("duration", 0)
+        if value:
+            durations[model] = float(value)
+    return durations
+
+# queue entries are prefixed with MLFlow- while run names may or may not be, so try both
+def get_model_duration(model, durations, default_duration):
+    for name in (model, "MLFlow-" + model, model.replace("MLFlow-", "", 1)):
+        if name in durations:
+            return durations[name]
+    return default_duration
+
+# models without history are assumed to take the median of the known durations
+def get_default_duration(durations, default_duration=None):
+    if default_duration is not None:
+        return default_duration
+    if len(durations) == 0:
+        return 0
+    return statistics.median(durations.values())
+
+# list of (workspace, thread) queue keys in the same order round robin assignment walks them
+def get_queue_keys(workspace_list, parallel_tests):
+    return [(workspace, thread) for workspace in workspace_list for thread in range(parallel_tests)]
+
+# deal models to queues in a round robin fashion, one model per workspace thread at a time
+def assign_round_robin(models, workspace_list, parallel_tests):
+    queue = {}
+    queue_keys = get_queue_keys(workspace_list, parallel_tests)
+    for i, model in enumerate(models):
+        workspace, thread = queue_keys[i % len(queue_keys)]
+        queue.setdefault(workspace, {}).setdefault(thread, []).append(model)
+    return queue
+
+# longest processing time first: sort models by duration, longest first, and always give the next
+# model to the queue with the least predicted work. keeps the makespan within 4/3 of the optimum
+def assign_by_duration(models, workspace_list, parallel_tests, durations, default_duration=None):
+    queue = {}
+    queue_keys = get_queue_keys(workspace_list, parallel_tests)
+    default_duration = get_default_duration(durations, default_duration)
+    # sorted is stable, so models with equal durations keep their order from the model list
+    ordered = sorted(models, key=lambda m: get_model_duration(m, durations, default_duration), reverse=True)
+    # heap of (predicted minutes, queue index), ties go to the first queue
+    loads = [(0, i) for i in range(len(queue_keys))]
+    for model in ordered:
+        load, i = heapq.heappop(loads)
+        workspace, thread = queue_keys[i]
+        queue.setdefault(workspace, {}).setdefault(thread, []).append(model)
+        heapq.heappush(loads, (load + get_model_duration(model, durations, default_duration), i))
+    # keep workspaces and threads in config order so queue files and logs are stable across runs
+    return {workspace: {thread: queue[workspace][thread] for thread in sorted(queue[workspace])}
+            for workspace in workspace_list if workspace in queue}
+
+# predicted wall-clock in minutes for each queue as {"<workspace>-<thread>": minutes}
+def predict_queue_durations(queue, durations, default_duration=None):
+    default_duration = get_default_duration(durations, default_duration)
+    predicted = {}
+    for workspace in queue:
+        for thread in queue[workspace]:
+            predicted[f"{workspace}-{thread}"] = sum(
+                get_model_duration(model, durations, default_duration) for model in queue[workspace][thread])
+    return predicted
+
+# function to load the queue files create_queue.py wrote for a test set, as {workspace: {thread: [models]}}
+# the same structure assign_round_robin and assign_by_duration return
+def load_queue_files(queue_dir):
+    queue = {}
+    for queue_file in sorted(glob.glob(f"{queue_dir}/*.json")):
+        with open(queue_file) as f:
+            q = json.load(f)
+        thread = int(q["queue_name"][len(q["workspace"]) + 1:])
+        queue.setdefault(q["workspace"], {})[thread] = q["models"]
+    return {workspace: {thread: queue[workspace][thread] for thread in sorted(queue[workspace])} for workspace in queue}
+
+# function to get the region of every workspace, from workspace_list or else the workspace name without test-
+def get_workspace_regions(workspaces, workspace_list):
+    return {workspace: workspace_list.get(workspace, {}).get("region", workspace.replace("test-", "", 1))
+            for workspace in workspaces}
+
+# function to format minutes as hours and minutes, such as 6h 5m
+def format_minutes(minutes):
+    return f"{int(minutes / 60)}h {int(minutes % 60)}m"
+
+# discrete event simulation of the runners testing the queues, one runner per queue, times in minutes
+# a model takes its duration plus the provisioning time of the region of the runner's workspace
+# policy static - a runner only tests the models of its own queue, in order, as model workflows trigger the next model
+# policy pull - a runner whose queue is empty steals the next model of the queue with the most pending models,
+# and tests it in its own workspace, as runners leasing from work_queue.py do
+# runner_startup - minutes to start a runner, check out and install dependencies, paid per model when
+# startup_per_model is set (model workflow mode) and once per runner otherwise (queue workflow mode)
+# returns the makespan, busy and idle time of the runners and utilization, with the same per queue
+def simulate_queues(queue, durations, default_duration=None, regions=None, provisioning=None, policy="static",
+                    runner_startup=0, startup_per_model=True):
+    default_duration = get_default_duration(durations, default_duration)
+    regions = regions or {}
+    provisioning = provisioning or {}
+    runners = [(workspace, thread) for workspace in queue for thread in queue[workspace]]
+    pending = [collections.deque(queue[workspace][thread]) for workspace, thread in runners]
+    busy = [0.0] * len(runners)
+    finished_at = [0.0] * len(runners)
+    models_tested = [0] * len(runners)
+    stolen = 0
+    # heap of (time the runner is free, runner index), ties go to the first runner
+    events = [(0.0, i) for i in range(len(runners))]
+    while events:
+        now, i = heapq.heappop(events)
+        if pending[i]:
+            model = pending[i].popleft()
+        elif policy == "pull":
+            victim = max(range(len(runners)), key=lambda j: (len(pending[j]), -j))
+            if not pending[victim]:
+                finished_at[i] = now
+                continue
+            model = pending[victim].popleft()
+            stolen += 1
+        else:
+            finished_at[i] = now
+            continue
+        workspace = runners[i][0]
+        minutes = get_model_duration(model, durations, default_duration) + provisioning.get(regions.get(workspace, workspace), 0)
+        if startup_per_model or models_tested[i] == 0:
+            minutes += runner_startup
+        busy[i] += minutes
+        models_tested[i] += 1
+        heapq.heappush(events, (now + minutes, i))
+    makespan = max(finished_at, default=0.0)
+    return {
+        "policy": policy,
+        "runners": len(runners),
+        "models": sum(models_tested),
+        "makespan": makespan,
+        "busy": sum(busy),
+        "idle": makespan * len(runners) - sum(busy),
+        "utilization": sum(busy) / (makespan * len(runners)) if makespan > 0 else 0.0,
+        "stolen": stolen,
+        "queues": {f"{workspace}-{thread}": {"models": models_tested[i], "busy": busy[i], "finished_at": finished_at[i],
+                                              "idle": makespan - busy[i]}
+                   for i, (workspace, thread) in enumerate(runners)},
+    }
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import time
+from scheduling import (load_durations, load_queue_files, get_default_duration, assign_round_robin, assign_by_duration,
+                        get_workspace_regions, format_minutes, simulate_queues)
+
+# replays the queue files of a test set offline with historical per-model durations, to compare parallel_tests,
+# workspace counts, scheduling and static against pull based queues without running them in the cloud.
+# with no parallel_tests or workspace_counts the queue files are replayed as they are, otherwise their models
+# are assigned again with scheduling.py for every combination.
+parser = argparse.ArgumentParser()
+parser.add_argument("--queue_dir", type=str, default="../config/queue")
+parser.add_argument("--test_set", type=str, default="huggingface-all")
+# workspaces to add when simulating more workspaces than the queue files use, and the region of each workspace
+parser.add_argument("--workspace_list", type=str, default="../config/workspaces.json")
+# per-model durations in minutes, the results_per_model json logged by test_status_v2.py or {model: minutes}
+parser.add_argument("--durations_file", type=str, default=None)
+# duration in minutes to assume for models without history, defaults to the median of known durations
+parser.add_argument("--default_duration", type=float, default=None)
+# json file of {region: minutes} added to every model tested in a workspace of the region, for endpoint provisioning
+parser.add_argument("--provisioning_file", type=str, default=None)
+# minutes to start a runner, check out the repo and install dependencies
+parser.add_argument("--runner_startup", type=float, default=0)
+# workflow_mode - model pays runner_startup for every model, queue once per queue
+parser.add_argument("--workflow_mode", type=str, default="model")
+# comma separated policies to compare, static and pull
+parser.add_argument("--policy", type=str, default="static,pull")
+# comma separated values of parallel_tests to simulate, models are assigned to queues again for each
+parser.add_argument("--parallel_tests", type=str, default="")
+# comma separated numbers of workspaces to simulate, the workspaces of the queue files come first
+parser.add_argument("--workspace_counts", type=str, default="")
+# comma separated scheduling to assign models with when parallel_tests or workspace_counts is set
+parser.add_argument("--scheduling", type=str, default="round_robin,duration")
+# json file to write every simulated configuration to, with the numbers per queue
+parser.add_argument("--output_file", type=str, default=None)
+args = parser.parse_args()
+
+
+def parse_list(value, convert=str):
+    return [convert(item.strip()) for item in value.split(",") if item.strip()]
+
+# function to get the configurations to simulate, [(name, queue)]
+def get_configurations(queue, workspaces, durations):
+    if not args.parallel_tests and not args.workspace_counts:
+        return [(f"{args.test_set} queue files", queue)]
+    models = [model for workspace in queue for thread in queue[workspace] for model in queue[workspace][thread]]
+    parallel_tests_list = parse_list(args.parallel_tests, int) or [max(len(queue[workspace]) for workspace in queue)]
+    workspace_counts = parse_list(args.workspace_counts, int) or [len(queue)]
+    configurations = []
+    for workspace_count in workspace_counts:
+        if workspace_count > len(workspaces):
+            print (f"::warning:: Only {len(workspaces)} workspaces are known, skipping {workspace_count} workspaces")
+            continue
+        for parallel_tests in parallel_tests_list:
+            for scheduling in parse_list(args.scheduling):
+                if scheduling == "round_robin":
+                    q = assign_round_robin(models, workspaces[:workspace_count], parallel_tests)
+                elif scheduling == "duration":
+                    q = assign_by_duration(models, workspaces[:workspace_count], parallel_tests, durations, args.default_duration)
+                else:
+                    print (f"::error:: Invalid scheduling {scheduling}")
+                    exit (1)
+                configurations.append((f"{workspace_count} workspaces x {parallel_tests} {scheduling}", q))
+    return configurations
+
+def main():
+    start = time.time()
+    queue = load_queue_files(f"{args.queue_dir}/{args.test_set}")
+    if len(queue) == 0:
+        print (f"::error:: No queue files found in {args.queue_dir}/{args.test_set}")
+        exit (1)
+    durations = load_durations(args.durations_file) if args.durations_file else {}
+    if len(durations) == 0 and args.default_duration is None:
+        print ("::error:: No durations to simulate with, pass durations_file or default_duration")
+        exit (1)
+    print (f"Loaded durations of {len(durations)} models, models without history take {get_default_duration(durations, args.default_duration):.1f}m")
+    workspace_list = {}
+    if os.path.exists(args.workspace_list):
+        with open(args.workspace_list) as f:
+            workspace_list = json.load(f)
+    workspaces = list(queue) + [workspace for workspace in workspace_list if workspace not in queue]
+    regions = get_workspace_regions(workspaces, workspace_list)
+    provisioning = {}
+    if args.provisioning_file:
+        with open(args.provisioning_file) as f:
+            provisioning = json.load(f)
+
+    results = []
+    for name, q in get_configurations(queue, workspaces, durations):
+        for policy in parse_list(args.policy):
+            if policy not in ["static", "pull"]:
+                print (f"::error:: Invalid policy {policy}")
+                exit (1)
+            result = simulate_queues(q, durations, args.default_duration, regions, provisioning, policy,
+                                     args.runner_startup, startup_per_model=args.workflow_mode == "model")
+            result["configuration"] = name
+            results.append(result)
+
+    print ("Configuration|Policy|Runners|Models|Makespan|Utilization|Idle runner time|Stolen models")
+    print ("-------------|------|-------|------|--------|-----------|----------------|-------------")
+    for result in results:
+        print (f"{result['configuration']}|{result['policy']}|{result['runners']}|{result['models']}|{format_minutes(result['makespan'])}|{result['utilization'] * 100:.1f}%|{format_minutes(result['idle'])}|{result['stolen']}")
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(results, f, indent=4)
+        print (f"Wrote {len(results)} simulations to {args.output_file}")
+    print (f"Simulated {len(results)} configurations in {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# measures the import time of the entry point scripts with python -X importtime and fails when one goes over
+# its budget in ../config/startup-budget.json. importing a script runs everything but its __main__ block, so
+# this is the time a script takes before it starts working. each script is imported from its own directory,
+# the same way the workflows run it.
+parser = argparse.ArgumentParser()
+parser.add_argument("--budget_file", type=str, default="../config/startup-budget.json")
+# number of runs per script, the fastest run is compared with the budget to smooth out noise
+parser.add_argument("--runs", type=int, default=3)
+# number of slowest imports to print per script
+parser.add_argument("--top", type=int, default=5)
+args = parser.parse_args()
+
+
+# function to parse the -X importtime output, returns a list of (depth, cumulative microseconds, module)
+# lines look like 'import time:       123 |        456 |   package.module', two spaces of indent per level
+def parse_importtime(output):
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, int(cumulative), name.strip()))
+    return imports
+
+# function to import a script once, returns the cumulative import time of the script module in ms
+# and its direct imports sorted by cumulative time
+def measure_script(script):
+    script_dir = os.path.dirname(os.path.abspath(script))
+    module = os.path.splitext(os.path.basename(script))[0]
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=script_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}")
+    imports = parse_importtime(result.stderr)
+    # children are printed before their parent, so the direct imports of the script are the depth 1 lines
+    # right before the script's own line
+    index = max(i for i in range(len(imports)) if imports[i][0] == 0 and imports[i][2] == module)
+    children = []
+    for depth, cumulative, name in reversed(imports[:index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((cumulative / 1000, name))
+    return imports[index][1] / 1000, sorted(children, reverse=True)
+
+def main():
+    with open(args.budget_file) as f:
+        entry_points = json.load(f)["entry_points"]
+    budget_dir = os.path.dirname(args.budget_file) or "."
+    failed = 0
+    results = []
+    for entry_point in entry_points:
+        # scripts are relative to the budget file
+        script = os.path.normpath(os.path.join(budget_dir, entry_point["script"]))
+        try:
+            runs = [measure_script(script) for _ in range(args.runs)]
+        except Exception as ex:
+            print (f"::error:: Could not import {script}: {ex}")
+            failed = failed + 1
+            results.append((script, None, entry_point["budget_ms"]))
+            continue
+        import_ms, children = min(runs)
+        results.append((script, import_ms, entry_point["budget_ms"]))
+        print (f"{script}: {import_ms:.0f} ms, budget {entry_point['budget_ms']} ms")
+        for child_ms, name in children[:args.top]:
+            print (f"  {child_ms:8.0f} ms  {name}")
+        if import_ms > entry_point["budget_ms"]:
+            print (f"::error:: {script} takes {import_ms:.0f} ms to import, over its budget of {entry_point['budget_ms']} ms")
+            failed = failed + 1
+
+    print ("Script|Import time (ms)|Budget (ms)")
+    print ("------|----------------|-----------")
+    for script, import_ms, budget_ms in results:
+        print (f"{script}|{'failed' if import_ms is None else f'{import_ms:.0f}'}|{budget_ms}")
+    if failed > 0:
+        exit (1)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 import os
 import json
-import requests
-from datetime import datetime
-from util import load_model_list_file, get_model_containers
+import itertools
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from github_api import GITHUB_REPO_API, create_github_session, get_with_rate_limit
+from run_store import RUN_STORE_FILE, RunStore, get_latest_runs_file, get_new_runs_file, write_runs, iter_runs
+from dashboard import WORKFLOW_URL, get_model_status, load_model_tasks, build_status_data, write_dashboard
+from util import get_model_containers
+from scheduling import load_model_list_file
 from azure.ai.ml import MLClient
 from azure.identity import DefaultAzureCredential
 
@@ -11,15 +17,44 @@ import argparse
 parser = argparse.ArgumentParser()
 parser.add_argument("--model_list_file", type=str, default="../logs/get_model_containers/HuggingFace/19May2023-011801.json")
 # parameter to get github workflows from file
-parser.add_argument("--github_workflows_file", type=str, default="../logs/get_github_workflows/18May2023-211807.json")
+# runs are written to and read from a gzip compressed jsonl file, older .json dumps can still be read
+# when not set, a full fetch writes a new runs-DDMMMYYYY-HHMMSS.jsonl.gz in ../logs/get_github_workflows, an incremental
+# fetch appends to the latest one there, and mode_workflow file reads the latest one
+parser.add_argument("--github_workflows_file", type=str, default=None)
 # mode parameter to get workflow status from api or file
 parser.add_argument("--mode_workflow", type=str, default="api")
 # mode_model parameter to get model status from api or file
 parser.add_argument("--mode_model", type=str, default="file")
 # parameter to get markdown file name
 parser.add_argument("--markdown_file", type=str, default="../../dashboard/HuggingFace/README.md")
+# directory to write status.json and the dashboard page index.html to, defaults to the directory of markdown_file
+parser.add_argument("--dashboard_dir", type=str, default=None)
+# model manifest written by build_manifest.py, to show the task of each model on the dashboard
+parser.add_argument("--model_manifest", type=str, default=None)
 # parameter to get registry name
 parser.add_argument("--registry_name", type=str, default="HuggingFace")
+# parameter to expand runs of queue workflows (create_queue.py --workflow_mode queue) into one run per model step
+parser.add_argument("--expand_queue_runs", type=str, default="true")
+# github repository api url, point it at a local stub server for testing
+parser.add_argument("--github_api_url", type=str, default=GITHUB_REPO_API)
+# number of threads used to fetch pages of workflow runs
+parser.add_argument("--workers", type=int, default=8)
+# only fetch runs created since the runs in the run store, and append them to github_workflows_file or the latest dump
+parser.add_argument("--incremental", type=str, default="false")
+# sqlite file the runs are stored in, indexed by workflow name and creation time
+parser.add_argument("--run_store", type=str, default=RUN_STORE_FILE)
+# number of successful runs before the latest successful one that make the duration baseline of a model
+parser.add_argument("--baseline_window", type=int, default=20)
+# the latest run is a regression when it is slower than the p95 of the baseline and regression_factor times its median
+parser.add_argument("--regression_factor", type=float, default=1.5)
+# models with fewer runs in their baseline are not checked for regressions
+parser.add_argument("--min_baseline_runs", type=int, default=5)
+# fetch the duration of every step of the runs, so regressions are also reported per phase, such as pip installs or deploy
+parser.add_argument("--phase_timings", type=str, default="false")
+# json file to write the regressions to, defaults to ../logs/duration_regressions/DDMMMYYYY-HHMMSS.json
+parser.add_argument("--regression_report", type=str, default=None)
+# exit with an error when a regression is found, to gate on it
+parser.add_argument("--fail_on_regression", type=str, default="false")
 args = parser.parse_args()
 
 # constants
@@ -32,87 +67,212 @@ def get_github_token():
     # fetch the github token from `gh auth token` command
     return os.popen("gh auth token").read().rstrip()
 
+github_session = None
+# function to get the github session shared by all api calls of the build, so they share its connection pool and
+# retries. the github token is only read when the first call needs it
+def get_github_session():
+    global github_session
+    if github_session is None:
+        github_session = create_github_session(get_github_token(), pool_maxsize=args.workers)
+    return github_session
 
-def get_github_workflows(token):
-    RUN_API="https://api.github.com/repos/Azure/azureml-oss-models/actions/runs"
-    print (f"Getting github workflows from {RUN_API}")
-    
-    total_pages = None
-    current_page = 1
+
+# function to get one page of workflow runs, returns the json response
+def get_runs_page(session, run_api, page, per_page, created=None):
+    params = { "per_page": per_page, "page": page }
+    if created:
+        params["created"] = created
+    response = get_with_rate_limit(session, run_api, params)
+    if response.status_code != 200:
+        print (f"Error: {response.status_code} {response.text}")
+        exit(1)
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    if remaining is not None and int(remaining) < 100:
+        print (f"::warning:: {remaining} github api calls left until {response.headers.get('X-RateLimit-Reset')}")
+    return response.json()
+
+# generator over the runs of pages 2 to total_pages, fetched on a pool of workers threads
+# at most 2 pages per worker are fetched ahead, and the runs of a page are yielded as soon as it arrives
+def iter_runs_pages(session, run_api, total_pages, per_page, created):
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        pending = set()
+        next_page = 2
+        while pending or next_page <= total_pages:
+            while next_page <= total_pages and len(pending) < args.workers * 2:
+                pending.add(executor.submit(get_runs_page, session, run_api, next_page, per_page, created))
+                next_page += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()['workflow_runs']
+
+# function to get all workflow runs of the repo, returns a generator over the runs fetched, read back from runs_file
+# page 1 returns total_count, the remaining pages are then fetched on a pool of workers threads
+# runs are written to runs_file as compressed jsonl as their pages arrive, so memory does not grow with the number of
+# runs. a full fetch replaces the file, without runs_file it writes a new timestamped dump
+# incremental - only fetch runs created since the runs in run_store, and append them to runs_file, or the latest dump
+# without runs_file. runs that were still in progress when they were stored are fetched again, so their conclusion
+# is updated
+def get_github_workflows(run_store, runs_file):
+    run_api = f"{args.github_api_url}/actions/runs"
+    print (f"Getting github workflows from {run_api}")
+    session = get_github_session()
     per_page = 100
-    runs = []
-    while total_pages is None or current_page <= total_pages:
-        # create a requests session object with 
-        headers = { "Authorization": f"Bearer {token}",
-                    "X-GitHub-Api-Version": "2022-11-28",
-                    "Accept": "application/vnd.github+json"
-        }
-        params = { "per_page": per_page, "page": current_page }
-        response = requests.get(RUN_API, headers=headers, params=params)
-        if response.status_code == 200:
-            json_response = response.json()
-            # append workflow_runs to runs list
-            runs.extend(json_response['workflow_runs'])
-            if current_page == 1:
-            # divide total_count by per_page and round up to get total_pages
-                total_pages = int(json_response['total_count'] / per_page) + 1
-            current_page += 1
-            # print a single dot to show progress
-            print (f"\rRuns fetched: {len(runs)}", end="", flush=True)
-        else:
-            print (f"Error: {response.status_code} {response.text}")
-            exit(1)
-    print (f"\n")
-    # create ../logs/get_github_workflows/ if it does not exist
-    if not os.path.exists("../logs/get_github_workflows"):
-        os.makedirs("../logs/get_github_workflows")
-    # dump runs as json file in ../logs/get_github_workflows folder with filename as DDMMMYYYY-HHMMSS.json
-    with open(f"../logs/get_github_workflows/{datetime.now().strftime('%d%b%Y-%H%M%S')}.json", "w") as f:
-        json.dump(runs, f, indent=4)
-    return runs
+
+    created = None
+    if args.incremental == "true":
+        since = run_store.get_incremental_since()
+        if since is not None:
+            created = f">={since}"
+            print (f"Getting runs created {created}")
+
+    first_page = get_runs_page(session, run_api, 1, per_page, created)
+    total_pages = math.ceil(first_page['total_count'] / per_page)
+    if created and first_page['total_count'] > 1000:
+        print (f"::warning:: github returns at most 1000 runs for a created filter, {first_page['total_count']} runs match. run without incremental to get all runs")
+    if runs_file is None:
+        runs_file = (get_latest_runs_file() if created else None) or get_new_runs_file()
+    # appended runs replace older copies of the same run when the file is read back in order
+    offset = os.path.getsize(runs_file) if created and os.path.exists(runs_file) else 0
+    runs = itertools.chain(first_page['workflow_runs'], iter_runs_pages(session, run_api, total_pages, per_page, created))
+    # runs created while paging shift later pages, so the same run can show up on two pages. the run store keeps one
+    count = write_runs(runs_file, runs, "at" if created else "wt")
+    print (f"Runs fetched: {count} in {total_pages} pages, written to {runs_file}")
+    return iter_runs(runs_file, offset)
     
-# function to calculate test status based on models - total tests, success, failure, not_tested, total test duration
-def calculate_test_status(runs, models):
-# get the latest run for each model
-# for each run, get the status, conclusion and duration as updated_at - created_at
-# calculate total, success, failure, not_tested, total test duration
-    results_per_model = {}
-    min_time = max_time = runs[0]['updated_at']
+# convert github step timestamps such as 2023-05-18T21:18:07.000-07:00 to the run timestamp format
+def to_run_timestamp(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+# queue workflows test all models of a queue in one run, with one step per model named after the model workflow
+# fetch the jobs of those runs and turn each model step into a run of its own, so results stay per model
+# runs is any iterable, runs are yielded as they are read. the github token is only read once a queue run shows up
+# completed queue runs whose model runs are all completed in run_store were expanded by an earlier build, and are skipped
+def expand_queue_runs(runs, run_store):
+    queue_run_count = 0
+    skipped_count = 0
+    step_run_count = 0
     for run in runs:
-        model = run['name']
-        if model not in models:
+        if not run['name'].startswith("queue-"):
+            yield run
             continue
-        status = run['status']
-        conclusion = run['conclusion']
-        if model not in results_per_model:
-            results_per_model[model] = {"success": 0, "failure": 0, "unknown": 0,"not_tested": 0, "duration": 0, "last_tested": ""}
-            if status == "completed":
-                # if min_time is greater than run['created_at'], set min_time to run['created_at']
-                if min_time > run['created_at']:
-                    min_time = run['created_at']
-                if conclusion == "success":
-                    results_per_model[model]["success"] = 1
-                elif conclusion == "failure":
-                    results_per_model[model]["failure"] = 1
-                else:
-                    results_per_model[model]["unknown"] = 1
-                results_per_model[model]['last_tested'] = run['updated_at']
-                # load updated_at and created_at as datetime objects and assign the difference to duration in minutes
-                updated_at = datetime.strptime(run['updated_at'], "%Y-%m-%dT%H:%M:%SZ")
-                created_at = datetime.strptime(run['created_at'], "%Y-%m-%dT%H:%M:%SZ")
-                results_per_model[model]['duration'] = (updated_at - created_at).total_seconds() / 60
-            else:
-                results_per_model[model]["not_tested"] = 1
-                results_per_model[model]['last_tested'] = None
-    # for models not in results_per_model, set not_tested to 1
+        if run['status'] == "completed" and run_store.is_queue_run_expanded(run['id']):
+            skipped_count += 1
+            continue
+        queue_run_count += 1
+        response = get_with_rate_limit(get_github_session(), run['jobs_url'], {"per_page": 100})
+        if response.status_code != 200:
+            print (f"::warning:: Could not get jobs for run {run['id']}: {response.status_code} {response.text}")
+            continue
+        for job in response.json()['jobs']:
+            for step in job['steps']:
+                if not step['name'].startswith("MLFlow-"):
+                    continue
+                step_run_count += 1
+                yield {
+                    "id": run['id'],
+                    "name": step['name'],
+                    "status": step['status'],
+                    "conclusion": step['conclusion'],
+                    # steps that have not completed keep the creation time of the queue run, so an incremental
+                    # fetch from it gets the queue run again
+                    "created_at": (to_run_timestamp(step['started_at']) if step['status'] == "completed" else None) or run['created_at'],
+                    "updated_at": to_run_timestamp(step['completed_at']) or run['updated_at'],
+                    "queue_run": run['name'],
+                }
+    if queue_run_count > 0 or skipped_count > 0:
+        print (f"Expanded {queue_run_count} queue runs into {step_run_count} model runs, {skipped_count} queue runs were expanded before")
+
+# function to get the duration of every step of the jobs of a run in minutes, [(id, name, phase, created_at, duration)]
+# phases are named <job>/<step>, skipped steps and steps that did not complete are left out
+def get_run_phases(session, run_id, name, created_at):
+    response = get_with_rate_limit(session, f"{args.github_api_url}/actions/runs/{run_id}/jobs", {"per_page": 100})
+    if response.status_code != 200:
+        print (f"::warning:: Could not get jobs for run {run_id}: {response.status_code} {response.text}")
+        return []
+    phases = []
+    for job in response.json()['jobs']:
+        for step in job.get('steps', []):
+            if step['status'] != "completed" or step['conclusion'] == "skipped" or not step['started_at'] or not step['completed_at']:
+                continue
+            duration = (datetime.fromisoformat(step['completed_at'].replace("Z", "+00:00")) - datetime.fromisoformat(step['started_at'].replace("Z", "+00:00"))).total_seconds() / 60
+            phases.append((run_id, name, f"{job['name']}/{step['name']}", created_at, duration))
+    return phases
+
+# function to fetch the phases of the runs in the baseline window of each model that are not in run_store yet
+# the jobs of the runs are fetched on a pool of workers threads, runs fetched once are not fetched again
+def get_phase_timings(run_store, models):
+    runs = run_store.get_runs_without_phases(models, args.baseline_window + 1)
+    if len(runs) == 0:
+        return
+    print (f"Getting phase timings of {len(runs)} runs")
+    session = get_github_session()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for phases in executor.map(lambda run: get_run_phases(session, *run), runs):
+            run_store.add_phases(phases)
+
+# function to find the models, and phases of models, whose latest run is slower than their baseline
+# returns regressions sorted by how many times slower than the baseline median they are, slowest first
+def find_regressions(baselines):
+    regressions = []
+    for key in baselines:
+        baseline = baselines[key]
+        if baseline["baseline_runs"] < args.min_baseline_runs or not baseline["median"]:
+            continue
+        if baseline["duration"] > baseline["p95"] and baseline["duration"] > baseline["median"] * args.regression_factor:
+            model, phase = key if isinstance(key, tuple) else (key, None)
+            regressions.append({"model": model, "phase": phase, "created_at": baseline["created_at"],
+                                "duration": round(baseline["duration"], 2), "median": round(baseline["median"], 2),
+                                "p95": round(baseline["p95"], 2), "baseline_runs": baseline["baseline_runs"],
+                                "ratio": round(baseline["duration"] / baseline["median"], 2)})
+    return sorted(regressions, key=lambda regression: regression["ratio"], reverse=True)
+
+# function to write the regressions as json for other workflows to gate on
+def write_regression_report(regressions, report_file):
+    if os.path.dirname(report_file):
+        os.makedirs(os.path.dirname(report_file), exist_ok=True)
+    with open(report_file, "w") as f:
+        json.dump({
+            "baseline_window": args.baseline_window,
+            "regression_factor": args.regression_factor,
+            "min_baseline_runs": args.min_baseline_runs,
+            "regressions": regressions,
+        }, f, indent=4)
+    print (f"Wrote {len(regressions)} regressions to {report_file}")
+
+# function to calculate test status based on models - total tests, success, failure, not_tested, total test duration
+# the latest run of each model by created_at decides its status, older runs give its success rate and duration percentiles
+def calculate_test_status(run_store, models):
+    latest_runs = run_store.get_latest_runs(models)
+    history = run_store.get_model_history(models)
+    results_per_model = {}
+    min_time = max_time = None
     for model in models:
-        if model not in results_per_model:
-            results_per_model[model] = {"success": 0, "failure": 0, "unknown": 0,"not_tested": 1, "duration": 0, "last_tested": None}
-    # dump results_per_model as json to stdout
-    # load max_time and min_time as datetime objects and assign the difference to clock_time in minutes
-    max_time = datetime.strptime(max_time, "%Y-%m-%dT%H:%M:%SZ")
-    min_time = datetime.strptime(min_time, "%Y-%m-%dT%H:%M:%SZ")
-    clock_time = (max_time - min_time).total_seconds() / 60
+        result = {"success": 0, "failure": 0, "unknown": 0,"not_tested": 0, "duration": 0, "last_tested": None,
+                  "runs": 0, "successful_runs": 0, "success_rate": None, "p50": None, "p95": None}
+        result.update(history.get(model, {}))
+        run = latest_runs.get(model)
+        if run is not None and run['status'] == "completed":
+            if min_time is None or min_time > run['created_at']:
+                min_time = run['created_at']
+            if max_time is None or max_time < run['updated_at']:
+                max_time = run['updated_at']
+            if run['conclusion'] == "success":
+                result["success"] = 1
+            elif run['conclusion'] == "failure":
+                result["failure"] = 1
+            else:
+                result["unknown"] = 1
+            result['last_tested'] = run['updated_at']
+            result['duration'] = run['duration']
+        else:
+            result["not_tested"] = 1
+        results_per_model[model] = result
+    # clock_time in minutes from the first start to the last end of the latest runs
+    clock_time = 0
+    if min_time is not None:
+        clock_time = (datetime.strptime(max_time, "%Y-%m-%dT%H:%M:%SZ") - datetime.strptime(min_time, "%Y-%m-%dT%H:%M:%SZ")).total_seconds() / 60
 
     return results_per_model, clock_time
 
@@ -129,7 +289,7 @@ def summarize_test_status(results_per_model):
             status["total_duration"] += results_per_model[model]["duration"]
     return status
 
-def create_badge(results_per_model, status, clock_time):
+def create_badge(results_per_model, status, clock_time, regressions):
     lines=[]
     # generate test_duration_srt as hours and minutes from total_duration
     test_duration_str = f"{int(status['total_duration'] / 60)}h {int(status['total_duration'] % 60)}m"
@@ -144,13 +304,32 @@ def create_badge(results_per_model, status, clock_time):
     lines.append(f"{round(status['total'] / status['total'] * 100, 2)}%|{round(status['success'] / status['total'] * 100, 2)}%|{round(status['failure'] / status['total'] * 100, 2)}%|{round(status['unknown'] / status['total'] * 100, 2)}%|{round(status['not_tested'] / status['total'] * 100, 2)}%||\n")
     
     lines.append("### Models\n")
-    
-    lines.append("|Model|Status|")
-    lines.append("|-----|-----|")
-    for model in results_per_model:
-        # print model to stdout if label is Failure or Unknown or Not Tested         
-        lines.append(f"{model}|[![{model}](https://github.com/Azure/azureml-oss-models/actions/workflows/{model}.yml/badge.svg)](https://github.com/Azure/azureml-oss-models/actions/workflows/{model}.yml)")
+    # the status of every model is in status.json, browse it on the dashboard page instead of one badge per model
+    lines.append(f"Status, task and history of all {status['total']} models: [dashboard](index.html) ([status.json](status.json))\n")
+
+    failed_models = [model for model in results_per_model if get_model_status(results_per_model[model]) in ["failure", "unknown"]]
+    lines.append("### Failed models\n")
+    lines.append("|Model|Status|Last tested|Success rate|p50 duration|p95 duration|")
+    lines.append("|-----|-----|-----|-----|-----|-----|")
+    for model in failed_models:
+        result = results_per_model[model]
+        success_rate = f"{result['success_rate']}% of {result['runs']}" if result['success_rate'] is not None else ""
+        p50 = f"{result['p50']:.0f}m" if result['p50'] is not None else ""
+        p95 = f"{result['p95']:.0f}m" if result['p95'] is not None else ""
+        lines.append(f"[{model}]({WORKFLOW_URL}/{model}.yml)|{get_model_status(result)}|{result['last_tested']}|{success_rate}|{p50}|{p95}")
 
+    # latest runs slower than the baseline of the runs before them, whole runs and phases, slowest first
+    lines.append("\n### Slowest regressions\n")
+    lines.append(f"Latest successful run slower than the p95 and {args.regression_factor}x the median of the {args.baseline_window} successful runs before it\n")
+    lines.append("|Model|Phase|Run started|Duration|Baseline median|Baseline p95|Slowdown|")
+    lines.append("|-----|-----|-----|-----|-----|-----|-----|")
+    for regression in regressions[:50]:
+        lines.append(f"[{regression['model']}]({WORKFLOW_URL}/{regression['model']}.yml)|{regression['phase'] or 'run'}|{regression['created_at']}|{regression['duration']:.1f}m|{regression['median']:.1f}m|{regression['p95']:.1f}m|{regression['ratio']}x")
+
+    # status.json and index.html go next to the markdown file
+    dashboard_dir = args.dashboard_dir or os.path.dirname(args.markdown_file)
+    summary = dict(status, total_duration=test_duration_str, clock_time=clock_time_str)
+    write_dashboard(dashboard_dir, build_status_data(results_per_model, summary, load_model_tasks(args.model_manifest), regressions), f"{args.registry_name} models")
 
     # write to markdown file
     # count number of lines in markdown file
@@ -164,17 +343,25 @@ def create_badge(results_per_model, status, clock_time):
             
 
 def main():
+    # runs are kept in the run store across builds, so the history of a model includes runs from earlier fetches
+    run_store = RunStore(args.run_store)
     # if mode_workflow is api, get github workflows using github rest api
     if args.mode_workflow == "api":
-        runs = get_github_workflows(get_github_token())
+        runs = get_github_workflows(run_store, args.github_workflows_file)
     elif args.mode_workflow == "file":
-    # else, load github workflows from file
-        with open(args.github_workflows_file) as f:
-            runs = json.load(f)
+    # else, stream github workflows from file
+        runs_file = args.github_workflows_file or get_latest_runs_file()
+        if runs_file is None or not os.path.exists(runs_file):
+            print (f"::error:: No github workflows file {runs_file or 'in ../logs/get_github_workflows'}, run with --mode_workflow api first or set --github_workflows_file")
+            exit(1)
+        print (f"Reading github workflows from {runs_file}")
+        runs = iter_runs(runs_file)
     else:
         print (f"Error: Invalid mode_workflow {args.mode_workflow}")
         exit(1)
-    print (f"Total runs: {len(runs)}")
+    if args.expand_queue_runs == "true":
+        runs = expand_queue_runs(runs, run_store)
+    run_store.add_runs(runs)
     # if mode_model is api, get model containers using azure ml sdk
     if args.mode_model == "api":
         models = get_model_containers(args.registry_name, templates)
@@ -182,12 +369,30 @@ def main():
     # else, load model containers from file
         models = load_model_list_file(args.model_list_file)
     print (f"Total models: {len(models)}")
-    results_per_model, clock_time = calculate_test_status(runs, models)
+    print (f"Total runs in run store: {run_store.count_runs()}")
+    if args.phase_timings == "true":
+        get_phase_timings(run_store, models)
+    results_per_model, clock_time = calculate_test_status(run_store, models)
     print (f"Total results: {len(results_per_model)}")
+    # dump results_per_model in ../logs/calculate_test_status folder with filename as DDMMMYYYY-HHMMSS.json
+    # create_queue.py --durations_file uses the per-model durations to balance queues
+    if not os.path.exists("../logs/calculate_test_status"):
+        os.makedirs("../logs/calculate_test_status")
+    with open(f"../logs/calculate_test_status/{datetime.now().strftime('%d%b%Y-%H%M%S')}.json", "w") as f:
+        json.dump(results_per_model, f, indent=4)
     # print
     status = summarize_test_status(results_per_model)
+    baselines = run_store.get_duration_baselines(models, args.baseline_window)
+    if args.phase_timings == "true":
+        baselines.update(run_store.get_duration_baselines(models, args.baseline_window, by_phase=True))
+    regressions = find_regressions(baselines)
+    write_regression_report(regressions, args.regression_report or f"../logs/duration_regressions/{datetime.now().strftime('%d%b%Y-%H%M%S')}.json")
     # dump status to STDOUT
-    create_badge(results_per_model, status, clock_time)
+    create_badge(results_per_model, status, clock_time, regressions)
+    if args.fail_on_regression == "true" and len(regressions) > 0:
+        for regression in regressions:
+            print (f"::error:: {regression['model']} {regression['phase'] or 'run'} took {regression['duration']:.1f}m, {regression['ratio']}x its baseline median of {regression['median']:.1f}m")
+        exit(1)
 
 
 if __name__ == "__main__":
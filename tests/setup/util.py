@@ -1,66 +1,151 @@
 
 import json
 from azure.ai.ml import MLClient
-from azure.identity import DefaultAzureCredential
 import time, sys, os
+import threading
+import glob
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+# registry_cache.py is shared with the scripts in tests/src
+sys.path.append("../src")
+from registry_cache import RegistryCache
+from credential_cache import get_credential
 
 
-# function to load model_list_file
-def load_model_list_file(model_list_file):
-    # if model_list_file is extension is json, load json file
-    if model_list_file.endswith(".json"):
-        with open(model_list_file) as f:
-            return json.load(f)
-    # read all other files as text files, assuming one model per line
-    with open(model_list_file) as f:
-        return f.read().splitlines()
+# function to call fn, retrying failed calls with exponential backoff
+def call_with_retry(fn, retries=5, backoff_factor=1):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as ex:
+            if attempt == retries:
+                raise
+            delay = backoff_factor * 2 ** attempt
+            print (f"::warning:: {ex}, retrying in {delay}s")
+            time.sleep(delay)
+
+# function to list all versions of a model container, returns the number of versions and the last version listed
+# versions are read from the on-disk registry cache when they were listed recently
+def get_model_versions(registry_ml_client, model_name, registry_cache, registry_name):
+    model_versions = call_with_retry(lambda: registry_cache.list_versions(registry_ml_client, registry_name, model_name))
+    latest_model = model_versions[-1] if len(model_versions) > 0 else None
+    return len(model_versions), latest_model
+
+# function to load the most recent versions snapshot of a registry, {} if there is none
+# the snapshot has the latest version and version count of every container seen by the last get_model_containers call
+def load_latest_versions_snapshot(registry_name):
+    snapshots = glob.glob(f"../logs/get_model_containers/{registry_name}/versions/*.json")
+    if len(snapshots) == 0:
+        return {}, None
+    snapshot_file = max(snapshots, key=os.path.getmtime)
+    with open(snapshot_file) as f:
+        return json.load(f), snapshot_file
+
+# function to load the most recent changelog of a registry, None if there is none
+def load_latest_changelog(registry_name):
+    changelogs = glob.glob(f"../logs/get_model_containers/{registry_name}/changelog/*.json")
+    if len(changelogs) == 0:
+        return None
+    with open(max(changelogs, key=os.path.getmtime)) as f:
+        return json.load(f)
+
+# function to compare two versions snapshots, returns the added, removed and changed models
+def diff_versions_snapshots(previous, current, previous_file=None):
+    previous_models = {name for name in previous if previous[name]["version_count"] > 0}
+    current_models = {name for name in current if current[name]["version_count"] > 0}
+    changed = [
+        {"name": name, "from": previous[name]["latest_version"], "to": current[name]["latest_version"]}
+        for name in sorted(previous_models & current_models)
+        if previous[name]["latest_version"] != current[name]["latest_version"]]
+    return {
+        "previous_snapshot": previous_file,
+        "added": sorted(current_models - previous_models),
+        "removed": sorted(previous_models - current_models),
+        "changed": changed,
+        "unchanged": len(previous_models & current_models) - len(changed),
+    }
 
 # function to query models from registry
-def get_model_containers(registry_name, templates):
+# versions of each container are listed on a pool of max_workers threads, results keep the registry order
+# pass registry_ml_client to use an existing client, for example a fake one in tests
+# sync - full lists the versions of every container, delta only lists containers whose latest version differs
+# from the most recent snapshot and reuses the snapshot for the others. both write a changelog of added, removed
+# and changed models against the previous snapshot to ../logs/get_model_containers/{registry_name}/changelog
+def get_model_containers(registry_name, templates, max_workers=8, registry_ml_client=None, registry_cache=None, sync="full"):
     counter=0
     print (f"Getting models from registry {registry_name}")
     models=[]
     model_details={}
 
-    try:
-        credential = DefaultAzureCredential()
-        credential.get_token("https://management.azure.com/.default")
-    except Exception as ex:
-        print ("::error Auth failed, DefaultAzureCredential not working: \n{e}")
+    if registry_ml_client is None:
+        try:
+            credential = get_credential()
+        except Exception as ex:
+            print ("::error Auth failed, DefaultAzureCredential not working: \n{e}")
+            exit (1)
+        registry_ml_client = MLClient(credential, registry_name=registry_name)
+    if registry_cache is None:
+        registry_cache = RegistryCache()
+    model_containers=call_with_retry(lambda: list(registry_ml_client.models.list()))
+    # if model_container.name is in templates, skip
+    model_containers=[model_container for model_container in model_containers if model_container.name not in templates]
+    previous, previous_file = load_latest_versions_snapshot(registry_name)
+    # latest version as reported by the container listing, None if the client doesn't report it
+    container_versions={model_container.name: getattr(model_container, "latest_version", None) for model_container in model_containers}
+    snapshot={}
+    if sync == "delta":
+        for name in container_versions:
+            if container_versions[name] is not None and name in previous and previous[name].get("container_latest_version") == str(container_versions[name]):
+                snapshot[name] = previous[name]
+        print (f"Reusing {len(snapshot)} unchanged containers from {previous_file}")
+    elif sync != "full":
+        print (f"::error Invalid sync {sync}")
         exit (1)
-    registry_ml_client = MLClient(credential, registry_name=registry_name)
-    model_containers=registry_ml_client.models.list()
-    
-    for model_container in model_containers:
-        # if model_container.name is in templates, skip
-        if model_container.name in templates:
-            continue
+    container_names=[name for name in container_versions if name not in snapshot]
+    print (f"Found {len(model_containers)} model containers, getting versions of {len(container_names)} with {max_workers} workers")
 
+    progress_lock = threading.Lock()
+    def get_versions(model_name):
+        nonlocal counter
+        # the container changed since the last snapshot, so cached versions are stale
+        if sync == "delta" and container_versions[model_name] is not None:
+            registry_cache.invalidate(registry_name, model_name)
         # bug - registry_ml_client.models.list() is not supposed to return archived models
         # workaround to check if model is archived - get all versions and check if count is 0 
-        model_versions=registry_ml_client.models.list(name=model_container.name)
-        model_version_count=0
-        # can't just check len(model_versions) because it is a iterator
-        latest_model=None
-        for model in model_versions:
-            model_version_count = model_version_count + 1
-            latest_model=model
-        if model_version_count == 0:
-            continue
-        models.append(model_container.name)
-        model_details[model_container.name] = latest_model
+        result = get_model_versions(registry_ml_client, model_name, registry_cache, registry_name)
         # print progress
-        counter=counter+1
-        sys.stdout.write(f'{counter}\r')
-        sys.stdout.flush()
-    print (f"\nFound {counter} models in registry")
+        with progress_lock:
+            counter=counter+1
+            sys.stdout.write(f'{counter}/{len(container_names)}\r')
+            sys.stdout.flush()
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # map returns results in container order
+        for model_name, (model_version_count, latest_model) in zip(container_names, executor.map(get_versions, container_names)):
+            model_details[model_name] = latest_model
+            container_version = container_versions[model_name]
+            snapshot[model_name] = {
+                "latest_version": str(container_version if container_version is not None else latest_model.version) if model_version_count > 0 else None,
+                "container_latest_version": str(container_version) if container_version is not None else None,
+                "version_count": model_version_count,
+            }
+    # keep the registry order
+    models = [name for name in container_versions if snapshot[name]["version_count"] > 0]
+    print (f"\nFound {len(models)} models in registry")
 
     # dump models to ../logs/get_model_containers/{registry_name} with filename as DDMMMYYYY-HHMMSS.json
     if not os.path.exists(f"../logs/get_model_containers/{registry_name}"):
         os.makedirs(f"../logs/get_model_containers/{registry_name}")
-    with open(f"../logs/get_model_containers/{registry_name}/{datetime.now().strftime('%d%b%Y-%H%M%S')}.json", "w") as f:
+    timestamp = datetime.now().strftime('%d%b%Y-%H%M%S')
+    with open(f"../logs/get_model_containers/{registry_name}/{timestamp}.json", "w") as f:
         json.dump(models, f, indent=4)
+    # versions snapshot for the next delta sync, and the changelog against the previous snapshot
+    changelog = diff_versions_snapshots(previous, snapshot, previous_file)
+    for folder, content in [("versions", snapshot), ("changelog", changelog)]:
+        os.makedirs(f"../logs/get_model_containers/{registry_name}/{folder}", exist_ok=True)
+        with open(f"../logs/get_model_containers/{registry_name}/{folder}/{timestamp}.json", "w") as f:
+            json.dump(content, f, indent=4)
+    print (f"Changes since last snapshot: {len(changelog['added'])} added, {len(changelog['removed'])} removed, {len(changelog['changed'])} changed, {changelog['unchanged']} unchanged")
 
     return models
-
@@ -0,0 +1,51 @@
+import json
+import re
+
+# values made of these characters are safe as plain yaml scalars, everything else gets quoted
+PLAIN_SCALAR = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.\-/]*")
+
+
+# function to load the workflow template once, so it can be rendered in memory for each model
+def load_workflow_template(workflow_template):
+    with open(workflow_template) as f:
+        return f.read()
+
+# function to format a value as a yaml scalar
+# plain values are written as is to keep generated files unchanged, anything else is written as a
+# double quoted scalar, json escaping is valid yaml so names with ':' or '#' can't break the file
+def yaml_scalar(value):
+    value = str(value)
+    if PLAIN_SCALAR.fullmatch(value):
+        return value
+    return json.dumps(value)
+
+# function to render the template with values, a dictionary of key to value
+# replaces the value of every 'key: ...' line in the template, same as the sed commands used to do
+# all keys are matched in one pass over the template, the pattern is the same for every model and cached by re
+def render_workflow(template, values):
+    if not values:
+        return template
+    scalars = {key: yaml_scalar(values[key]) for key in values}
+    pattern = rf"^(\s*)({'|'.join(re.escape(key) for key in values)}): .*$"
+    return re.sub(pattern, lambda m: f"{m.group(1)}{m.group(2)}: {scalars[m.group(2)]}", template, flags=re.MULTILINE)
+
+# function to render one deploy step per model for a queue workflow, models is a list of (step name, test_model_name)
+# the steps replace the '# <test_model_steps>' line of the template. each step runs even if the previous model failed,
+# and github records a conclusion and timings per step, which test_status_v2.py reads back as per-model results
+def render_model_steps(template, models, run, working_directory):
+    lines = []
+    for step_name, test_model_name in models:
+        lines.append(f"    - name: {yaml_scalar(step_name)}")
+        lines.append("      if: ${{ success() || failure() }}")
+        lines.append("      env:")
+        lines.append(f"        test_model_name: {yaml_scalar(test_model_name)}")
+        lines.append(f"      run: {run}")
+        lines.append(f"      working-directory: {working_directory}")
+    steps = "\n".join(lines)
+    return re.sub(r"^\s*# <test_model_steps>$", lambda m: steps, template, flags=re.MULTILINE)
+
+# function to write all rendered files, a dictionary of file name to content
+def write_workflow_files(workflow_files):
+    for workflow_file in workflow_files:
+        with open(workflow_file, 'w') as f:
+            f.write(workflow_files[workflow_file])
@@ -3,7 +3,6 @@ import transformers
 from urllib.request import urlopen
 from azure.ai.ml import MLClient, UserIdentityConfiguration
 from azure.identity import (
-    DefaultAzureCredential,
     InteractiveBrowserCredential,
 )
 from azure.ai.ml.dsl import pipeline
@@ -12,10 +11,10 @@ import re
 import pandas as pd
 import os
 import shutil
+from credential_cache import get_credential
 
 try:
-	credential = DefaultAzureCredential()
-	credential.get_token("https://management.azure.com/.default")
+	credential = get_credential()
 except Exception as ex:
 	# Fall back to InteractiveBrowserCredential in case DefaultAzureCredential not work
 	credential = InteractiveBrowserCredential()
@@ -33,7 +32,7 @@ ml_client_registry = MLClient(credential, registry_name=queue.registry)
 import_model = ml_client_registry.components.get(name="import_model_oss_test", label="latest")
 test_model_name = os.environ.get('test_model_name')
 # test_model_name = "bert-base-uncased"
-experiment_name = f"Import Model Pipeline"
+experiment_name = "Import Model Pipeline"
 URL = "https://huggingface.co/api/models?sort=downloads&direction=-1&limit=10000"
 COLUMNS_TO_READ = ["modelId", "pipeline_tag", "tags"]
 LIST_OF_COLUMNS = ['modelId', 'downloads',
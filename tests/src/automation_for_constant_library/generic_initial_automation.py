@@ -1,14 +1,20 @@
-from azureml.core import Workspace, Environment
-from model_inference_and_deployment import ModelInferenceAndDeployemnt
-from azure.identity import DefaultAzureCredential, InteractiveBrowserCredential
+from azure.identity import InteractiveBrowserCredential
 from azure.ai.ml.entities import AmlCompute
 from azure.ai.ml import command
 from azure.ai.ml import MLClient
-import mlflow
 import json
 import os
 import sys
+import atexit
 from box import ConfigBox
+# work_queue.py is shared with the scripts in tests/src
+sys.path.append("..")
+from work_queue import open_work_queue
+from registry_cache import RegistryCache
+from model_manifest import get_model_entry
+from credential_cache import get_credential
+# azureml.core, mlflow and model_inference_and_deployment are only needed once the workspace is reached,
+# so they are imported there to keep the start of the script fast
 
 # constants
 check_override = True
@@ -41,6 +47,17 @@ test_set = os.environ.get('test_set')
 # which means that the first model in the queue is triggered again after the last model is tested
 test_keep_looping = os.environ.get('test_keep_looping')
 
+# optional sqlite work queue file. when set, the next model is leased from the work queue shared by all
+# runners of the test set, instead of taking the next model of the static queue
+test_work_queue = os.environ.get('test_work_queue')
+
+# optional model manifest file written by build_manifest.py, defaults to ../config/model-manifest/<test_set>.json
+test_model_manifest = os.environ.get('test_model_manifest')
+
+# optional endpoint mode, per_model (default) creates and deletes an endpoint for every model,
+# warm keeps one endpoint per queue and only swaps the deployment, see endpoint_lifecycle.py
+test_endpoint_mode = os.environ.get('test_endpoint_mode', 'per_model')
+
 # function to load the workspace details from test queue file
 # even model we need to test belongs to a queue. the queue name is passed as environment variable test_queue
 # the queue file contains the list of models to test with with a specific workspace
@@ -66,24 +83,31 @@ def get_sku_override():
 
 # finds the next model in the queue and sends it to github step output
 # so that the next step in this job can pick it up and trigger the next model using 'gh workflow run' cli command
-def set_next_trigger_model(queue):
+def set_next_trigger_model(queue, work_queue=None):
     print("In set_next_trigger_model...")
+    if work_queue is not None:
+        # lease the next model from the work queue, it may come from another runner's queue
+        next_model = work_queue.lease(queue.queue_name)
+        if next_model is None:
+            print("::warning:: work queue is empty, finishing the queue")
+            next_model = ""
+    else:
 # file the index of test_model_name in models list queue dictionary
-    model_list = list(queue.models)
-    #model_name_without_slash = test_model_name.replace('/', '-')
-    check_mlflow_model = "MLFlow-"+test_model_name
-    index = model_list.index(check_mlflow_model)
-    #index = model_list.index(test_model_name)
-    print(f"index of {test_model_name} in queue: {index}")
+        model_list = list(queue.models)
+        #model_name_without_slash = test_model_name.replace('/', '-')
+        check_mlflow_model = "MLFlow-"+test_model_name
+        index = model_list.index(check_mlflow_model)
+        #index = model_list.index(test_model_name)
+        print(f"index of {test_model_name} in queue: {index}")
 # if index is not the last element in the list, get the next element in the list
-    if index < len(model_list) - 1:
-        next_model = model_list[index + 1]
-    else:
-        if (test_keep_looping == "true"):
-            next_model = queue[0]
+        if index < len(model_list) - 1:
+            next_model = model_list[index + 1]
         else:
-            print("::warning:: finishing the queue")
-            next_model = ""
+            if (test_keep_looping == "true"):
+                next_model = queue[0]
+            else:
+                print("::warning:: finishing the queue")
+                next_model = ""
 # write the next model to github step output
     with open(os.environ['GITHUB_OUTPUT'], 'a') as fh:
         print(f'NEXT_MODEL={next_model}')
@@ -131,12 +155,28 @@ if __name__ == "__main__":
 
     queue = get_test_queue()
 
+    work_queue = None
+    if test_work_queue:
+        work_queue = open_work_queue(test_work_queue)
+        # queue entries are the model workflow names
+        # test in the workspace of the runner that leased the model, the model is marked failed if the run ends
+        # before it is tested
+        work_queue_queue = work_queue.start("MLFlow-"+test_model_name, test_queue)
+        if work_queue_queue is not None:
+            queue = ConfigBox(work_queue_queue)
+        work_queue.complete_on_exit("MLFlow-"+test_model_name)
+
     # sku_override = get_sku_override()
     # if sku_override is None:
     #     check_override = False
 
     if test_trigger_next_model == "true":
-        set_next_trigger_model(queue)
+        if work_queue is not None:
+            # the next model is leased when this run ends, however it ends, so its lease doesn't run out while this
+            # run is still testing
+            atexit.register(set_next_trigger_model, queue, work_queue)
+        else:
+            set_next_trigger_model(queue, work_queue)
     # print values of all above variables
     print (f"test_subscription_id: {queue['subscription']}")
     print (f"test_resource_group: {queue['subscription']}")
@@ -149,8 +189,7 @@ if __name__ == "__main__":
     print (f"test_set: {test_set}")
     print("Here is my test model name : ", test_model_name)
     try:
-        credential = DefaultAzureCredential()
-        credential.get_token("https://management.azure.com/.default")
+        credential = get_credential()
     except Exception as ex:
         # Fall back to InteractiveBrowserCredential in case DefaultAzureCredential not work
         credential = InteractiveBrowserCredential()
@@ -164,6 +203,8 @@ if __name__ == "__main__":
             resource_group_name=queue.resource_group,
             workspace_name=queue.workspace
         )
+    from azureml.core import Workspace
+    import mlflow
     ws = Workspace(
         subscription_id=queue.subscription,
         resource_group=queue.resource_group,
@@ -173,6 +214,11 @@ if __name__ == "__main__":
     compute_target = create_or_get_compute_target(
         workspace_ml_client, queue.compute)
     environment_variables = {"test_model_name": test_model_name}
+    # the task from the model manifest saves the register job a full listing of the hugging face hub
+    manifest_entry = get_model_entry(test_set, test_model_name, test_model_manifest)
+    test_model_task = manifest_entry["task"] if manifest_entry is not None else None
+    if test_model_task:
+        environment_variables["test_model_task"] = test_model_task
     env_list = workspace_ml_client.environments.list(name=queue.environment)
     latest_version = 0
     for env in env_list:
@@ -185,12 +231,21 @@ if __name__ == "__main__":
     command_job = run_azure_ml_job(code="./", command_to_run="python generic_model_download_and_register.py",
                                    environment=latest_env, compute=queue.compute, environment_variables=environment_variables)
     create_and_get_job_studio_url(command_job, workspace_ml_client)
+    # the job registered a new version of the model in the workspace, drop cached versions so it is picked up
+    RegistryCache().invalidate(workspace_ml_client.workspace_name, test_model_name.replace("/", "-"))
 
+    from model_inference_and_deployment import ModelInferenceAndDeployemnt
     InferenceAndDeployment = ModelInferenceAndDeployemnt(
         test_model_name=test_model_name,
         workspace_ml_client=workspace_ml_client,
-        registry=queue.registry
+        registry=queue.registry,
+        endpoint_mode=test_endpoint_mode,
+        # a warm endpoint belongs to the queue of the runner, which tests one model at a time
+        queue_name=f"{test_set}/{queue.queue_name}"
     )
     InferenceAndDeployment.model_infernce_and_deployment(
-        instance_type=queue.instance_type
+        instance_type=queue.instance_type,
+        task=test_model_task
     )
+    if work_queue is not None:
+        work_queue.complete("MLFlow-"+test_model_name)
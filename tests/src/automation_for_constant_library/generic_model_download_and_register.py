@@ -1,21 +1,11 @@
-from transformers import AutoModel, AutoTokenizer, AutoConfig
-import transformers
 #from azureml.core import Workspace
 #from azureml.core import Workspace
 #from azureml.mlflow import get_mlflow_tracking_uri
-from urllib.request import urlopen
 from box import ConfigBox
-from mlflow.models import infer_signature
-from mlflow.transformers import generate_signature_output
-from mlflow.tracking.client import MlflowClient
-from mlflow.store.artifact.models_artifact_repo import ModelsArtifactRepository
-from transformers import pipeline
-from huggingface_hub import HfApi
-import pandas as pd
 import os
-import mlflow
 import re
 import json
+# transformers, mlflow, pandas and huggingface_hub take seconds to import, so they are imported where they are used
 
 
 # import json
@@ -32,6 +22,8 @@ STRING_TO_CHECK = 'transformers'
 FILE_NAME = "task_and_library.json"
 
 test_model_name = os.environ.get('test_model_name')
+# task of the model from the model manifest, when set the hugging face hub is not listed
+test_model_task = os.environ.get('test_model_task')
 
 
 class Model:
@@ -60,6 +52,8 @@ class Model:
         # final_data = re.sub(pattern, '', required_data)
         # return final_data
 
+        from huggingface_hub import HfApi
+        import pandas as pd
         hf_api = HfApi()
         # Get all the1 models in the list
         models = hf_api.list_models(
@@ -160,6 +154,8 @@ class Model:
         #     model_library_name = rare_model_dict.get(self.model_name)
         #model_library_name = model_detail.to_dict()["architectures"][0]
 
+        import transformers
+        from transformers import AutoTokenizer
         # Get the library name from this method from which we will load the model
         model_library_name = self.get_library_to_load_model(task=task)
         print("Library name is this one : ", model_library_name)
@@ -181,6 +177,10 @@ class Model:
             scoring_input (ConfigBox): contains the data
             task (str): task name
         """
+        import transformers
+        import mlflow
+        from mlflow.models import infer_signature
+        from mlflow.transformers import generate_signature_output
         # Load the transformer pipeline with the help of model and task
         model_pipeline = transformers.pipeline(
             task=task, model=model_and_tokenizer["model"], tokenizer=model_and_tokenizer["tokenizer"])
@@ -240,6 +240,7 @@ class Model:
             scoring_input (_type_): _description_
             registered_model_name (_type_): _description_
         """
+        import mlflow
         print("Registered Model : ",
               client.get_registered_model(registered_model_name))
         registered_model_detail = client.get_latest_versions(
@@ -267,12 +268,13 @@ class Model:
 if __name__ == "__main__":
     model = Model(model_name=test_model_name)
     # Get the sample input data
-    task = model.get_task()
+    task = test_model_task or model.get_task()
     # Get the sample input data
     scoring_input = model.get_sample_input_data(task=task)
     print("This is the task associated to the model : ", task)
     # If threr will be model namr with / then replace it
     registered_model_name = test_model_name.replace("/", "-")
+    from mlflow.tracking.client import MlflowClient
     client = MlflowClient()
     model.download_and_register_model(
         task=task, scoring_input=scoring_input, registered_model_name=registered_model_name, client=client)
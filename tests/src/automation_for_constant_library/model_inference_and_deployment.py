@@ -1,9 +1,7 @@
-import time
 import json
 import os
 from azure.ai.ml.constants import AssetTypes
 from azure.ai.ml.entities import (
-    ManagedOnlineEndpoint,
     ManagedOnlineDeployment,
     OnlineRequestSettings,
     ProbeSettings,
@@ -16,13 +14,23 @@ import mlflow
 from box import ConfigBox
 import re
 import sys
+# registry_cache.py is shared with the scripts in tests/src
+sys.path.append("..")
+from registry_cache import RegistryCache
+from endpoint_lifecycle import EndpointLifecycle
+from stage_graph import StageGraph
 
 
 class ModelInferenceAndDeployemnt:
-    def __init__(self, test_model_name, workspace_ml_client, registry) -> None:
+    def __init__(self, test_model_name, workspace_ml_client, registry, endpoint_mode="per_model", queue_name=None) -> None:
         self.test_model_name = test_model_name
         self.workspace_ml_client = workspace_ml_client
         self.registry = registry
+        # per_model creates and deletes an endpoint for every model, warm keeps one endpoint per queue
+        self.endpoint_mode = endpoint_mode
+        self.queue_name = queue_name
+        # on-disk cache of model versions, keyed by workspace name for workspace models
+        self.registry_cache = RegistryCache()
 
     def get_error_messages(self):
         # load ../../config/errors.json into a dictionary
@@ -51,13 +59,12 @@ class ModelInferenceAndDeployemnt:
 
     def get_latest_model_version(self, workspace_ml_client, model_name):
         print("In get_latest_model_version...")
-        version_list = list(workspace_ml_client.models.list(model_name))
+        version_list = self.registry_cache.list_versions(
+            workspace_ml_client, workspace_ml_client.workspace_name, model_name)
         if len(version_list) == 0:
             print("Model not found in registry")
         else:
-            model_version = version_list[0].version
-            foundation_model = workspace_ml_client.models.get(
-                model_name, model_version)
+            foundation_model = version_list[0]
             print(
                 "\n\nUsing model name: {0}, version: {1}, id: {2} for inferencing".format(
                     foundation_model.name, foundation_model.version, foundation_model.id
@@ -94,7 +101,7 @@ class ModelInferenceAndDeployemnt:
             print(f"::error:: Could not invoke endpoint: \n")
             print(f"{e}\n\n check logs:\n\n")
 
-    def create_model_package(self, latest_model, endpoint):
+    def create_model_package(self, latest_model):
         print("In create_model_package...")
         model_configuration = ModelConfiguration(mode="download")
         package_name = f"package-v2-{latest_model.name}"
@@ -108,8 +115,12 @@ class ModelInferenceAndDeployemnt:
             latest_model.version,
             package_config
         )
+        return model_package
+
+    def create_online_endpoint(self, endpoint_lifecycle):
+        print("In create_online_endpoint...")
         try:
-            self.workspace_ml_client.begin_create_or_update(endpoint).result()
+            endpoint = endpoint_lifecycle.acquire_endpoint()
         except Exception as e:
             _, _, exc_tb = sys.exc_info()
             print(f"::error:: Could not create endpoint: \n")
@@ -118,9 +129,9 @@ class ModelInferenceAndDeployemnt:
             print(f"{e}\n\n check logs:\n\n")
             self.prase_logs(str(e))
             exit(1)
-        return model_package
+        return endpoint
 
-    def create_online_deployment(self, latest_model, online_endpoint_name, model_package, instance_type):
+    def create_online_deployment(self, endpoint_lifecycle, endpoint, latest_model, model_package, instance_type):
         print("In create_online_deployment...")
         print("latest_model.name is this : ", latest_model.name)
         # Expression need to be replaced with hyphen
@@ -150,15 +161,14 @@ class ModelInferenceAndDeployemnt:
         print("deployment name is this one : ", deployment_name)
         deployment_config = ManagedOnlineDeployment(
             name=deployment_name,
-            model=latest_model,
-            endpoint_name=online_endpoint_name,
+            model=latest_model.id,
+            endpoint_name=endpoint.name,
             environment=model_package,
             instance_type=instance_type,
             instance_count=1
         )
         try:
-            deployment = self.workspace_ml_client.online_deployments.begin_create_or_update(
-                deployment_config).result()
+            endpoint_lifecycle.deploy(endpoint, deployment_config)
         except Exception as e:
             _, _, exc_tb = sys.exc_info()
             print(f"::error:: Could not create deployment\n")
@@ -167,24 +177,16 @@ class ModelInferenceAndDeployemnt:
             print(f"{e}\n\n check logs:\n\n")
             self.prase_logs(str(e))
             self.get_online_endpoint_logs(
-                deployment_name, online_endpoint_name)
-            self.workspace_ml_client.online_endpoints.begin_delete(
-                name=online_endpoint_name).wait()
+                deployment_name, endpoint.name)
+            endpoint_lifecycle.release(endpoint.name, deployment_name)
             exit(1)
 
         return deployment_name
 
-    def delete_online_endpoint(self, online_endpoint_name):
-        try:
-            print("\n In delete_online_endpoint.....")
-            self.workspace_ml_client.online_endpoints.begin_delete(
-                name=online_endpoint_name).wait()
-        except Exception as e:
-            _, _, exc_tb = sys.exc_info()
-            print(f"The exception occured at this line no : {exc_tb.tb_lineno}" +
-                  " the exception is this one :", e)
-            print(f"::warning:: Could not delete endpoint: : \n{e}")
-            exit(0)
+    # per_model deletes the endpoint, warm resets its traffic and deletes the deployment for the next model
+    def delete_online_endpoint(self, endpoint_lifecycle, online_endpoint_name, deployment_name):
+        print("\n In delete_online_endpoint.....")
+        endpoint_lifecycle.release(online_endpoint_name, deployment_name)
 
     def get_task_specified_input(self, task):
         scoring_file = f"../../config/sample_inputs/{self.registry}/{task}.json"
@@ -214,36 +216,59 @@ class ModelInferenceAndDeployemnt:
         output = loaded_model_pipeline(scoring_input.input_data)
         print("My outupt is this : ", output)
 
-    def model_infernce_and_deployment(self, instance_type):
+    def model_infernce_and_deployment(self, instance_type, task=None):
         model_name = self.test_model_name.replace("/", "-")
-        latest_model = self.get_latest_model_version(
-            self.workspace_ml_client, model_name)
-        task = latest_model.flavors["transformers"]["task"]
-        print("latest_model:", latest_model)
-        print("Task is : ", task)
-        scoring_file, scoring_input = self.get_task_specified_input(task=task)
-        # self.local_inference(task=task, latest_model=latest_model, scoring_input=scoring_input)
-        # endpoint names need to be unique in a region, hence using timestamp to create unique endpoint name
-        timestamp = int(time.time())
-        online_endpoint_name = task + str(timestamp)
-        #online_endpoint_name = "Testing" + str(timestamp)
-        print(f"online_endpoint_name: {online_endpoint_name}")
-        endpoint = ManagedOnlineEndpoint(
-            name=online_endpoint_name,
-            auth_mode="key",
-        )
-        model_package = self.create_model_package(
-            latest_model=latest_model, endpoint=endpoint)
-        deployment_name = self.create_online_deployment(
-            latest_model=latest_model,
-            online_endpoint_name=online_endpoint_name,
+
+        def resolve_model():
+            latest_model = self.get_latest_model_version(
+                self.workspace_ml_client, model_name)
+            # task comes from the model manifest when there is one
+            model_task = task or latest_model.flavors["transformers"]["task"]
+            print("latest_model:", latest_model)
+            print("Task is : ", model_task)
+            scoring_file, scoring_input = self.get_task_specified_input(task=model_task)
+            # self.local_inference(task=model_task, latest_model=latest_model, scoring_input=scoring_input)
+            return latest_model, model_task
+
+        # endpoints of models tested one by one are named after the task, a warm endpoint is shared by all tasks
+        def create_endpoint(model=None):
+            prefix = (task or model[1]) if self.endpoint_mode == "per_model" else "mlflow-ep"
+            self.endpoint_lifecycle = EndpointLifecycle(
+                self.workspace_ml_client, self.endpoint_mode, prefix,
+                self.workspace_ml_client.workspace_name, self.queue_name)
+            endpoint = self.create_online_endpoint(self.endpoint_lifecycle)
+            print(f"online_endpoint_name: {endpoint.name}")
+            return endpoint
+
+        # the endpoint is created while the model is resolved and packaged, unless its name needs the task
+        graph = StageGraph(model_name)
+        graph.add("metadata", resolve_model)
+        graph.add("package", lambda model: self.create_model_package(latest_model=model[0]), ["metadata"])
+        graph.add("endpoint", create_endpoint, ["metadata"] if task is None and self.endpoint_mode == "per_model" else [])
+        graph.add("deployment", lambda model, model_package, endpoint: self.create_online_deployment(
+            endpoint_lifecycle=self.endpoint_lifecycle,
+            endpoint=endpoint,
+            latest_model=model[0],
             model_package=model_package,
             instance_type=instance_type
-        )
+        ), ["metadata", "package", "endpoint"])
         # self.cloud_inference(
         #     scoring_file=scoring_file,
         #     scoring_input=scoring_input,
         #     online_endpoint_name=online_endpoint_name,
         #     deployment_name=deployment_name
         # )
-        self.delete_online_endpoint(online_endpoint_name=online_endpoint_name)
+        graph.add("delete", lambda endpoint, deployment_name: self.delete_online_endpoint(
+            endpoint_lifecycle=self.endpoint_lifecycle,
+            online_endpoint_name=endpoint.name,
+            deployment_name=deployment_name
+        ), ["endpoint", "deployment"])
+        try:
+            graph.run()
+        except BaseException:
+            # a failed deployment releases the endpoint itself
+            if "endpoint" in graph.results and "deployment" not in graph.timings:
+                self.endpoint_lifecycle.release(graph.results["endpoint"].name)
+            raise
+        finally:
+            graph.write_timings()
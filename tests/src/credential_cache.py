@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from azure.core.credentials import AccessToken
+
+# credential that keeps access tokens in a file shared by the scripts and steps of a job
+# every script used to create a DefaultAzureCredential and probe it with get_token, which takes seconds each time.
+# tokens are read from the cache file until REFRESH_MARGIN seconds before they expire, then fetched again from the
+# wrapped credential. the file only holds access tokens, is readable by the owner only and lives in RUNNER_TEMP
+# on github runners, which is cleaned up after the job.
+
+# constants
+TOKEN_CACHE_FILE = os.environ.get(
+    "AZURE_TOKEN_CACHE_FILE", os.path.join(os.environ.get("RUNNER_TEMP", tempfile.gettempdir()), "azure-token-cache.json"))
+REFRESH_MARGIN = 5 * 60
+MANAGEMENT_SCOPE = "https://management.azure.com/.default"
+
+
+# function to get the identity tokens are cached for, "<tenant>/<client or user>", so tokens of another account or
+# service principal that used the same cache file are never returned. service principals set the AZURE_TENANT_ID and
+# AZURE_CLIENT_ID environment variables that DefaultAzureCredential reads, otherwise it uses the default account
+# of the azure cli, which is what azure/login signs in to
+def get_identity():
+    tenant_id = os.environ.get("AZURE_TENANT_ID", "")
+    client_id = os.environ.get("AZURE_CLIENT_ID", "")
+    if tenant_id or client_id:
+        return f"{tenant_id}/{client_id}"
+    profile_file = os.path.join(os.environ.get("AZURE_CONFIG_DIR", os.path.expanduser("~/.azure")), "azureProfile.json")
+    try:
+        # the azure cli writes the profile with a byte order mark
+        with open(profile_file, encoding="utf-8-sig") as f:
+            subscriptions = json.load(f).get("subscriptions", [])
+    except (OSError, ValueError):
+        return ""
+    for subscription in subscriptions:
+        if subscription.get("isDefault"):
+            return f"{subscription.get('tenantId', '')}/{subscription.get('user', {}).get('name', '')}"
+    return ""
+
+
+class CachedTokenCredential:
+    # credential is any object with get_token, for example a fake credential in tests
+    # when None, a DefaultAzureCredential is created the first time a token is not in the cache
+    # identity is part of the cache key, defaults to get_identity()
+    def __init__(self, credential=None, cache_file=TOKEN_CACHE_FILE, refresh_margin=REFRESH_MARGIN, identity=None) -> None:
+        self.credential = credential
+        self.cache_file = cache_file
+        self.refresh_margin = refresh_margin
+        self.identity = get_identity() if identity is None else identity
+        self.lock = threading.Lock()
+
+    def get_credential(self):
+        if self.credential is None:
+            from azure.identity import DefaultAzureCredential
+            self.credential = DefaultAzureCredential()
+        return self.credential
+
+    def load_tokens(self):
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # write to a temporary file and rename it, so other processes never read a partial file
+    def save_tokens(self, tokens):
+        cache_dir = os.path.dirname(self.cache_file) or "."
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_file = tempfile.mkstemp(dir=cache_dir)
+        try:
+            os.chmod(temp_file, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(tokens, f)
+            os.replace(temp_file, self.cache_file)
+        except Exception:
+            os.remove(temp_file)
+            raise
+
+    def get_token(self, *scopes, **kwargs):
+        # tokens for claims challenges or another tenant are not cached
+        if kwargs.get("claims") or kwargs.get("tenant_id"):
+            return self.get_credential().get_token(*scopes, **kwargs)
+        key = f"{self.identity} {' '.join(sorted(scopes))}"
+        with self.lock:
+            tokens = self.load_tokens()
+            cached = tokens.get(key)
+            if cached is not None and cached["expires_on"] - time.time() > self.refresh_margin:
+                return AccessToken(cached["token"], cached["expires_on"])
+            access_token = self.get_credential().get_token(*scopes, **kwargs)
+            # another process may have added tokens for other scopes since they were loaded
+            tokens = self.load_tokens()
+            tokens[key] = {"token": access_token.token, "expires_on": access_token.expires_on}
+            try:
+                self.save_tokens(tokens)
+            except OSError as ex:
+                print (f"::warning:: Could not write token cache {self.cache_file}: {ex}")
+            return access_token
+
+    def close(self):
+        if self.credential is not None and hasattr(self.credential, "close"):
+            self.credential.close()
+
+
+# function to get the credential shared by the scripts, checks that it can get a management token
+# raises the error of the wrapped credential if it can't, same as probing DefaultAzureCredential did
+def get_credential(credential=None, cache_file=TOKEN_CACHE_FILE, identity=None):
+    cached_credential = CachedTokenCredential(credential, cache_file, identity=identity)
+    cached_credential.get_token(MANAGEMENT_SCOPE)
+    return cached_credential
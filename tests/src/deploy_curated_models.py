@@ -2,18 +2,21 @@
 
 from azure.ai.ml import MLClient
 from azure.identity import (
-    DefaultAzureCredential,
     InteractiveBrowserCredential,
     ClientSecretCredential,
 )
-import time, sys
+import sys
 from azure.ai.ml.entities import (
-    ManagedOnlineEndpoint,
     ManagedOnlineDeployment,
     OnlineRequestSettings,
 )
 import json
 import os
+from registry_cache import RegistryCache
+from credential_cache import get_credential
+from sku_index import build_template_index, get_sku_template_name, resolve_instance_type
+from model_manifest import get_model_entry, entry_to_model, get_entry_instance_type
+from endpoint_lifecycle import EndpointLifecycle
 
 # constants
 check_override = True
@@ -26,6 +29,9 @@ def get_error_messages():
     
 error_messages = get_error_messages()
 
+# on-disk cache of registry model versions, shared with the other scripts
+registry_cache = RegistryCache()
+
 # model to test    
 test_model_name = os.environ.get('test_model_name')
 
@@ -45,6 +51,13 @@ test_set = os.environ.get('test_set')
 # which means that the first model in the queue is triggered again after the last model is tested
 test_keep_looping = os.environ.get('test_keep_looping')
 
+# optional model manifest file written by build_manifest.py, defaults to ../config/model-manifest/<test_set>.json
+test_model_manifest = os.environ.get('test_model_manifest')
+
+# optional endpoint mode, per_model (default) creates and deletes an endpoint for every model,
+# warm keeps one endpoint per queue and only swaps the deployment, see endpoint_lifecycle.py
+test_endpoint_mode = os.environ.get('test_endpoint_mode', 'per_model')
+
 # function to load the workspace details from test queue file
 # even model we need to test belongs to a queue. the queue name is passed as environment variable test_queue
 # the queue file contains the list of models to test with with a specific workspace
@@ -87,16 +100,11 @@ def set_next_trigger_model(queue):
         print(f'NEXT_MODEL={next_model}', file=fh)
 
 # we always test the latest version of the model
-def get_latest_model_version(registry_ml_client, model_name):
+def get_latest_model_version(registry_ml_client, model_name, registry_name):
     print ("In get_latest_model_version...")
     # Getting latest model version from registry is not working, so get all versions and find latest
-    model_versions=registry_ml_client.models.list(name=model_name)
-    model_version_count=0
-    # can't just check len(model_versions) because it is a iterator
-    models = []
-    for model in model_versions:
-        model_version_count = model_version_count + 1
-        models.append(model)
+    # versions are read from the on-disk registry cache when they were listed recently
+    models = registry_cache.list_versions(registry_ml_client, registry_name, model_name)
     # Sort models by creation time and find the latest model
     sorted_models = sorted(models, key=lambda x: x.creation_context.created_at, reverse=True)
     latest_model = sorted_models[0]
@@ -104,65 +112,44 @@ def get_latest_model_version(registry_ml_client, model_name):
     print(latest_model)
     return latest_model
 
-def get_instance_type_curated(latest_model, sku_override, registry_ml_client, check_override):
+def get_instance_type_curated(latest_model, sku_override, template_index, check_override, registry_ml_client, registry_name):
     # determine the instance_type from the sku templates available in the model properties
     # 1. get the template name matching the sku_type
-    # 2. look up template-sku.json to find the instance_type
-    model_properties = str(latest_model.properties)
-    # escape double quotes in model_properties
-    model_properties = model_properties.replace('"', '\\"')
-    # replace single quotes with double quotes in model_properties
-    model_properties = model_properties.replace("'", '"')
-    # convert model_properties to dictionary
-    model_properties_dict=json.loads(model_properties)
-    sku_templates = model_properties_dict['skuBasedEngineIds']
-    # split sku_templates by comma into a list
-    sku_templates_list = sku_templates.split(",")
-    # find the sku_template that has sku_type as a substring
-    sku_template = next((s for s in sku_templates_list if test_sku_type in s), None)
-    if sku_template is None:
+    # 2. look up the template in template_index to find the instance_type, no registry calls needed unless the
+    #    template is not in the index
+    template_name = get_sku_template_name(latest_model, test_sku_type)
+    if template_name is None:
         print (f"::error:: Could not find sku_template for {test_sku_type}")
         exit (1)
-    print (f"sku_template: {sku_template}")
-    # split sku_template by / and get the 5th element into a variable called template_name
-    template_name = sku_template.split("/")[5]
     print (f"template_name: {template_name}")
-    template_latest_version=get_latest_model_version(registry_ml_client, template_name)
-
-    #print (template_latest_version.properties) 
-    # split the properties by by the pattern "DefaultInstanceType": " and get 2nd element
-    # then again split by " and get the first element
-    instance_type = str(template_latest_version.properties).split('"DefaultInstanceType": "')[1].split('"')[0]
+    instance_type = resolve_instance_type(latest_model.name, template_name, template_index, sku_override if check_override else None,
+                                          registry_ml_client, registry_name, registry_cache)
     print (f"instance_type: {instance_type}")
 
     if instance_type is None:
         print (f"::error:: Could not find instance_type for {test_sku_type}")
         exit (1)
-
-    if check_override:
-        if latest_model.name in sku_override:
-            instance_type = sku_override[test_model_name]['sku']
-            print (f"overriding instance_type: {instance_type}")
     
     return instance_type
 
 
 
     
-def create_online_endpoint(workspace_ml_client, endpoint):
+def create_online_endpoint(endpoint_lifecycle):
     print ("In create_online_endpoint...")
     try:
-        workspace_ml_client.online_endpoints.begin_create_or_update(endpoint).wait()
+        endpoint = endpoint_lifecycle.acquire_endpoint()
     except Exception as e:
         print (f"::error:: Could not create endpoint: \n")
         print (f"{e}\n\n check logs:\n\n")
         prase_logs(e)
         exit (1)
 
-    print(workspace_ml_client.online_endpoints.get(name=endpoint.name))
+    print(endpoint)
+    return endpoint
 
 
-def create_online_deployment(workspace_ml_client, endpoint, instance_type, latest_model):
+def create_online_deployment(workspace_ml_client, endpoint_lifecycle, endpoint, instance_type, latest_model):
     print ("In create_online_deployment...")
     demo_deployment = ManagedOnlineDeployment(
         name="demo",
@@ -171,24 +158,15 @@ def create_online_deployment(workspace_ml_client, endpoint, instance_type, lates
         instance_type=instance_type,
         instance_count=1,
     )
-    try:
-        workspace_ml_client.online_deployments.begin_create_or_update(demo_deployment).wait()
-    except Exception as e:
-        print (f"::error:: Could not create deployment\n")
-        print (f"{e}\n\n check logs:\n\n")
-        prase_logs(e)
-        get_online_endpoint_logs(workspace_ml_client, endpoint.name)
-        workspace_ml_client.online_endpoints.begin_delete(name=endpoint.name).wait()
-        exit (1)
     # online endpoints can have multiple deployments with traffic split or shadow traffic. Set traffic to 100% for demo deployment
-    endpoint.traffic = {"demo": 100}
     try:
-        workspace_ml_client.begin_create_or_update(endpoint).result()
+        endpoint_lifecycle.deploy(endpoint, demo_deployment)
     except Exception as e:
         print (f"::error:: Could not create deployment\n")
         print (f"{e}\n\n check logs:\n\n")
+        prase_logs(e)
         get_online_endpoint_logs(workspace_ml_client, endpoint.name)
-        workspace_ml_client.online_endpoints.begin_delete(name=endpoint.name).wait()
+        endpoint_lifecycle.release(endpoint.name, demo_deployment.name)
         exit (1)
     print(workspace_ml_client.online_deployments.get(name="demo", endpoint_name=endpoint.name))
 
@@ -254,12 +232,9 @@ def get_online_endpoint_logs(workspace_ml_client, online_endpoint_name):
     prase_logs(logs)
 
 
-def delete_online_endpoint(workspace_ml_client, online_endpoint_name):
-    try:
-        workspace_ml_client.online_endpoints.begin_delete(name=online_endpoint_name).wait()
-    except Exception as e:
-        print (f"::warning:: Could not delete endpoint: : \n{e}")
-        exit (0)    
+# per_model deletes the endpoint, warm resets its traffic and deletes the deployment for the next model
+def delete_online_endpoint(endpoint_lifecycle, online_endpoint_name):
+    endpoint_lifecycle.release(online_endpoint_name, "demo")
 
 
 
@@ -272,9 +247,9 @@ def main():
 
     queue = get_test_queue()
 
+    # check_override is assigned in main, so set it in both cases instead of relying on the module constant
     sku_override = get_sku_override()
-    if sku_override is None:
-        check_override = False
+    check_override = sku_override is not None
 
     if test_trigger_next_model == "true":
         set_next_trigger_model(queue)
@@ -288,11 +263,11 @@ def main():
     print (f"test_registry: queue['registry']")
     print (f"test_trigger_next_model: {test_trigger_next_model}")
     print (f"test_queue: {test_queue}")
+    print (f"test_endpoint_mode: {test_endpoint_mode}")
 
 
     try:
-        credential = DefaultAzureCredential()
-        credential.get_token("https://management.azure.com/.default")
+        credential = get_credential()
     except Exception as ex:
         print ("::error:: Auth failed, DefaultAzureCredential not working: \n{e}")
         exit (1)
@@ -311,23 +286,30 @@ def main():
         registry_name=queue['registry']
     )
 
-    latest_model = get_latest_model_version(registry_ml_client, test_model_name)
-    instance_type = get_instance_type(latest_model, sku_override, registry_ml_client, check_override)
-
-# endpoint names need to be unique in a region, hence using timestamp to create unique endpoint name
-
-    timestamp = int(time.time())
-    online_endpoint_name = "hf-ep-" + str(timestamp)
+    # metadata compiled by build_manifest.py, when the model is in it there are no registry metadata calls
+    instance_type = None
+    manifest_entry = get_model_entry(test_set, test_model_name, test_model_manifest)
+    if manifest_entry is not None:
+        latest_model = entry_to_model(manifest_entry)
+        instance_type = get_entry_instance_type(manifest_entry, test_sku_type, sku_override if check_override else None)
+        print (f"Latest model {latest_model.name} version {latest_model.version} from model manifest, instance_type: {instance_type}")
+        if instance_type is None:
+            print (f"::warning:: No {test_sku_type} instance_type for {test_model_name} in model manifest, using the registry")
+    if instance_type is None:
+        # sku template to instance type index, built once per cache period
+        template_index = build_template_index(registry_ml_client, queue['registry'], registry_cache)
+        latest_model = get_latest_model_version(registry_ml_client, test_model_name, queue['registry'])
+        instance_type = get_instance_type_curated(latest_model, sku_override, template_index, check_override, registry_ml_client, queue['registry'])
+
+    # a warm endpoint belongs to the queue of the runner, which tests one model at a time
+    endpoint_lifecycle = EndpointLifecycle(workspace_ml_client, test_endpoint_mode, "hf-ep", queue['workspace'], f"{test_set}/{queue['queue_name']}")
+    endpoint = create_online_endpoint(endpoint_lifecycle)
+    online_endpoint_name = endpoint.name
     print (f"online_endpoint_name: {online_endpoint_name}")
-    endpoint = ManagedOnlineEndpoint(
-        name=online_endpoint_name,
-        auth_mode="key",
-    )
-    create_online_endpoint(workspace_ml_client, endpoint)
-    create_online_deployment(workspace_ml_client, endpoint, instance_type, latest_model)
+    create_online_deployment(workspace_ml_client, endpoint_lifecycle, endpoint, instance_type, latest_model)
     sample_inference(latest_model,queue['registry'], workspace_ml_client, online_endpoint_name)
     get_online_endpoint_logs(workspace_ml_client, online_endpoint_name)
-    delete_online_endpoint(workspace_ml_client, online_endpoint_name)
+    delete_online_endpoint(endpoint_lifecycle, online_endpoint_name)
     
         
 if __name__ == "__main__":
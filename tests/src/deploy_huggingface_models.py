@@ -2,18 +2,24 @@
 
 from azure.ai.ml import MLClient
 from azure.identity import (
-    DefaultAzureCredential,
     InteractiveBrowserCredential,
     ClientSecretCredential,
 )
-import time, sys
+import sys
 from azure.ai.ml.entities import (
-    ManagedOnlineEndpoint,
     ManagedOnlineDeployment,
     OnlineRequestSettings,
 )
 import json
 import os
+from registry_cache import RegistryCache
+from credential_cache import get_credential
+from sku_index import build_template_index, get_sku_template_name, resolve_instance_type
+from model_manifest import get_model_entry, entry_to_model, get_entry_instance_type
+import atexit
+from work_queue import open_work_queue
+from endpoint_lifecycle import EndpointLifecycle, get_deployment_name, plan_deployment_waves
+from stage_graph import StageGraph
 
 
 
@@ -24,6 +30,9 @@ def get_error_messages():
     
 error_messages = get_error_messages()
 
+# on-disk cache of registry model versions, shared with the other scripts
+registry_cache = RegistryCache()
+
 # model to test    
 test_model_name = os.environ.get('test_model_name')
 
@@ -43,6 +52,21 @@ test_set = os.environ.get('test_set')
 # which means that the first model in the queue is triggered again after the last model is tested
 test_keep_looping = os.environ.get('test_keep_looping')
 
+# optional model manifest file written by build_manifest.py, defaults to ../config/model-manifest/<test_set>.json
+test_model_manifest = os.environ.get('test_model_manifest')
+
+# optional sqlite work queue file. when set, the next model is leased from the work queue shared by all
+# runners of the test set, instead of taking the next model of the static queue
+test_work_queue = os.environ.get('test_work_queue')
+
+# optional endpoint mode, per_model (default) creates and deletes an endpoint for every model,
+# warm keeps one endpoint per queue and only swaps the deployment, see endpoint_lifecycle.py
+test_endpoint_mode = os.environ.get('test_endpoint_mode', 'per_model')
+
+# optional number of models of the queue to test in one run, each as its own deployment on the same endpoint
+# deployed at the same time, in waves that fit the core quota of the workspace. defaults to 1, one model per run
+test_batch_size = int(os.environ.get('test_batch_size', '1'))
+
 # function to load the workspace details from test queue file
 # even model we need to test belongs to a queue. the queue name is passed as environment variable test_queue
 # the queue file contains the list of models to test with with a specific workspace
@@ -65,36 +89,56 @@ def get_sku_override():
 
 # finds the next model in the queue and sends it to github step output 
 # so that the next step in this job can pick it up and trigger the next model using 'gh workflow run' cli command
-def set_next_trigger_model(queue):
+# last_model - the last model tested by this run when it tests a batch of models, defaults to test_model_name
+def set_next_trigger_model(queue, work_queue=None, last_model=None):
     print ("In set_next_trigger_model...")
+    if work_queue is not None:
+        # lease the next model from the work queue, it may come from another runner's queue
+        next_model = work_queue.lease(queue['queue_name'])
+        if next_model is None:
+            print ("::warning:: work queue is empty, finishing the queue")
+            next_model = ""
+    else:
 # file the index of test_model_name in models list queue dictionary
-    index = queue['models'].index(test_model_name)
-    print (f"index of {test_model_name} in queue: {index}")
+        last_model = last_model or test_model_name
+        index = queue['models'].index(last_model)
+        print (f"index of {last_model} in queue: {index}")
 # if index is not the last element in the list, get the next element in the list
-    if index < len(queue['models']) - 1:
-        next_model = queue['models'][index + 1]
-    else:
-        if (test_keep_looping == "true"):
-            next_model = queue[0]
+        if index < len(queue['models']) - 1:
+            next_model = queue['models'][index + 1]
         else:
-            print ("::warning:: finishing the queue")
-            next_model = ""
+            if (test_keep_looping == "true"):
+                next_model = queue[0]
+            else:
+                print ("::warning:: finishing the queue")
+                next_model = ""
 # write the next model to github step output
     with open(os.environ['GITHUB_OUTPUT'], 'a') as fh:
         print(f'NEXT_MODEL={next_model}')
         print(f'NEXT_MODEL={next_model}', file=fh)
 
+# function to get the models after test_model_name to test in the same run, up to count models
+# with a work queue they are leased for the runner's queue, and marked failed if the run ends before they are tested
+def get_batch_models(queue, work_queue, count):
+    if work_queue is not None:
+        models = []
+        for _ in range(count):
+            model = work_queue.lease(queue['queue_name'])
+            if model is None:
+                break
+            work_queue.start(model, queue['queue_name'])
+            work_queue.complete_on_exit(model)
+            models.append(model)
+        return models
+    index = queue['models'].index(test_model_name)
+    return queue['models'][index + 1:index + 1 + count]
+
 # we always test the latest version of the model
-def get_latest_model_version(registry_ml_client, model_name):
+def get_latest_model_version(registry_ml_client, model_name, registry_name):
     print ("In get_latest_model_version...")
     # Getting latest model version from registry is not working, so get all versions and find latest
-    model_versions=registry_ml_client.models.list(name=model_name)
-    model_version_count=0
-    # can't just check len(model_versions) because it is a iterator
-    models = []
-    for model in model_versions:
-        model_version_count = model_version_count + 1
-        models.append(model)
+    # versions are read from the on-disk registry cache when they were listed recently
+    models = registry_cache.list_versions(registry_ml_client, registry_name, model_name)
     # Sort models by creation time and find the latest model
     sorted_models = sorted(models, key=lambda x: x.creation_context.created_at, reverse=True)
     latest_model = sorted_models[0]
@@ -102,65 +146,63 @@ def get_latest_model_version(registry_ml_client, model_name):
     print(latest_model)
     return latest_model
 
-def get_instance_type(latest_model, sku_override, registry_ml_client, check_override):
+def get_instance_type(latest_model, sku_override, template_index, check_override, registry_ml_client, registry_name):
     # determine the instance_type from the sku templates available in the model properties
     # 1. get the template name matching the sku_type
-    # 2. look up template-sku.json to find the instance_type
-    model_properties = str(latest_model.properties)
-    # escape double quotes in model_properties
-    model_properties = model_properties.replace('"', '\\"')
-    # replace single quotes with double quotes in model_properties
-    model_properties = model_properties.replace("'", '"')
-    # convert model_properties to dictionary
-    model_properties_dict=json.loads(model_properties)
-    sku_templates = model_properties_dict['skuBasedEngineIds']
-    # split sku_templates by comma into a list
-    sku_templates_list = sku_templates.split(",")
-    # find the sku_template that has sku_type as a substring
-    sku_template = next((s for s in sku_templates_list if test_sku_type in s), None)
-    if sku_template is None:
+    # 2. look up the template in template_index to find the instance_type, no registry calls needed unless the
+    #    template is not in the index
+    # returns None when there is no instance_type for the model
+    template_name = get_sku_template_name(latest_model, test_sku_type)
+    if template_name is None:
         print (f"::error:: Could not find sku_template for {test_sku_type}")
-        exit (1)
-    print (f"sku_template: {sku_template}")
-    # split sku_template by / and get the 5th element into a variable called template_name
-    template_name = sku_template.split("/")[5]
+        return None
     print (f"template_name: {template_name}")
-    template_latest_version=get_latest_model_version(registry_ml_client, template_name)
-
-    #print (template_latest_version.properties) 
-    # split the properties by by the pattern "DefaultInstanceType": " and get 2nd element
-    # then again split by " and get the first element
-    instance_type = str(template_latest_version.properties).split('"DefaultInstanceType": "')[1].split('"')[0]
+    instance_type = resolve_instance_type(latest_model.name, template_name, template_index, sku_override if check_override else None,
+                                          registry_ml_client, registry_name, registry_cache)
     print (f"instance_type: {instance_type}")
 
     if instance_type is None:
         print (f"::error:: Could not find instance_type for {test_sku_type}")
-        exit (1)
-
-    if check_override:
-        if latest_model.name in sku_override:
-            instance_type = sku_override[test_model_name]['sku']
-            print (f"overriding instance_type: {instance_type}")
+        return None
     
     return instance_type
 
+# function to get the latest version of a model and its instance_type, returns (latest_model, instance_type)
+# metadata compiled by build_manifest.py, when the model is in it there are no registry metadata calls
+def get_model_and_instance_type(model_name, registry_ml_client, queue, sku_override, check_override):
+    instance_type = None
+    manifest_entry = get_model_entry(test_set, model_name, test_model_manifest)
+    if manifest_entry is not None:
+        latest_model = entry_to_model(manifest_entry)
+        instance_type = get_entry_instance_type(manifest_entry, test_sku_type, sku_override if check_override else None)
+        print (f"Latest model {latest_model.name} version {latest_model.version} from model manifest, instance_type: {instance_type}")
+        if instance_type is None:
+            print (f"::warning:: No {test_sku_type} instance_type for {model_name} in model manifest, using the registry")
+    if instance_type is None:
+        # sku template to instance type index, built once per cache period
+        template_index = build_template_index(registry_ml_client, queue['registry'], registry_cache)
+        latest_model = get_latest_model_version(registry_ml_client, model_name, queue['registry'])
+        instance_type = get_instance_type(latest_model, sku_override, template_index, check_override, registry_ml_client, queue['registry'])
+    return latest_model, instance_type
+
 
 
     
-def create_online_endpoint(workspace_ml_client, endpoint):
+def create_online_endpoint(endpoint_lifecycle):
     print ("In create_online_endpoint...")
     try:
-        workspace_ml_client.online_endpoints.begin_create_or_update(endpoint).wait()
+        endpoint = endpoint_lifecycle.acquire_endpoint()
     except Exception as e:
         print (f"::error:: Could not create endpoint: \n")
         print (f"{e}\n\n check logs:\n\n")
         prase_logs(str(e))
         exit (1)
 
-    print(workspace_ml_client.online_endpoints.get(name=endpoint.name))
+    print(endpoint)
+    return endpoint
 
 
-def create_online_deployment(workspace_ml_client, endpoint, instance_type, latest_model):
+def create_online_deployment(workspace_ml_client, endpoint_lifecycle, endpoint, instance_type, latest_model):
     print ("In create_online_deployment...")
     demo_deployment = ManagedOnlineDeployment(
         name="demo",
@@ -169,29 +211,21 @@ def create_online_deployment(workspace_ml_client, endpoint, instance_type, lates
         instance_type=instance_type,
         instance_count=1,
     )
-    try:
-        workspace_ml_client.online_deployments.begin_create_or_update(demo_deployment).wait()
-    except Exception as e:
-        print (f"::error:: Could not create deployment\n")
-        print (f"{e}\n\n check logs:\n\n")
-        prase_logs(str(e))
-        get_online_endpoint_logs(workspace_ml_client, endpoint.name)
-        workspace_ml_client.online_endpoints.begin_delete(name=endpoint.name).wait()
-        exit (1)
     # online endpoints can have multiple deployments with traffic split or shadow traffic. Set traffic to 100% for demo deployment
-    endpoint.traffic = {"demo": 100}
     try:
-        workspace_ml_client.begin_create_or_update(endpoint).result()
+        endpoint_lifecycle.deploy(endpoint, demo_deployment)
     except Exception as e:
         print (f"::error:: Could not create deployment\n")
         print (f"{e}\n\n check logs:\n\n")
+        prase_logs(str(e))
         get_online_endpoint_logs(workspace_ml_client, endpoint.name)
-        workspace_ml_client.online_endpoints.begin_delete(name=endpoint.name).wait()
+        endpoint_lifecycle.release(endpoint.name, demo_deployment.name)
         exit (1)
     print(workspace_ml_client.online_deployments.get(name="demo", endpoint_name=endpoint.name))
 
 
-def sample_inference(latest_model,registry, workspace_ml_client, online_endpoint_name):
+# returns True when the endpoint answered the sample input
+def sample_inference(latest_model,registry, workspace_ml_client, online_endpoint_name, deployment_name="demo"):
     # get the task tag from the latest_model.tags
     tags = str(latest_model.tags)
     # replace single quotes with double quotes in tags
@@ -213,7 +247,7 @@ def sample_inference(latest_model,registry, workspace_ml_client, online_endpoint
     try:
         response = workspace_ml_client.online_endpoints.invoke(
             endpoint_name=online_endpoint_name,
-            deployment_name="demo",
+            deployment_name=deployment_name,
             request_file=scoring_file,
         )
         response_json = json.loads(response)
@@ -228,10 +262,12 @@ def sample_inference(latest_model,registry, workspace_ml_client, online_endpoint
             print(f'```json', file=fh)
             print(f'{output}', file=fh)
             print(f'```', file=fh)
+        return True
     except Exception as e:
         print (f"::error:: Could not invoke endpoint: \n")
         print (f"{e}\n\n check logs:\n\n")
-        get_online_endpoint_logs(workspace_ml_client, online_endpoint_name)
+        get_online_endpoint_logs(workspace_ml_client, online_endpoint_name, deployment_name)
+        return False
 
 def prase_logs(logs):
 
@@ -245,19 +281,129 @@ def prase_logs(logs):
             if error['parse_string'] in line:
                 print (f"::error:: {error_messages['error_category']}: {line}")
 
-def get_online_endpoint_logs(workspace_ml_client, online_endpoint_name):
+def get_online_endpoint_logs(workspace_ml_client, online_endpoint_name, deployment_name="demo"):
     print("Deployment logs: \n\n")
-    logs=workspace_ml_client.online_deployments.get_logs(name="demo", endpoint_name=online_endpoint_name, lines=100000)
+    logs=workspace_ml_client.online_deployments.get_logs(name=deployment_name, endpoint_name=online_endpoint_name, lines=100000)
     print(logs)
     prase_logs(logs)
 
 
-def delete_online_endpoint(workspace_ml_client, online_endpoint_name):
+# per_model deletes the endpoint, warm resets its traffic and deletes the deployment for the next model
+def delete_online_endpoint(endpoint_lifecycle, online_endpoint_name):
+    endpoint_lifecycle.release(online_endpoint_name, "demo")
+
+# function to test a batch of models on one endpoint, each model is a deployment named after it
+# the metadata of the models is resolved while the endpoint is created. deployments are created at the same time
+# in waves that fit the core quota, invoked by deployment name and deleted before the next wave.
+# returns a result per model, {"model", "deployment", "instance_type", "deployed", "inference"}
+def test_batch(workspace_ml_client, registry_ml_client, endpoint_lifecycle, queue, models, sku_override, check_override):
+    results = [{"model": model, "deployment": None, "instance_type": None, "deployed": False, "inference": False} for model in models]
+    def resolve(result):
+        try:
+            result["latest_model"], result["instance_type"] = get_model_and_instance_type(result["model"], registry_ml_client, queue, sku_override, check_override)
+        except Exception as e:
+            print (f"::error:: Could not get the latest version of {result['model']}: \n{e}")
+        return result
+    # a deployment that could not be created may not exist, so there are no logs to get. sample_inference gets the
+    # logs when it fails, so they are only fetched here after a successful inference
+    def test_deployment(endpoint, result, error):
+        if error is not None:
+            print (f"::error:: Could not create deployment {result['deployment']} for {result['model']}\n")
+            print (f"{error}\n\n check logs:\n\n")
+            prase_logs(str(error))
+            return
+        result["deployed"] = True
+        try:
+            result["inference"] = sample_inference(result["latest_model"], queue['registry'], workspace_ml_client, endpoint.name, result["deployment"])
+            if result["inference"]:
+                get_online_endpoint_logs(workspace_ml_client, endpoint.name, result["deployment"])
+        except Exception as e:
+            print (f"::warning:: Could not get the logs of deployment {result['deployment']} for {result['model']}: \n{e}")
+    def deploy_waves(endpoint, *resolved):
+        print (f"online_endpoint_name: {endpoint.name}")
+        testable = [result for result in resolved if result["instance_type"] is not None]
+        for wave in plan_deployment_waves(workspace_ml_client, [result["instance_type"] for result in testable], test_batch_size):
+            deployments = []
+            for i in wave:
+                testable[i]["deployment"] = get_deployment_name(testable[i]["model"], i)
+                deployments.append(ManagedOnlineDeployment(
+                    name=testable[i]["deployment"],
+                    endpoint_name=endpoint.name,
+                    model=testable[i]["latest_model"].id,
+                    instance_type=testable[i]["instance_type"],
+                    instance_count=1,
+                ))
+            print (f"Creating deployments {[deployment.name for deployment in deployments]}")
+            # the deployments of the wave are deleted however the wave ends, so they don't stay on a warm endpoint
+            try:
+                errors = endpoint_lifecycle.deploy_batch(deployments)
+                for i in wave:
+                    test_deployment(endpoint, testable[i], errors[testable[i]["deployment"]])
+            finally:
+                endpoint_lifecycle.delete_deployments(endpoint.name, [deployment.name for deployment in deployments])
+        return endpoint
+
+    graph = StageGraph(f"batch of {len(models)} models")
+    metadata_stages = []
+    for result in results:
+        metadata_stages.append(f"metadata {result['model']}")
+        graph.add(metadata_stages[-1], lambda result=result: resolve(result))
+    graph.add("endpoint", lambda: create_online_endpoint(endpoint_lifecycle))
+    graph.add("deployments", deploy_waves, ["endpoint"] + metadata_stages)
+    graph.add("release", lambda endpoint: endpoint_lifecycle.release(endpoint.name), ["deployments"])
+    # the result of every model is written to the step summary, also when a stage such as the endpoint failed
     try:
-        workspace_ml_client.online_endpoints.begin_delete(name=online_endpoint_name).wait()
-    except Exception as e:
-        print (f"::warning:: Could not delete endpoint: : \n{e}")
-        exit (0)    
+        run_stages(graph, endpoint_lifecycle)
+    finally:
+        write_batch_summary(results)
+    return results
+
+# function to run the stages of testing models, the endpoint is released when a stage fails after it was created
+# and before the stage that releases it ran. a failed deployment stage releases the endpoint itself
+def run_stages(graph, endpoint_lifecycle, *deployment_names):
+    try:
+        return graph.run()
+    except BaseException:
+        deployment_failed = "deployment" in graph.timings and "deployment" not in graph.results
+        released = any(stage in graph.timings for stage in ["delete", "release"])
+        if "endpoint" in graph.results and not deployment_failed and not released:
+            endpoint_lifecycle.release(graph.results["endpoint"].name, *deployment_names)
+        raise
+    finally:
+        graph.write_timings()
+
+# function to test one model on the endpoint of endpoint_lifecycle as a demo deployment, returns the stage graph
+# the model metadata is resolved while the endpoint is created, the deployment needs both
+def test_model(workspace_ml_client, registry_ml_client, endpoint_lifecycle, queue, model_name, sku_override, check_override):
+    def resolve_model():
+        latest_model, instance_type = get_model_and_instance_type(model_name, registry_ml_client, queue, sku_override, check_override)
+        if instance_type is None:
+            exit (1)
+        return latest_model, instance_type
+    def create_endpoint():
+        endpoint = create_online_endpoint(endpoint_lifecycle)
+        print (f"online_endpoint_name: {endpoint.name}")
+        return endpoint
+
+    graph = StageGraph(model_name)
+    graph.add("metadata", resolve_model)
+    graph.add("endpoint", create_endpoint)
+    graph.add("deployment", lambda model, endpoint: create_online_deployment(workspace_ml_client, endpoint_lifecycle, endpoint, model[1], model[0]), ["metadata", "endpoint"])
+    graph.add("inference", lambda model, endpoint, _: sample_inference(model[0], queue['registry'], workspace_ml_client, endpoint.name), ["metadata", "endpoint", "deployment"])
+    graph.add("logs", lambda endpoint, _: get_online_endpoint_logs(workspace_ml_client, endpoint.name), ["endpoint", "inference"])
+    graph.add("delete", lambda endpoint, _: delete_online_endpoint(endpoint_lifecycle, endpoint.name), ["endpoint", "logs"])
+    run_stages(graph, endpoint_lifecycle, "demo")
+    return graph
+
+# function to write the result of every model of a batch, or of the queues of run_queue.py, to the step summary
+def write_batch_summary(results, title="Batch results"):
+    lines = [f"####{title}", "Model|Deployment|Instance type|Deployed|Inference", "-----|----------|-------------|--------|---------"]
+    for result in results:
+        lines.append(f"{result['model']}|{result['deployment'] or ''}|{result['instance_type'] or ''}|{'✅' if result['deployed'] else '❌'}|{'✅' if result['inference'] else '❌'}")
+    print ("\n".join(lines))
+    if 'GITHUB_STEP_SUMMARY' in os.environ:
+        with open(os.environ['GITHUB_STEP_SUMMARY'], 'a') as fh:
+            print ("\n".join(lines), file=fh)
 
 
 
@@ -273,12 +419,31 @@ def main():
 
     queue = get_test_queue()
 
+    work_queue = None
+    if test_work_queue:
+        work_queue = open_work_queue(test_work_queue)
+        # test in the workspace of the runner that leased the model, the model is marked failed if the run ends
+        # before it is tested
+        queue = work_queue.start(test_model_name, test_queue) or queue
+        work_queue.complete_on_exit(test_model_name)
+
     sku_override = get_sku_override()
     if sku_override is None:
         check_override = False
 
+    # the models after test_model_name in the queue are tested in the same run
+    batch = [test_model_name]
+    if test_batch_size > 1:
+        batch += get_batch_models(queue, work_queue, test_batch_size - 1)
+        print (f"Testing a batch of {len(batch)} models: {batch}")
+
     if test_trigger_next_model == "true":
-        set_next_trigger_model(queue)
+        if work_queue is not None:
+            # the next model is leased when this run ends, however it ends, so its lease doesn't run out while this
+            # run is still testing
+            atexit.register(set_next_trigger_model, queue, work_queue, batch[-1])
+        else:
+            set_next_trigger_model(queue, work_queue, batch[-1])
 
     # print values of all above variables
     print (f"test_subscription_id: {queue['subscription']}")
@@ -290,11 +455,11 @@ def main():
     print (f"test_trigger_next_model: {test_trigger_next_model}")
     print (f"test_queue: {test_queue}")
     print (f"test_set: {test_set}")
+    print (f"test_endpoint_mode: {test_endpoint_mode}")
 
 
     try:
-        credential = DefaultAzureCredential()
-        credential.get_token("https://management.azure.com/.default")
+        credential = get_credential()
     except Exception as ex:
         print ("::error:: Auth failed, DefaultAzureCredential not working: \n{e}")
         exit (1)
@@ -313,23 +478,21 @@ def main():
         registry_name=queue['registry']
     )
 
-    latest_model = get_latest_model_version(registry_ml_client, test_model_name)
-    instance_type = get_instance_type(latest_model, sku_override, registry_ml_client, check_override)
-
-# endpoint names need to be unique in a region, hence using timestamp to create unique endpoint name
-
-    timestamp = int(time.time())
-    online_endpoint_name = "hf-ep-" + str(timestamp)
-    print (f"online_endpoint_name: {online_endpoint_name}")
-    endpoint = ManagedOnlineEndpoint(
-        name=online_endpoint_name,
-        auth_mode="key",
-    )
-    create_online_endpoint(workspace_ml_client, endpoint)
-    create_online_deployment(workspace_ml_client, endpoint, instance_type, latest_model)
-    sample_inference(latest_model,queue['registry'], workspace_ml_client, online_endpoint_name)
-    get_online_endpoint_logs(workspace_ml_client, online_endpoint_name)
-    delete_online_endpoint(workspace_ml_client, online_endpoint_name)
+    # a warm endpoint belongs to the queue of the runner, which tests one model or batch at a time
+    endpoint_lifecycle = EndpointLifecycle(workspace_ml_client, test_endpoint_mode, "hf-ep", queue['workspace'], f"{test_set}/{queue['queue_name']}")
+
+    if len(batch) > 1:
+        results = test_batch(workspace_ml_client, registry_ml_client, endpoint_lifecycle, queue, batch, sku_override, check_override)
+        if work_queue is not None:
+            for result in results:
+                work_queue.complete(result["model"], "done" if result["deployed"] and result["inference"] else "failed")
+        if not all(result["deployed"] and result["inference"] for result in results):
+            exit (1)
+        return
+
+    test_model(workspace_ml_client, registry_ml_client, endpoint_lifecycle, queue, test_model_name, sku_override, check_override)
+    if work_queue is not None:
+        work_queue.complete(test_model_name)
     
         
 if __name__ == "__main__":
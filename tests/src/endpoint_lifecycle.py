@@ -0,0 +1,162 @@
+import hashlib
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from azure.core.exceptions import ResourceNotFoundError
+from azure.ai.ml.entities import ManagedOnlineEndpoint
+
+# creation and teardown of the online endpoints models are deployed to, shared by the deploy scripts and the
+# constant library automation. the mode is set with the test_endpoint_mode environment variable:
+# per_model - a new endpoint named <prefix>-<timestamp> for every model, deleted once the model is tested
+# warm - one long lived endpoint per workspace and queue. only the deployment is swapped per model: stale
+#        deployments left by crashed runs are deleted, the new deployment gets all traffic, and once the model is
+#        tested its traffic is reset and the deployment deleted, so the next model starts from an empty endpoint.
+#        this skips minutes of endpoint provisioning per model.
+# in batch mode several models are deployed to the same endpoint at once, each as a deployment named after the
+# model that is invoked by its name, in waves that fit the core quota of the workspace.
+# only the ml client operations below are used, so any object with the same online_endpoints, online_deployments
+# and compute methods can stand in for MLClient to test it.
+
+# constants
+ENDPOINT_MODES = ["per_model", "warm"]
+
+
+# deployment names are at most 32 letters, digits and hyphens and start with a letter, index keeps them unique in a batch
+def get_deployment_name(model_name, index):
+    name = re.sub("[^a-z0-9]+", "-", model_name.lower()).strip("-")
+    return f"m{index}-{name}"[:32].rstrip("-")
+
+# function to split the models of a batch into waves of deployments that fit the dedicated cores left in the
+# workspace quota, returns lists of indexes into instance_types. every wave has at least one model, and at most
+# max_size. managed online deployments reserve 20% more cores than they use for upgrades.
+# when the quota can't be read, waves are max_size models
+def plan_deployment_waves(workspace_ml_client, instance_types, max_size):
+    indexes = list(range(len(instance_types)))
+    try:
+        sizes = {size.name.lower(): size for size in workspace_ml_client.compute.list_sizes()}
+        available = {}
+        for usage in workspace_ml_client.compute.list_usage():
+            name = getattr(usage.name, "value", None) or usage.name["value"]
+            available[name.lower()] = usage.limit - usage.current_value
+    except Exception as e:
+        print (f"::warning:: Could not get the core quota of the workspace, deploying {max_size} models at a time: \n{e}")
+        return [indexes[i:i + max_size] for i in range(0, len(indexes), max_size)]
+    waves = []
+    wave, used = [], {}
+    for i in indexes:
+        size = sizes.get(str(instance_types[i]).lower())
+        family = size.family.lower() if size is not None else None
+        cores = size.v_cp_us * 1.2 if size is not None else 0
+        fits = family is None or used.get(family, 0) + cores <= available.get(family, float("inf"))
+        if wave and (len(wave) == max_size or not fits):
+            waves.append(wave)
+            wave, used = [], {}
+        wave.append(i)
+        if family is not None:
+            used[family] = used.get(family, 0) + cores
+    if wave:
+        waves.append(wave)
+    return waves
+
+# endpoint names are unique per region and at most 32 characters, the queue name is hashed to fit
+def get_warm_endpoint_name(prefix, workspace, queue_name):
+    digest = hashlib.sha1(f"{workspace}/{queue_name}".encode()).hexdigest()[:8]
+    return f"{prefix}-warm-{digest}"
+
+
+class EndpointLifecycle:
+    def __init__(self, workspace_ml_client, mode="per_model", prefix="hf-ep", workspace=None, queue_name=None) -> None:
+        if mode not in ENDPOINT_MODES:
+            raise ValueError(f"Invalid endpoint mode {mode}, options are {ENDPOINT_MODES}")
+        if mode == "warm" and (workspace is None or queue_name is None):
+            raise ValueError("warm endpoints need the workspace and queue name")
+        self.workspace_ml_client = workspace_ml_client
+        self.mode = mode
+        self.prefix = prefix
+        self.workspace = workspace
+        self.queue_name = queue_name
+
+    # function to get the endpoint to deploy the model to, creating it when there is none
+    # per_model creates a new endpoint, warm reuses the endpoint of the queue if it provisioned successfully
+    def acquire_endpoint(self):
+        if self.mode == "per_model":
+            # endpoint names need to be unique in a region, hence using timestamp to create unique endpoint name
+            endpoint = ManagedOnlineEndpoint(name=f"{self.prefix}-{int(time.time())}", auth_mode="key")
+            print (f"Creating endpoint {endpoint.name}")
+            self.workspace_ml_client.online_endpoints.begin_create_or_update(endpoint).wait()
+            return self.workspace_ml_client.online_endpoints.get(name=endpoint.name)
+        name = get_warm_endpoint_name(self.prefix, self.workspace, self.queue_name)
+        try:
+            endpoint = self.workspace_ml_client.online_endpoints.get(name=name)
+        except ResourceNotFoundError:
+            endpoint = None
+        if endpoint is not None and str(endpoint.provisioning_state).lower() == "succeeded":
+            print (f"Reusing warm endpoint {name}")
+            self.delete_stale_deployments(endpoint)
+            return endpoint
+        # an endpoint that failed to provision is created again with the same name
+        print (f"Creating warm endpoint {name}")
+        self.workspace_ml_client.online_endpoints.begin_create_or_update(
+            ManagedOnlineEndpoint(name=name, auth_mode="key")).wait()
+        return self.workspace_ml_client.online_endpoints.get(name=name)
+
+    # function to set the traffic of the endpoint, {deployment name: percent}, {} sends no traffic to any deployment
+    def set_traffic(self, endpoint, traffic):
+        endpoint.traffic = traffic
+        self.workspace_ml_client.online_endpoints.begin_create_or_update(endpoint).result()
+
+    # function to delete the deployments of a warm endpoint left by runs that did not release it, except keep
+    def delete_stale_deployments(self, endpoint, keep=()):
+        stale = [deployment.name for deployment in self.workspace_ml_client.online_deployments.list(endpoint_name=endpoint.name)
+                 if deployment.name not in keep]
+        if len(stale) == 0:
+            return
+        print (f"Deleting stale deployments {stale} of endpoint {endpoint.name}")
+        self.set_traffic(endpoint, {name: percent for name, percent in (endpoint.traffic or {}).items() if name in keep})
+        for name in stale:
+            self.workspace_ml_client.online_deployments.begin_delete(name=name, endpoint_name=endpoint.name).wait()
+
+    # function to create the deployment of a model and send all traffic of the endpoint to it
+    def deploy(self, endpoint, deployment):
+        self.workspace_ml_client.online_deployments.begin_create_or_update(deployment).wait()
+        self.set_traffic(endpoint, {deployment.name: 100})
+
+    # function to create the deployments of a batch of models at the same time, they get no traffic and are
+    # invoked by deployment name. returns {deployment name: None, or the exception if it could not be created}
+    def deploy_batch(self, deployments):
+        def create(deployment):
+            try:
+                self.workspace_ml_client.online_deployments.begin_create_or_update(deployment).wait()
+                return None
+            except Exception as e:
+                return e
+        with ThreadPoolExecutor(max_workers=max(len(deployments), 1)) as executor:
+            # map returns results in the order of deployments
+            return dict(zip([deployment.name for deployment in deployments], executor.map(create, deployments)))
+
+    # function to tear down after models are tested or failed to deploy, errors are printed as warnings
+    # per_model deletes the endpoint, warm resets traffic and deletes the deployments so the endpoint can be reused
+    def release(self, endpoint_name, *deployment_names):
+        try:
+            if self.mode == "per_model":
+                print (f"Deleting endpoint {endpoint_name}")
+                self.workspace_ml_client.online_endpoints.begin_delete(name=endpoint_name).wait()
+                return
+            endpoint = self.workspace_ml_client.online_endpoints.get(name=endpoint_name)
+            if endpoint.traffic:
+                self.set_traffic(endpoint, {})
+        except Exception as e:
+            print (f"::warning:: Could not release endpoint {endpoint_name}: \n{e}")
+            return
+        self.delete_deployments(endpoint_name, deployment_names)
+
+    # function to delete deployments of an endpoint at the same time, such as a wave of a batch, errors are printed as warnings
+    def delete_deployments(self, endpoint_name, deployment_names):
+        def delete(name):
+            try:
+                print (f"Deleting deployment {name} of endpoint {endpoint_name}")
+                self.workspace_ml_client.online_deployments.begin_delete(name=name, endpoint_name=endpoint_name).wait()
+            except Exception as e:
+                print (f"::warning:: Could not delete deployment {name} of endpoint {endpoint_name}: \n{e}")
+        with ThreadPoolExecutor(max_workers=max(len(deployment_names), 1)) as executor:
+            list(executor.map(delete, deployment_names))
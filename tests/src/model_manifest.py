@@ -0,0 +1,47 @@
+import json
+import os
+from registry_cache import CachedModel
+
+# compiled metadata of the models of a test set, written by tests/setup/build_manifest.py
+# the deploy scripts read the entry of their model instead of listing model versions and sku templates in the
+# registry, so a run makes no registry metadata calls before creating the endpoint.
+# an entry has the model id, name, version and creation time, its task, the instance type per sku type and the
+# sample input file of the task. rebuild the manifest when models get new versions.
+
+# constants
+MODEL_MANIFEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../config/model-manifest")
+
+
+def get_manifest_file(test_set):
+    return os.path.join(MODEL_MANIFEST_DIR, f"{test_set}.json")
+
+# function to load the manifest of a test set, None if there is no manifest
+def load_model_manifest(manifest_file):
+    if not manifest_file or not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file) as f:
+        return json.load(f)
+
+# function to get the manifest entry of a model, None if the model is not in the manifest
+# manifest_file defaults to config/model-manifest/<test_set>.json
+def get_model_entry(test_set, model_name, manifest_file=None):
+    manifest = load_model_manifest(manifest_file or get_manifest_file(test_set))
+    if manifest is None:
+        return None
+    entry = manifest["models"].get(model_name)
+    if entry is None:
+        print (f"::warning:: {model_name} is not in the model manifest of {test_set}, using the registry")
+        return None
+    print (f"Using model manifest of {test_set} built at {manifest['built_at']}")
+    return entry
+
+# function to convert a manifest entry to a model with the attributes the deploy scripts use
+def entry_to_model(entry):
+    tags = {"task": entry["task"]} if entry.get("task") else {}
+    return CachedModel(entry["name"], entry["version"], entry["id"], {}, tags, {}, entry.get("created_at"))
+
+# function to get the instance type of a model for sku_type, sku_override entries take precedence
+def get_entry_instance_type(entry, sku_type, sku_override=None):
+    if sku_override and entry["name"] in sku_override:
+        return sku_override[entry["name"]]['sku']
+    return entry.get("instance_types", {}).get(sku_type)
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# on-disk cache of model version metadata, shared by create_queue.py, test_status_v2.py and the deploy scripts
+# listing every version of a model is slow on large registries, and the same models are looked up on every run.
+# the cache is keyed by registry (or workspace), model name and version and keeps properties, tags, flavors and
+# creation time. the version list of a model expires after REGISTRY_CACHE_TTL seconds and is then listed again.
+
+# constants
+REGISTRY_CACHE_FILE = os.environ.get(
+    "REGISTRY_CACHE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "../logs/registry_cache.sqlite"))
+REGISTRY_CACHE_TTL = int(os.environ.get("REGISTRY_CACHE_TTL", 6 * 60 * 60))
+
+
+class CachedCreationContext:
+    def __init__(self, created_at) -> None:
+        self.created_at = created_at
+
+
+# model version as stored in the cache, has the attributes of azure.ai.ml.entities.Model the scripts use
+class CachedModel:
+    def __init__(self, name, version, id, properties, tags, flavors, created_at) -> None:
+        self.name = name
+        self.version = version
+        self.id = id
+        self.properties = properties
+        self.tags = tags
+        self.flavors = flavors
+        self.creation_context = CachedCreationContext(created_at)
+
+    def __repr__(self) -> str:
+        return f"CachedModel(name={self.name}, version={self.version}, id={self.id}, created_at={self.creation_context.created_at})"
+
+
+class RegistryCache:
+    def __init__(self, cache_file=REGISTRY_CACHE_FILE, ttl_seconds=REGISTRY_CACHE_TTL) -> None:
+        self.ttl_seconds = ttl_seconds
+        if os.path.dirname(cache_file):
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # one connection shared by the threads of a script, access is serialized with a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_file, timeout=60, check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS model_versions (
+                registry TEXT NOT NULL,
+                name TEXT NOT NULL,
+                version TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                id TEXT,
+                properties TEXT,
+                tags TEXT,
+                flavors TEXT,
+                created_at TEXT,
+                PRIMARY KEY (registry, name, version)
+            );
+            CREATE TABLE IF NOT EXISTS model_listings (
+                registry TEXT NOT NULL,
+                name TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (registry, name)
+            );
+            CREATE TABLE IF NOT EXISTS template_index (
+                registry TEXT NOT NULL,
+                template TEXT NOT NULL,
+                instance_type TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (registry, template)
+            );
+        """)
+
+    # function to get the cached versions of a model in listing order, None if not cached or expired
+    def get_versions(self, registry, name):
+        with self.lock:
+            listing = self.connection.execute(
+                "SELECT fetched_at FROM model_listings WHERE registry = ? AND name = ?", (registry, name)).fetchone()
+            if listing is None or time.time() - listing[0] > self.ttl_seconds:
+                return None
+            rows = self.connection.execute("""
+                SELECT name, version, id, properties, tags, flavors, created_at FROM model_versions
+                WHERE registry = ? AND name = ? ORDER BY position""", (registry, name)).fetchall()
+        return [CachedModel(row[0], row[1], row[2], json.loads(row[3]), json.loads(row[4]), json.loads(row[5]),
+                            datetime.fromisoformat(row[6]) if row[6] else None) for row in rows]
+
+    # function to replace the cached versions of a model, returns them as CachedModel
+    def put_versions(self, registry, name, models):
+        cached = [CachedModel(
+            model.name, str(model.version), model.id,
+            dict(model.properties or {}), dict(model.tags or {}), dict(getattr(model, "flavors", None) or {}),
+            model.creation_context.created_at if model.creation_context else None) for model in models]
+        with self.lock:
+            self.connection.execute("DELETE FROM model_versions WHERE registry = ? AND name = ?", (registry, name))
+            self.connection.executemany("""
+                INSERT INTO model_versions (registry, name, version, position, id, properties, tags, flavors, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", [
+                (registry, name, model.version, position, model.id, json.dumps(model.properties, default=str),
+                 json.dumps(model.tags, default=str), json.dumps(model.flavors, default=str),
+                 model.creation_context.created_at.isoformat() if hasattr(model.creation_context.created_at, "isoformat") else model.creation_context.created_at)
+                for position, model in enumerate(cached)])
+            self.connection.execute("INSERT OR REPLACE INTO model_listings (registry, name, fetched_at) VALUES (?, ?, ?)",
+                                    (registry, name, time.time()))
+            self.connection.commit()
+        return cached
+
+    # function to list all versions of a model, from the cache if fresh, else from ml_client
+    # registry is the registry name, or the workspace name for workspace models
+    def list_versions(self, ml_client, registry, name):
+        versions = self.get_versions(registry, name)
+        if versions is not None:
+            return versions
+        return self.put_versions(registry, name, list(ml_client.models.list(name=name)))
+
+    # function to get the cached sku template index of a registry as {template: instance_type}, None if expired
+    def get_template_index(self, registry):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT template, instance_type, fetched_at FROM template_index WHERE registry = ?", (registry,)).fetchall()
+        if len(rows) == 0 or time.time() - min(row[2] for row in rows) > self.ttl_seconds:
+            return None
+        return {row[0]: row[1] for row in rows}
+
+    def put_template_index(self, registry, template_index):
+        with self.lock:
+            self.connection.execute("DELETE FROM template_index WHERE registry = ?", (registry,))
+            self.connection.executemany(
+                "INSERT INTO template_index (registry, template, instance_type, fetched_at) VALUES (?, ?, ?, ?)",
+                [(registry, template, template_index[template], time.time()) for template in template_index])
+            self.connection.commit()
+
+    # function to add or replace one template of the template index of a registry
+    def put_template_instance_type(self, registry, template, instance_type):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO template_index (registry, template, instance_type, fetched_at) VALUES (?, ?, ?, ?)",
+                (registry, template, instance_type, time.time()))
+            self.connection.commit()
+
+    # function to drop cached versions, of one model, of one registry or of everything
+    def invalidate(self, registry=None, name=None):
+        conditions = []
+        # the template index is keyed by template instead of name
+        template_conditions = []
+        params = []
+        if registry is not None:
+            conditions.append("registry = ?")
+            template_conditions.append("registry = ?")
+            params.append(registry)
+        if name is not None:
+            conditions.append("name = ?")
+            template_conditions.append("template = ?")
+            params.append(name)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        template_where = f" WHERE {' AND '.join(template_conditions)}" if template_conditions else ""
+        with self.lock:
+            count = self.connection.execute(f"DELETE FROM model_listings{where}", params).rowcount
+            self.connection.execute(f"DELETE FROM model_versions{where}", params)
+            # the template index is built from template model versions, drop it with them
+            self.connection.execute(f"DELETE FROM template_index{template_where}", params)
+            self.connection.commit()
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # command - options are invalidate or stats
+    parser.add_argument("command", type=str, choices=["invalidate", "stats"])
+    parser.add_argument("--cache_file", type=str, default=REGISTRY_CACHE_FILE)
+    # registry or workspace name to invalidate, all registries if not set
+    parser.add_argument("--registry", type=str, default=None)
+    # model name to invalidate, all models if not set
+    parser.add_argument("--model", type=str, default=None)
+    args = parser.parse_args()
+
+    cache = RegistryCache(args.cache_file)
+    if args.command == "invalidate":
+        print (f"Invalidated {cache.invalidate(args.registry, args.model)} cached models")
+    elif args.command == "stats":
+        for registry, count, oldest in cache.connection.execute(
+                "SELECT registry, COUNT(*), MIN(fetched_at) FROM model_listings GROUP BY registry"):
+            print (f"{registry}: {count} models, oldest listing {datetime.fromtimestamp(oldest).strftime('%d%b%Y-%H%M%S')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+from azure.ai.ml import MLClient
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from credential_cache import get_credential
+from endpoint_lifecycle import EndpointLifecycle
+import deploy_huggingface_models as deploy
+
+# tests the models of one or more queue files of a test set in a single process, instead of one workflow run and
+# process per model. auth, imports, queue files and clients are loaded once and the models are tested concurrently
+# with deploy_huggingface_models.py. a semaphore per workspace caps the endpoints of the workspace that are tested
+# at the same time, so models of queues sharing a workspace stay within its quota.
+# reads the same environment variables as deploy_huggingface_models.py, except test_model_name and test_trigger_next_model
+
+# test set - the set of queues to test with
+test_set = os.environ.get('test_set')
+
+# test cpu or gpu template
+test_sku_type = os.environ.get('test_sku_type')
+
+# optional comma separated queue names of the test set to test, defaults to all queues of the test set
+test_queue = os.environ.get('test_queue')
+
+# optional most endpoints per workspace tested at the same time, defaults to max_parallel_tests of the workspace
+# in ../config/workspaces.json, or 4. set it to the endpoints and deployments that fit the quota of the workspace
+test_max_concurrent = os.environ.get('test_max_concurrent')
+
+# constants
+DEFAULT_MAX_CONCURRENT = 4
+
+# function to load the queue files to test, [queue]
+def get_test_queues():
+    queue_dir = f"../config/queue/{test_set}"
+    if test_queue:
+        queue_names = [name.strip() for name in test_queue.split(",") if name.strip()]
+    else:
+        queue_names = sorted(file[:-len(".json")] for file in os.listdir(queue_dir) if file.endswith(".json"))
+    queues = []
+    for queue_name in queue_names:
+        with open(f"{queue_dir}/{queue_name}.json") as f:
+            queues.append(json.load(f))
+    return queues
+
+# function to get the most endpoints tested at the same time per workspace, {workspace: count}
+def get_max_concurrent(workspaces):
+    # at least one model per workspace, or its models would never be tested
+    if test_max_concurrent:
+        return {workspace: max(int(test_max_concurrent), 1) for workspace in workspaces}
+    try:
+        with open('../config/workspaces.json') as f:
+            workspace_list = json.load(f)
+    except Exception as e:
+        print (f"::warning:: Could not read ../config/workspaces.json, testing {DEFAULT_MAX_CONCURRENT} models at a time per workspace: \n{e}")
+        workspace_list = {}
+    return {workspace: max(workspace_list.get(workspace, {}).get("max_parallel_tests", DEFAULT_MAX_CONCURRENT), 1) for workspace in workspaces}
+
+
+# deploy.test_model reads the rest of its settings, such as test_sku_type and test_model_manifest, from the module
+# level environment variables of deploy_huggingface_models.py. the endpoint mode is passed in, as the runner names
+# the endpoints after it
+class QueueRunner:
+    def __init__(self, queues, credential, sku_override, endpoint_mode="per_model") -> None:
+        self.credential = credential
+        self.sku_override = sku_override
+        # per_model or warm, see endpoint_lifecycle.py
+        self.endpoint_mode = endpoint_mode
+        # [(model, queue)] in the order of the queue files
+        self.models = [(model, queue) for queue in queues for model in queue['models']]
+        # ml clients are shared by the models of a workspace or registry
+        self.workspace_ml_clients = {}
+        self.registry_ml_clients = {}
+        self.lock = threading.Lock()
+
+    def get_workspace_ml_client(self, queue):
+        with self.lock:
+            if queue['workspace'] not in self.workspace_ml_clients:
+                self.workspace_ml_clients[queue['workspace']] = MLClient(
+                    credential=self.credential,
+                    subscription_id=queue['subscription'],
+                    resource_group_name=queue['resource_group'],
+                    workspace_name=queue['workspace']
+                )
+            return self.workspace_ml_clients[queue['workspace']]
+
+    def get_registry_ml_client(self, queue):
+        with self.lock:
+            if queue['registry'] not in self.registry_ml_clients:
+                self.registry_ml_clients[queue['registry']] = MLClient(credential=self.credential, registry_name=queue['registry'])
+            return self.registry_ml_clients[queue['registry']]
+
+    # function to test the model at index, slot is the endpoint of the workspace it holds until it is tested
+    # per_model endpoint names get the index so endpoints created in the same second don't collide. warm endpoints
+    # are named after the slot of the workspace only, so there is one per slot that is reused by the models tested
+    # in it, and no two models swap deployments on the same endpoint.
+    # returns the result of the model in the format of the batch results and of results_per_model
+    def test_model(self, index, slot):
+        model, queue = self.models[index]
+        result = {"model": model, "queue": queue['queue_name'], "workspace": queue['workspace'], "deployment": "demo",
+                  "instance_type": None, "deployed": False, "inference": False,
+                  "success": 0, "failure": 0, "unknown": 0, "not_tested": 0, "duration": 0, "last_tested": None}
+        start = time.time()
+        workspace_ml_client = self.get_workspace_ml_client(queue)
+        prefix = "hf-ep" if self.endpoint_mode == "warm" else f"hf-ep{index}"
+        endpoint_lifecycle = EndpointLifecycle(workspace_ml_client, self.endpoint_mode, prefix,
+                                               queue['workspace'], f"{test_set}/{queue['workspace']}/{slot}")
+        try:
+            graph = deploy.test_model(workspace_ml_client, self.get_registry_ml_client(queue), endpoint_lifecycle, queue,
+                                      model, self.sku_override, self.sku_override is not None)
+        except (Exception, SystemExit) as e:
+            # run_stages released the endpoint
+            print (f"::error:: Testing {model} failed: \n{e}")
+            graph = None
+        if graph is not None:
+            result["instance_type"] = graph.results["metadata"][1]
+            result["deployed"] = True
+            result["inference"] = graph.results["inference"]
+        result["success" if result["deployed"] and result["inference"] else "failure"] = 1
+        # durations are in minutes like the runs of test_status_v2.py
+        result["duration"] = (time.time() - start) / 60
+        result["last_tested"] = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        return result
+
+    # function to test all models, each workspace tests at most max_concurrent[workspace] models at a time and
+    # models of other workspaces are started while a workspace is full. returns the results in the order of models
+    def run(self, max_concurrent):
+        pending = {workspace: deque() for workspace in max_concurrent}
+        for index, (_, queue) in enumerate(self.models):
+            pending[queue['workspace']].append(index)
+        semaphores = {workspace: threading.BoundedSemaphore(max_concurrent[workspace]) for workspace in max_concurrent}
+        free_slots = {workspace: list(range(max_concurrent[workspace])) for workspace in max_concurrent}
+        results = [None] * len(self.models)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(sum(max_concurrent.values()), 1)) as executor:
+            while any(pending.values()) or running:
+                for workspace in pending:
+                    while pending[workspace] and semaphores[workspace].acquire(blocking=False):
+                        index = pending[workspace].popleft()
+                        slot = free_slots[workspace].pop()
+                        running[executor.submit(self.test_model, index, slot)] = (index, workspace, slot)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, workspace, slot = running.pop(future)
+                    free_slots[workspace].append(slot)
+                    semaphores[workspace].release()
+                    results[index] = future.result()
+                    print (f"Tested {sum(result is not None for result in results)} of {len(results)} models")
+        return results
+
+# function to log the results as {model: result}, in the format of the results_per_model of test_status_v2.py
+# so they can be passed to create_queue.py and simulate_queues.py as durations_file
+def write_results(results):
+    os.makedirs("../logs/run_queue", exist_ok=True)
+    results_file = f"../logs/run_queue/{test_set}-{datetime.now().strftime('%d%b%Y-%H%M%S')}.json"
+    with open(results_file, "w") as f:
+        json.dump({result["model"]: result for result in results}, f, indent=4)
+    print (f"Wrote the results of {len(results)} models to {results_file}")
+
+
+def main():
+    if test_set is None or test_sku_type is None:
+        print ("::error:: One or more of the environment variables test_set, test_sku_type are not set")
+        exit (1)
+
+    queues = get_test_queues()
+    max_concurrent = get_max_concurrent(sorted(set(queue['workspace'] for queue in queues)))
+    sku_override = deploy.get_sku_override()
+
+    print (f"test_set: {test_set}")
+    print (f"test_sku_type: {test_sku_type}")
+    print (f"test_queues: {[queue['queue_name'] for queue in queues]}")
+    print (f"test_endpoint_mode: {deploy.test_endpoint_mode}")
+    print (f"max_concurrent: {max_concurrent}")
+
+    try:
+        credential = get_credential()
+    except Exception as e:
+        print (f"::error:: Auth failed, DefaultAzureCredential not working: \n{e}")
+        exit (1)
+
+    start = time.time()
+    runner = QueueRunner(queues, credential, sku_override, deploy.test_endpoint_mode)
+    print (f"Testing {len(runner.models)} models of {len(queues)} queues")
+    results = runner.run(max_concurrent)
+    deploy.write_batch_summary(results, "Queue results")
+    write_results(results)
+    failed = [result["model"] for result in results if result["failure"]]
+    print (f"Tested {len(results)} models in {(time.time() - start) / 60:.1f}m, {len(failed)} failed")
+    if len(failed) > 0:
+        print (f"::error:: Failed models: {failed}")
+        exit (1)
+
+if __name__ == "__main__":
+    main()
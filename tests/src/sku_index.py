@@ -0,0 +1,73 @@
+import json
+
+# index of sku template model to default instance type
+# a model lists its sku templates in its properties, and each template model has the default instance type
+# in its properties. there are only a few templates, so resolve them once per run or cache period, and
+# resolving the instance type of a model is then a dictionary lookup
+
+# move this to config file later
+TEMPLATES = ['transformers-cpu-small', 'transformers-cpu-medium', 'transformers-cpu-large','transformers-cpu-extra-large', 'transformers-gpu-medium']
+
+
+# function to read the default instance type from the properties of the latest version of a template model
+def get_default_instance_type(template_model):
+    # split the properties by by the pattern "DefaultInstanceType": " and get 2nd element
+    # then again split by " and get the first element
+    properties = str(template_model.properties)
+    if '"DefaultInstanceType": "' not in properties:
+        return None
+    return properties.split('"DefaultInstanceType": "')[1].split('"')[0]
+
+def get_template_instance_type(registry_ml_client, registry_name, registry_cache, template_name):
+    versions = registry_cache.list_versions(registry_ml_client, registry_name, template_name)
+    if len(versions) == 0:
+        print (f"::warning:: Could not find sku template {template_name} in {registry_name}")
+        return None
+    latest_template = sorted(versions, key=lambda x: x.creation_context.created_at, reverse=True)[0]
+    return get_default_instance_type(latest_template)
+
+# function to build the {template_name: instance_type} index of a registry, read from the registry cache when fresh
+def build_template_index(registry_ml_client, registry_name, registry_cache, templates=TEMPLATES):
+    template_index = registry_cache.get_template_index(registry_name)
+    if template_index is not None and all(template in template_index for template in templates):
+        return template_index
+    template_index = {}
+    for template_name in templates:
+        instance_type = get_template_instance_type(registry_ml_client, registry_name, registry_cache, template_name)
+        if instance_type is not None:
+            template_index[template_name] = instance_type
+    registry_cache.put_template_index(registry_name, template_index)
+    print (f"template_index: {template_index}")
+    return template_index
+
+# function to find the name of the sku template matching sku_type in the model properties
+def get_sku_template_name(latest_model, sku_type):
+    model_properties = str(latest_model.properties)
+    # escape double quotes in model_properties
+    model_properties = model_properties.replace('"', '\\"')
+    # replace single quotes with double quotes in model_properties
+    model_properties = model_properties.replace("'", '"')
+    # convert model_properties to dictionary
+    model_properties_dict=json.loads(model_properties)
+    sku_templates = model_properties_dict['skuBasedEngineIds']
+    # split sku_templates by comma into a list
+    sku_templates_list = sku_templates.split(",")
+    # find the sku_template that has sku_type as a substring
+    sku_template = next((s for s in sku_templates_list if sku_type in s), None)
+    if sku_template is None:
+        return None
+    # split sku_template by / and get the 5th element
+    return sku_template.split("/")[5]
+
+# function to resolve the instance type of a model from the template index, sku_override entries take precedence
+# templates missing from the index, such as ones added after TEMPLATES was written, are resolved from the registry
+# when registry_ml_client is set, and added to the index and the registry cache
+def resolve_instance_type(model_name, template_name, template_index, sku_override=None, registry_ml_client=None, registry_name=None, registry_cache=None):
+    if sku_override and model_name in sku_override:
+        return sku_override[model_name]['sku']
+    if template_name not in template_index and registry_ml_client is not None:
+        instance_type = get_template_instance_type(registry_ml_client, registry_name, registry_cache, template_name)
+        if instance_type is not None:
+            template_index[template_name] = instance_type
+            registry_cache.put_template_instance_type(registry_name, template_name, instance_type)
+    return template_index.get(template_name)
@@ -0,0 +1,86 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# runs the stages of testing a model as a small dependency graph, used by the deploy scripts and the constant
+# library automation. a stage starts as soon as the stages it depends on are done, so long running operations
+# that don't depend on each other, such as creating the endpoint and resolving the model metadata, overlap.
+# the start and duration of every stage are recorded and written to the step summary.
+# once a stage fails no new stages are started, the running ones are waited for and the error is raised again,
+# exit() in a stage exits the script the same way it did before.
+
+
+class StageGraph:
+    def __init__(self, name="stages") -> None:
+        self.name = name
+        # {stage name: (function, names of the stages it depends on)}, in the order they were added
+        self.stages = {}
+        self.results = {}
+        # {stage name: (start, end)} in seconds since the graph started running
+        self.timings = {}
+        self.started_at = None
+
+    # function to add a stage, fn is called with the results of depends_on in that order
+    # stages can only depend on stages added before them, so the graph has no cycles
+    def add(self, name, fn, depends_on=()):
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is already in {self.name}")
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage {name} depends on {dependency}, which is not in {self.name}")
+        self.stages[name] = (fn, tuple(depends_on))
+
+    def _run_stage(self, name):
+        fn, depends_on = self.stages[name]
+        start = time.time()
+        print (f"Starting stage {name}")
+        try:
+            return fn(*[self.results[dependency] for dependency in depends_on])
+        finally:
+            self.timings[name] = (start - self.started_at, time.time() - self.started_at)
+
+    # function to run the stages, returns {stage name: result}
+    def run(self):
+        self.started_at = time.time()
+        pending = list(self.stages)
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=max(len(self.stages), 1)) as executor:
+            while pending or running:
+                if error is None:
+                    ready = [name for name in pending if all(dependency in self.results for dependency in self.stages[name][1])]
+                    for name in ready:
+                        pending.remove(name)
+                        running[executor.submit(self._run_stage, name)] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except BaseException as e:
+                        print (f"::error:: Stage {name} of {self.name} failed")
+                        if error is None:
+                            error = e
+        if error is not None:
+            raise error
+        return self.results
+
+    # function to get the timings as markdown lines, stages in the order they started
+    def format_timings(self):
+        lines = [f"####Stage timings of {self.name}", "Stage|Start (s)|Duration (s)", "-----|---------|------------"]
+        for name, (start, end) in sorted(self.timings.items(), key=lambda timing: timing[1][0]):
+            lines.append(f"{name}|{start:.1f}|{end - start:.1f}")
+        total = max((end for _, end in self.timings.values()), default=0)
+        sequential = sum(end - start for start, end in self.timings.values())
+        lines.append(f"\nTotal {total:.1f}s, {sequential:.1f}s if the stages ran one after the other")
+        return lines
+
+    # function to print the timings and add them to the step summary
+    def write_timings(self):
+        lines = self.format_timings()
+        print ("\n".join(lines))
+        if 'GITHUB_STEP_SUMMARY' in os.environ:
+            with open(os.environ['GITHUB_STEP_SUMMARY'], 'a') as fh:
+                print ("\n".join(lines), file=fh)
@@ -0,0 +1,219 @@
+import argparse
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import time
+
+# pull based work queue shared by the runners of a test set
+# create_queue.py assigns every model to a queue up front. with a work queue, a runner finishing a model leases
+# the next pending model of its own queue, and once its queue is empty it steals from the queue with the most
+# pending models. a lease that is not completed in time, for example because the run crashed, expires and the
+# model goes back to pending for the next runner to pick up.
+# the queue is a sqlite file, so it must be on storage all runners of the test set can reach. github hosted runners
+# each get their own disk, so work queues are opt-in with test_work_queue and only work on self-hosted runners that
+# mount the same shared storage.
+
+# constants
+LEASE_SECONDS = 2 * 60 * 60
+MAX_ATTEMPTS = 3
+
+
+class WorkQueue:
+    def __init__(self, db_file, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS) -> None:
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # models completed by this process, see complete_on_exit
+        self.completed = set()
+        # autocommit mode, transactions are started explicitly with BEGIN IMMEDIATE to serialize runners
+        self.connection = sqlite3.connect(db_file, timeout=60, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS queues (
+                queue_name TEXT PRIMARY KEY,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS models (
+                model TEXT PRIMARY KEY,
+                queue_name TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                leased_by TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS models_status ON models (status, queue_name, position);
+        """)
+
+    # function to load the queue files of a test set, config/queue/<test_set>/*.json
+    # the queue metadata (workspace, subscription, etc.) is kept so runners can still connect to their workspace
+    # models already in the work queue keep their status, so loading again only adds new models
+    def load_queue_files(self, queue_dir):
+        queue_files = sorted(glob.glob(f"{queue_dir}/*.json"))
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for queue_file in queue_files:
+                with open(queue_file) as f:
+                    queue = json.load(f)
+                metadata = {key: queue[key] for key in queue if key != "models"}
+                self.connection.execute("INSERT OR REPLACE INTO queues (queue_name, metadata) VALUES (?, ?)",
+                                        (queue["queue_name"], json.dumps(metadata)))
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO models (model, queue_name, position, updated_at) VALUES (?, ?, ?, ?)",
+                    [(model, queue["queue_name"], position, time.time()) for position, model in enumerate(queue["models"])])
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        print (f"Loaded {len(queue_files)} queue files from {queue_dir}")
+
+    # expired leases go back to pending, or to failed once a model has used up its attempts
+    # must be called inside a transaction
+    def _requeue_expired(self, now):
+        expired = self.connection.execute(
+            "SELECT model, attempts FROM models WHERE status = 'leased' AND lease_expires < ?", (now,)).fetchall()
+        for row in expired:
+            status = "failed" if row["attempts"] >= self.max_attempts else "pending"
+            print (f"::warning:: Lease of {row['model']} expired, setting status to {status}")
+            self.connection.execute(
+                "UPDATE models SET status = ?, leased_by = NULL, lease_expires = NULL, updated_at = ? WHERE model = ?",
+                (status, now, row["model"]))
+        return len(expired)
+
+    def requeue_expired(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            count = self._requeue_expired(time.time())
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        return count
+
+    # function to lease the next model for the runner of queue_name, returns None when there is no work left
+    # takes the next pending model of the runner's own queue, else steals from the queue with the most pending models
+    def lease(self, queue_name):
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._requeue_expired(now)
+            row = self.connection.execute(
+                "SELECT model FROM models WHERE status = 'pending' AND queue_name = ? ORDER BY position LIMIT 1",
+                (queue_name,)).fetchone()
+            if row is None:
+                row = self.connection.execute("""
+                    SELECT model FROM models WHERE status = 'pending' AND queue_name = (
+                        SELECT queue_name FROM models WHERE status = 'pending'
+                        GROUP BY queue_name ORDER BY COUNT(*) DESC, queue_name LIMIT 1)
+                    ORDER BY position LIMIT 1""").fetchone()
+            if row is not None:
+                self.connection.execute("""
+                    UPDATE models SET status = 'leased', leased_by = ?, lease_expires = ?, attempts = attempts + 1,
+                    updated_at = ? WHERE model = ?""", (queue_name, now + self.lease_seconds, now, row["model"]))
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        return None if row is None else row["model"]
+
+    # function to mark a model as started, called by the run testing the model
+    # the first model of a chain is started without a lease, so it is leased for the queue of its workflow
+    # returns the queue metadata of the runner holding the lease, which may differ from the model's own queue
+    # when the model was stolen, so the model is tested in the workspace of the runner that pulled it
+    def start(self, model, queue_name):
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.connection.execute("SELECT status, leased_by FROM models WHERE model = ?", (model,)).fetchone()
+            if row is None:
+                print (f"::warning:: {model} is not in the work queue")
+                runner = queue_name
+            else:
+                runner = row["leased_by"] if row["status"] == "leased" and row["leased_by"] else queue_name
+                self.connection.execute("""
+                    UPDATE models SET status = 'leased', leased_by = ?, lease_expires = ?,
+                    attempts = CASE WHEN status = 'leased' THEN attempts ELSE attempts + 1 END,
+                    updated_at = ? WHERE model = ?""", (runner, now + self.lease_seconds, now, model))
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        return self.get_queue(runner)
+
+    # function to mark a model as done, or failed, it won't be leased again
+    def complete(self, model, status="done"):
+        self.connection.execute(
+            "UPDATE models SET status = ?, lease_expires = NULL, updated_at = ? WHERE model = ?",
+            (status, time.time(), model))
+        self.completed.add(model)
+
+    # function to mark models as failed when the run testing them ends before complete is called for them,
+    # for example because it raised or called exit(1). the run calls complete for the models it tested
+    def complete_on_exit(self, *models):
+        atexit.register(self._fail_incomplete, models)
+
+    def _fail_incomplete(self, models):
+        for model in models:
+            if model not in self.completed:
+                self.complete(model, "failed")
+
+    # function to get a queue in the queue file format, with the models assigned to it
+    def get_queue(self, queue_name):
+        row = self.connection.execute("SELECT metadata FROM queues WHERE queue_name = ?", (queue_name,)).fetchone()
+        if row is None:
+            return None
+        queue = json.loads(row["metadata"])
+        queue["models"] = [r["model"] for r in self.connection.execute(
+            "SELECT model FROM models WHERE queue_name = ? ORDER BY position", (queue_name,))]
+        return queue
+
+    # function to count models per queue and status, {queue_name: {status: count}}
+    def get_status(self):
+        status = {}
+        for row in self.connection.execute(
+                "SELECT queue_name, status, COUNT(*) AS count FROM models GROUP BY queue_name, status ORDER BY queue_name"):
+            status.setdefault(row["queue_name"], {})[row["status"]] = row["count"]
+        return status
+
+# function to open the work queue of a run, exits with an error when the file does not exist
+# sqlite would create an empty work queue instead, and the run would find no next model to lease. that is what
+# happens on runners that can't reach the shared storage, such as github hosted runners
+def open_work_queue(db_file):
+    if not os.path.exists(db_file):
+        print (f"::error:: Work queue {db_file} not found. Work queues only work on self-hosted runners that mount the storage it is on, unset test_work_queue to use static queues")
+        exit (1)
+    return WorkQueue(db_file)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # sqlite file with the work queue
+    parser.add_argument("--work_queue", type=str, required=True)
+    # command - options are load, status or requeue
+    # load adds the models of the queue files in queue_dir, status prints counts per queue, requeue expires old leases
+    parser.add_argument("command", type=str, choices=["load", "status", "requeue"])
+    # queue directory of the test set to load, e.g. ../config/queue/huggingface-all
+    parser.add_argument("--queue_dir", type=str, default=None)
+    parser.add_argument("--lease_seconds", type=int, default=LEASE_SECONDS)
+    args = parser.parse_args()
+
+    work_queue = WorkQueue(args.work_queue, lease_seconds=args.lease_seconds)
+    if args.command == "load":
+        if args.queue_dir is None or not os.path.isdir(args.queue_dir):
+            print (f"::error:: queue_dir {args.queue_dir} not found")
+            exit (1)
+        work_queue.load_queue_files(args.queue_dir)
+    elif args.command == "requeue":
+        print (f"Requeued {work_queue.requeue_expired()} expired leases")
+    status = work_queue.get_status()
+    print ("Queue|Pending|Leased|Done|Failed")
+    print ("-----|-------|------|----|------")
+    for queue_name in status:
+        counts = status[queue_name]
+        print (f"{queue_name}|{counts.get('pending', 0)}|{counts.get('leased', 0)}|{counts.get('done', 0)}|{counts.get('failed', 0)}")
+
+
+if __name__ == "__main__":
+    main()
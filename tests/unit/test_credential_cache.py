@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.append(SRC_DIR)
+from azure.core.credentials import AccessToken
+from credential_cache import CachedTokenCredential, MANAGEMENT_SCOPE
+
+
+# fake credential that counts get_token calls, tokens expire lifetime seconds after they are fetched
+class FakeCredential:
+    def __init__(self, lifetime=3600) -> None:
+        self.lifetime = lifetime
+        self.calls = 0
+
+    def get_token(self, *scopes, **kwargs):
+        self.calls += 1
+        return AccessToken(f"token-{self.calls}", int(time.time()) + self.lifetime)
+
+
+class TestCachedTokenCredential(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.cache_dir.name, "azure-token-cache.json")
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_cache_hit(self):
+        fake = FakeCredential()
+        credential = CachedTokenCredential(fake, self.cache_file, identity="tenant/client")
+        first = credential.get_token(MANAGEMENT_SCOPE)
+        second = credential.get_token(MANAGEMENT_SCOPE)
+        self.assertEqual(fake.calls, 1)
+        self.assertEqual(first.token, second.token)
+        self.assertEqual(os.stat(self.cache_file).st_mode & 0o777, 0o600)
+
+    def test_refresh_before_expiry(self):
+        # tokens that expire within the refresh margin are fetched again
+        fake = FakeCredential(lifetime=60)
+        credential = CachedTokenCredential(fake, self.cache_file, refresh_margin=300, identity="tenant/client")
+        credential.get_token(MANAGEMENT_SCOPE)
+        self.assertEqual(credential.get_token(MANAGEMENT_SCOPE).token, "token-2")
+        self.assertEqual(fake.calls, 2)
+
+    def test_identity_and_scopes_are_cached_separately(self):
+        fake = FakeCredential()
+        CachedTokenCredential(fake, self.cache_file, identity="tenant/client-1").get_token(MANAGEMENT_SCOPE)
+        CachedTokenCredential(fake, self.cache_file, identity="tenant/client-2").get_token(MANAGEMENT_SCOPE)
+        CachedTokenCredential(fake, self.cache_file, identity="tenant/client-1").get_token("https://storage.azure.com/.default")
+        self.assertEqual(fake.calls, 3)
+
+    def test_claims_bypass_cache(self):
+        fake = FakeCredential()
+        credential = CachedTokenCredential(fake, self.cache_file, identity="tenant/client")
+        credential.get_token(MANAGEMENT_SCOPE)
+        credential.get_token(MANAGEMENT_SCOPE, claims="challenge")
+        self.assertEqual(fake.calls, 2)
+
+    def test_reuse_across_processes(self):
+        fake = FakeCredential()
+        token = CachedTokenCredential(fake, self.cache_file, identity="tenant/client").get_token(MANAGEMENT_SCOPE)
+        # the other process gets a credential that fails, so the token can only come from the cache file
+        script = f"""
+import sys
+sys.path.append({SRC_DIR!r})
+from credential_cache import CachedTokenCredential, MANAGEMENT_SCOPE
+class FailingCredential:
+    def get_token(self, *scopes, **kwargs):
+        raise Exception("get_token called")
+print(CachedTokenCredential(FailingCredential(), {self.cache_file!r}, identity="tenant/client").get_token(MANAGEMENT_SCOPE).token)
+"""
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), token.token)
+        self.assertEqual(fake.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from azure.core.exceptions import ResourceNotFoundError
+from endpoint_lifecycle import (EndpointLifecycle, get_deployment_name, get_warm_endpoint_name,
+                                plan_deployment_waves)
+
+
+class FakePoller:
+    def __init__(self, fn=None) -> None:
+        self.fn = fn
+
+    def wait(self):
+        if self.fn is not None:
+            self.fn()
+
+    def result(self):
+        self.wait()
+
+
+# fake of the online_endpoints operations, endpoints are kept as {name: endpoint}
+# provisioning_state is the state endpoints get when they are created or updated
+class FakeOnlineEndpoints:
+    def __init__(self) -> None:
+        self.endpoints = {}
+        self.created = []
+        self.deleted = []
+        self.provisioning_state = "Succeeded"
+
+    def get(self, name):
+        if name not in self.endpoints:
+            raise ResourceNotFoundError(f"Endpoint {name} not found")
+        return self.endpoints[name]
+
+    def begin_create_or_update(self, endpoint):
+        def create():
+            if endpoint.name not in self.endpoints:
+                self.created.append(endpoint.name)
+            self.endpoints[endpoint.name] = SimpleNamespace(name=endpoint.name, traffic=dict(endpoint.traffic or {}),
+                                                            provisioning_state=self.provisioning_state)
+        return FakePoller(create)
+
+    def begin_delete(self, name):
+        def delete():
+            del self.endpoints[name]
+            self.deleted.append(name)
+        return FakePoller(delete)
+
+
+# fake of the online_deployments operations, deployments in fail are not created
+class FakeOnlineDeployments:
+    def __init__(self) -> None:
+        self.deployments = {}
+        self.deleted = []
+        self.fail = set()
+
+    def begin_create_or_update(self, deployment):
+        def create():
+            if deployment.name in self.fail:
+                raise Exception(f"Could not create {deployment.name}")
+            self.deployments[(deployment.endpoint_name, deployment.name)] = deployment
+        return FakePoller(create)
+
+    def list(self, endpoint_name):
+        return [deployment for (endpoint, _), deployment in self.deployments.items() if endpoint == endpoint_name]
+
+    def begin_delete(self, name, endpoint_name):
+        def delete():
+            del self.deployments[(endpoint_name, name)]
+            self.deleted.append(name)
+        return FakePoller(delete)
+
+
+# fake of the compute operations, the quota can't be read when sizes is None
+class FakeCompute:
+    def __init__(self, sizes, usages) -> None:
+        self.sizes = sizes
+        self.usages = usages
+
+    def list_sizes(self):
+        if self.sizes is None:
+            raise Exception("AuthorizationFailed")
+        return self.sizes
+
+    def list_usage(self):
+        return self.usages
+
+
+class FakeMLClient:
+    def __init__(self, compute=None) -> None:
+        self.online_endpoints = FakeOnlineEndpoints()
+        self.online_deployments = FakeOnlineDeployments()
+        self.compute = compute
+
+
+def deployment(name, endpoint_name):
+    return SimpleNamespace(name=name, endpoint_name=endpoint_name)
+
+
+class TestPerModelEndpoints(unittest.TestCase):
+    def test_acquire_deploy_release(self):
+        client = FakeMLClient()
+        lifecycle = EndpointLifecycle(client, "per_model", "hf-ep")
+        endpoint = lifecycle.acquire_endpoint()
+        self.assertTrue(endpoint.name.startswith("hf-ep-"))
+        lifecycle.deploy(endpoint, deployment("demo", endpoint.name))
+        self.assertEqual(client.online_endpoints.endpoints[endpoint.name].traffic, {"demo": 100})
+        lifecycle.release(endpoint.name, "demo")
+        self.assertEqual(client.online_endpoints.deleted, [endpoint.name])
+
+    def test_release_errors_are_not_raised(self):
+        lifecycle = EndpointLifecycle(FakeMLClient(), "per_model", "hf-ep")
+        lifecycle.release("hf-ep-missing", "demo")
+
+
+class TestWarmEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeMLClient()
+        self.lifecycle = EndpointLifecycle(self.client, "warm", "hf-ep", "workspace", "huggingface-all/queue-0")
+        self.name = get_warm_endpoint_name("hf-ep", "workspace", "huggingface-all/queue-0")
+
+    def test_warm_endpoint_needs_workspace_and_queue(self):
+        with self.assertRaises(ValueError):
+            EndpointLifecycle(self.client, "warm", "hf-ep")
+        with self.assertRaises(ValueError):
+            EndpointLifecycle(self.client, "cold")
+
+    def test_reuse(self):
+        first = self.lifecycle.acquire_endpoint()
+        second = self.lifecycle.acquire_endpoint()
+        self.assertEqual(first.name, self.name)
+        self.assertEqual(second.name, self.name)
+        self.assertEqual(self.client.online_endpoints.created, [self.name])
+
+    def test_recreate_on_failed_provisioning(self):
+        self.client.online_endpoints.provisioning_state = "Failed"
+        self.lifecycle.acquire_endpoint()
+        self.client.online_endpoints.provisioning_state = "Succeeded"
+        endpoint = self.lifecycle.acquire_endpoint()
+        self.assertEqual(endpoint.provisioning_state, "Succeeded")
+        self.assertEqual(self.client.online_endpoints.deleted, [])
+
+    def test_stale_deployments_are_deleted(self):
+        endpoint = self.lifecycle.acquire_endpoint()
+        # a run that crashed left its deployment with all the traffic
+        self.lifecycle.deploy(endpoint, deployment("demo", endpoint.name))
+        endpoint = self.lifecycle.acquire_endpoint()
+        self.assertEqual(self.client.online_deployments.deleted, ["demo"])
+        self.assertEqual(self.client.online_deployments.list(endpoint_name=self.name), [])
+        self.assertEqual(self.client.online_endpoints.endpoints[self.name].traffic, {})
+
+    def test_release_keeps_endpoint(self):
+        endpoint = self.lifecycle.acquire_endpoint()
+        self.lifecycle.deploy(endpoint, deployment("demo", endpoint.name))
+        self.lifecycle.release(endpoint.name, "demo")
+        self.assertEqual(self.client.online_endpoints.deleted, [])
+        self.assertEqual(self.client.online_endpoints.endpoints[self.name].traffic, {})
+        self.assertEqual(self.client.online_deployments.deleted, ["demo"])
+
+    def test_deploy_batch(self):
+        endpoint = self.lifecycle.acquire_endpoint()
+        self.client.online_deployments.fail.add("m1-b")
+        errors = self.lifecycle.deploy_batch([deployment("m0-a", endpoint.name), deployment("m1-b", endpoint.name)])
+        self.assertEqual(list(errors), ["m0-a", "m1-b"])
+        self.assertIsNone(errors["m0-a"])
+        self.assertIsInstance(errors["m1-b"], Exception)
+        # deployments that were never created only print a warning
+        self.lifecycle.release(endpoint.name, "m0-a", "m1-b")
+        self.assertEqual(self.client.online_deployments.deleted, ["m0-a"])
+
+
+class TestDeploymentNames(unittest.TestCase):
+    def test_deployment_name(self):
+        self.assertEqual(get_deployment_name("Helsinki-NLP/opus-mt-de-nl", 3), "m3-helsinki-nlp-opus-mt-de-nl")
+        name = get_deployment_name("a-very-long-model-name-that-does-not-fit-32", 12)
+        self.assertLessEqual(len(name), 32)
+        self.assertFalse(name.endswith("-"))
+
+    def test_waves_fit_quota(self):
+        sizes = [SimpleNamespace(name="Standard_DS3_v2", family="standardDSv2Family", v_cp_us=4)]
+        usages = [SimpleNamespace(name=SimpleNamespace(value="standardDSv2Family"), limit=12, current_value=2)]
+        client = FakeMLClient(FakeCompute(sizes, usages))
+        # 10 cores left fit two deployments of 4 cores with the 20% reserve
+        self.assertEqual(plan_deployment_waves(client, ["Standard_DS3_v2"] * 5, 4), [[0, 1], [2, 3], [4]])
+
+    def test_waves_without_quota(self):
+        client = FakeMLClient(FakeCompute(None, None))
+        self.assertEqual(plan_deployment_waves(client, ["Standard_DS3_v2"] * 5, 2), [[0, 1], [2, 3], [4]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,285 @@
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import requests
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(TESTS_DIR, "setup"))
+from github_api import create_github_session, get_blob_sha, get_tree_sha_index, get_with_rate_limit
+from run_store import iter_runs
+
+
+# stub of the github actions api, serves /actions/runs from runs, newest first, with the page and created filters
+# page_overlap repeats the last run of the previous page at the top of every page, like runs created while paging
+# do. the first rate_limited requests are answered with status rate_limit_status and an exhausted rate limit
+# /git/trees/<sha> serves trees, {sha: [entry]}, refs are looked up like shas
+# /actions/runs/<id>/jobs serves the jobs of a run, {id: [job]}
+class StubGitHubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        stub = self.server
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with stub.lock:
+            stub.requests.append((url.path, params))
+            rate_limited = stub.rate_limited > 0
+            stub.rate_limited -= 1
+        if rate_limited:
+            self.send_json(stub.rate_limit_status, {"message": "API rate limit exceeded"},
+                           {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()))})
+        elif url.path.endswith("/actions/runs"):
+            runs = sorted(stub.runs, key=lambda run: run["created_at"], reverse=True)
+            if "created" in params:
+                runs = [run for run in runs if run["created_at"] >= params["created"][len(">="):]]
+            page, per_page = int(params.get("page", 1)), int(params.get("per_page", 30))
+            start = max((page - 1) * per_page - stub.page_overlap, 0)
+            self.send_json(200, {"total_count": len(runs), "workflow_runs": runs[start:page * per_page]})
+        elif url.path.endswith("/jobs") and int(url.path.split("/")[-2]) in stub.jobs:
+            self.send_json(200, {"total_count": len(stub.jobs[int(url.path.split("/")[-2])]), "jobs": stub.jobs[int(url.path.split("/")[-2])]})
+        elif "/git/trees/" in url.path and url.path.split("/git/trees/")[1] in stub.trees:
+            sha = url.path.split("/git/trees/")[1]
+            self.send_json(200, {"sha": sha, "tree": stub.trees[sha], "truncated": False})
+        else:
+            self.send_json(404, {"message": "Not Found"})
+
+    def send_json(self, status, body, headers={}):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for header in headers:
+            self.send_header(header, headers[header])
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class StubGitHub(HTTPServer):
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), StubGitHubHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.runs = []
+        self.trees = {}
+        self.jobs = {}
+        self.page_overlap = 0
+        self.rate_limited = 0
+        self.rate_limit_status = 403
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/repos/Azure/azureml-oss-models"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def make_run(id, name, created_at, status="completed", conclusion="success"):
+    return {"id": id, "name": name, "status": status, "conclusion": conclusion if status == "completed" else None,
+            "created_at": created_at, "updated_at": created_at.replace("T10", "T11")}
+
+
+class TestGetWithRateLimit(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubGitHub()
+        # a session without retries, so only get_with_rate_limit waits
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_waits_for_reset(self):
+        for status in [403, 429]:
+            self.stub.requests.clear()
+            self.stub.rate_limited = 1
+            self.stub.rate_limit_status = status
+            start = time.time()
+            response = get_with_rate_limit(self.session, f"{self.stub.url}/actions/runs")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(self.stub.requests), 2)
+            # waits until the reset time, plus a second
+            self.assertGreaterEqual(time.time() - start, 0.9)
+
+    def test_github_session_waits_for_primary_rate_limit(self):
+        # a 429 without Retry-After is not retried by the session, get_with_rate_limit waits for the reset
+        self.stub.rate_limited = 1
+        self.stub.rate_limit_status = 429
+        session = create_github_session(retries=5, backoff_factor=0)
+        start = time.time()
+        response = get_with_rate_limit(session, f"{self.stub.url}/actions/runs")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.stub.requests), 2)
+        self.assertGreaterEqual(time.time() - start, 0.9)
+
+    def test_gives_up_after_max_wait(self):
+        self.stub.rate_limited = 1
+        response = get_with_rate_limit(self.session, f"{self.stub.url}/actions/runs", max_wait=0)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(self.stub.requests), 1)
+
+
+class TestTreeShaIndex(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubGitHub()
+        self.stub.trees = {
+            "main": [{"path": ".github", "type": "tree", "sha": "github-tree"},
+                     {"path": "README.md", "type": "blob", "sha": "readme-blob"}],
+            "github-tree": [{"path": "workflows", "type": "tree", "sha": "workflows-tree"}],
+            "workflows-tree": [{"path": f"MLFlow-model-{i}.yml", "type": "blob", "sha": f"blob-{i}"} for i in range(3)]
+                              + [{"path": "old", "type": "tree", "sha": "old-tree"}],
+        }
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_index_directory(self):
+        sha_index = get_tree_sha_index(self.session, self.stub.url, "main", ".github/workflows")
+        self.assertEqual(sha_index, {f"MLFlow-model-{i}.yml": f"blob-{i}" for i in range(3)})
+        # one call per path segment
+        self.assertEqual([path.split("/git/trees/")[1] for path, _ in self.stub.requests], ["main", "github-tree", "workflows-tree"])
+
+    def test_missing_path_or_ref(self):
+        self.assertEqual(get_tree_sha_index(self.session, self.stub.url, "main", ".github/actions"), {})
+        self.assertEqual(get_tree_sha_index(self.session, self.stub.url, "no-such-branch", ".github/workflows"), {})
+
+    def test_blob_sha(self):
+        # the SHA git hash-object reports for a file with this content
+        self.assertEqual(get_blob_sha("hello\n"), "ce013625030ba8dba906f756967f9e9ca394464a")
+
+
+# runs test_status_v2.py against the stub, in a temporary directory laid out like tests/ so ../logs and ../config
+# are written there
+class TestStatusV2Ingestion(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubGitHub()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.setup_dir = os.path.join(self.temp_dir.name, "setup")
+        os.makedirs(self.setup_dir)
+        os.makedirs(os.path.join(self.temp_dir.name, "config"))
+        shutil.copy(os.path.join(TESTS_DIR, "config", "dashboard-template.html"), os.path.join(self.temp_dir.name, "config"))
+        self.models = [f"MLFlow-model-{i}" for i in range(5)]
+        with open(os.path.join(self.temp_dir.name, "models.json"), "w") as f:
+            json.dump(self.models, f)
+        self.run_store = os.path.join(self.temp_dir.name, "run_store.sqlite")
+
+    def tearDown(self):
+        self.stub.stop()
+        self.temp_dir.cleanup()
+
+    # runs_file None writes and reads the default timestamped dumps in ../logs/get_github_workflows
+    def run_test_status(self, *extra_args, runs_file="runs.jsonl.gz", check=True):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [os.path.join(TESTS_DIR, "src")] + [path for path in [os.environ.get("PYTHONPATH")] if path]))
+        runs_file_args = ["--github_workflows_file", os.path.join(self.temp_dir.name, runs_file)] if runs_file else []
+        return subprocess.run([sys.executable, os.path.join(TESTS_DIR, "setup", "test_status_v2.py"),
+                               "--github_api_url", self.stub.url, "--mode_model", "file",
+                               "--model_list_file", os.path.join(self.temp_dir.name, "models.json"),
+                               "--run_store", self.run_store, "--expand_queue_runs", "false",
+                               "--markdown_file", os.path.join(self.temp_dir.name, "dashboard", "README.md"),
+                               "--workers", "4", *runs_file_args, *extra_args],
+                              cwd=self.setup_dir, env=env, check=check, capture_output=True, text=True)
+
+    def get_runs_files(self):
+        return sorted(glob.glob(os.path.join(self.temp_dir.name, "logs", "get_github_workflows", "*.jsonl.gz")))
+
+    def get_stored_runs(self):
+        with sqlite3.connect(self.run_store) as connection:
+            return {row[0]: row[1:] for row in connection.execute("SELECT id, status, conclusion FROM runs")}
+
+    def test_pages_rate_limit_and_incremental_merge(self):
+        self.stub.runs = [make_run(i, self.models[i % 5], f"2023-05-{1 + i // 24:02d}T10:{i % 24:02d}:00Z")
+                          for i in range(250)]
+        # the newest run is still in progress when it is fetched
+        self.stub.runs[-1] = make_run(249, self.models[249 % 5], self.stub.runs[-1]["created_at"], status="in_progress")
+        self.stub.page_overlap = 1
+        self.stub.rate_limited = 1
+        self.run_test_status()
+        runs = self.get_stored_runs()
+        # 3 pages of 100 with a run repeated on pages 2 and 3, stored once
+        self.assertEqual(len(runs), 250)
+        self.assertEqual(runs[249], ("in_progress", None))
+        self.assertEqual(sum(1 for path, _ in self.stub.requests if path.endswith("/actions/runs")), 4)
+
+        # the in progress run completes and two runs are added
+        self.stub.requests.clear()
+        self.stub.runs[-1] = make_run(249, self.models[249 % 5], self.stub.runs[-1]["created_at"], conclusion="failure")
+        self.stub.runs += [make_run(250 + i, self.models[i], "2023-05-12T10:00:00Z") for i in range(2)]
+        self.run_test_status("--incremental", "true")
+        runs = self.get_stored_runs()
+        self.assertEqual(len(runs), 252)
+        self.assertEqual(runs[249], ("completed", "failure"))
+        # only runs created since the oldest run that was in progress are fetched
+        self.assertEqual([params.get("created") for _, params in self.stub.requests], [">=" + self.stub.runs[249]["created_at"]])
+
+    def test_expand_queue_runs(self):
+        def make_queue_run(id, created_at, steps, status="completed"):
+            run = make_run(id, "queue-huggingface-all-test-eastus-0", created_at, status=status)
+            run["jobs_url"] = f"{self.stub.url}/actions/runs/{id}/jobs"
+            self.stub.jobs[id] = [{"name": "test", "steps": [
+                {"name": name, "status": step_status, "conclusion": "success" if step_status == "completed" else None,
+                 "started_at": None if step_status == "queued" else created_at, "completed_at": created_at.replace("T10", "T11") if step_status == "completed" else None}
+                for name, step_status in steps]}]
+            return run
+        self.stub.runs = [make_queue_run(1, "2023-05-01T10:00:00Z", [("MLFlow-model-0", "completed"), ("MLFlow-model-1", "completed")]),
+                          make_queue_run(2, "2023-05-02T10:00:00Z", [("MLFlow-model-2", "in_progress"), ("MLFlow-model-3", "queued")], status="in_progress")]
+        self.run_test_status("--expand_queue_runs", "true")
+        self.assertEqual(sorted(path for path, _ in self.stub.requests if path.endswith("/jobs")), [f"/repos/Azure/azureml-oss-models/actions/runs/{id}/jobs" for id in [1, 2]])
+        with sqlite3.connect(self.run_store) as connection:
+            self.assertEqual(connection.execute("SELECT created_at FROM runs WHERE name = 'MLFlow-model-2'").fetchone()[0], "2023-05-02T10:00:00Z")
+
+        # the queue run completes, the jobs of the queue run that completed before are not fetched again
+        self.stub.requests.clear()
+        self.stub.runs[1] = make_queue_run(2, "2023-05-02T10:00:00Z", [("MLFlow-model-2", "completed"), ("MLFlow-model-3", "completed")])
+        self.run_test_status("--expand_queue_runs", "true", "--incremental", "true")
+        self.assertEqual([path for path, _ in self.stub.requests if path.endswith("/jobs")], ["/repos/Azure/azureml-oss-models/actions/runs/2/jobs"])
+        self.stub.requests.clear()
+        self.run_test_status("--expand_queue_runs", "true")
+        self.assertEqual([path for path, _ in self.stub.requests if path.endswith("/jobs")], [])
+        with sqlite3.connect(self.run_store) as connection:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM runs WHERE status = 'completed'").fetchone()[0], 4)
+
+    def test_default_runs_dumps(self):
+        self.stub.runs = [make_run(i, self.models[i % 5], f"2023-05-01T10:{i:02d}:00Z") for i in range(10)]
+        self.run_test_status(runs_file=None)
+        runs_files = self.get_runs_files()
+        self.assertEqual(len(runs_files), 1)
+        # an incremental fetch appends to the latest dump
+        self.stub.runs.append(make_run(10, self.models[0], "2023-05-02T10:00:00Z"))
+        self.run_test_status("--incremental", "true", runs_file=None)
+        self.assertEqual(self.get_runs_files(), runs_files)
+        self.assertEqual(len({run["id"] for run in iter_runs(runs_files[0])}), 11)
+        # a full fetch writes a new dump and keeps the old one
+        time.sleep(1)
+        self.run_test_status(runs_file=None)
+        self.assertEqual(len(self.get_runs_files()), 2)
+        self.assertEqual(len({run["id"] for run in iter_runs(runs_files[0])}), 11)
+        # file mode reads the latest dump without calling the api
+        self.stub.requests.clear()
+        output = self.run_test_status("--mode_workflow", "file", runs_file=None).stdout
+        self.assertIn("Reading github workflows from", output)
+        self.assertEqual(self.stub.requests, [])
+
+    def test_missing_runs_file(self):
+        result = self.run_test_status("--mode_workflow", "file", runs_file=None, check=False)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("::error:: No github workflows file", result.stdout)
+        result = self.run_test_status("--mode_workflow", "file", runs_file="missing.jsonl.gz", check=False)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("missing.jsonl.gz", result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
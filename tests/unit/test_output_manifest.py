@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "setup"))
+from output_manifest import apply_plan, load_manifest, plan_outputs
+
+
+class TestOutputManifest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.manifest_file = os.path.join(self.temp_dir.name, "queue", "huggingface-all.manifest.json")
+        self.workflow_dir = os.path.join(self.temp_dir.name, "workflows")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.workflow_dir, name)
+
+    def apply(self, outputs, leftovers=()):
+        plan = plan_outputs(outputs, load_manifest(self.manifest_file), leftovers)
+        apply_plan(plan, outputs, self.manifest_file, workers=2)
+        return plan
+
+    def test_add_change_delete(self):
+        self.apply({self.path("MLFlow-a.yml"): "a", self.path("MLFlow-b.yml"): "b"})
+        plan = self.apply({self.path("MLFlow-a.yml"): "a2", self.path("MLFlow-c.yml"): "c"})
+        self.assertEqual((plan["add"], plan["change"], plan["delete"]),
+                         ([self.path("MLFlow-c.yml")], [self.path("MLFlow-a.yml")], [self.path("MLFlow-b.yml")]))
+        self.assertEqual(sorted(os.listdir(self.workflow_dir)), ["MLFlow-a.yml", "MLFlow-c.yml"])
+
+    def test_leftovers_are_only_deleted_by_apply(self):
+        self.apply({self.path("MLFlow-a.yml"): "a"})
+        with open(self.path("demo_MLFlow-a.yml"), "w") as f:
+            f.write("old copy")
+        leftovers = [self.path("demo_MLFlow-a.yml"), self.path("demo_MLFlow-missing.yml")]
+        # planning, as plan_only does, leaves the tree as it is
+        plan = plan_outputs({self.path("MLFlow-a.yml"): "a"}, load_manifest(self.manifest_file), leftovers)
+        self.assertEqual(plan["delete"], [self.path("demo_MLFlow-a.yml")])
+        self.assertTrue(os.path.exists(self.path("demo_MLFlow-a.yml")))
+        self.apply({self.path("MLFlow-a.yml"): "a"}, leftovers)
+        self.assertEqual(os.listdir(self.workflow_dir), ["MLFlow-a.yml"])
+        # leftovers are not added to the manifest
+        self.assertEqual(list(load_manifest(self.manifest_file)), [os.path.normpath(self.path("MLFlow-a.yml"))])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.append(SRC_DIR)
+# deploy_huggingface_models.py reads ../config/errors.json and opens the registry cache on import, it is imported
+# from the src directory like the workflows run it, with the cache kept out of ../logs
+cache_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault("REGISTRY_CACHE_FILE", os.path.join(cache_dir.name, "registry-cache.sqlite"))
+cwd = os.getcwd()
+os.chdir(SRC_DIR)
+try:
+    import run_queue
+finally:
+    os.chdir(cwd)
+from run_queue import QueueRunner
+
+
+# stands in for deploy.test_model, records the models and slots running per workspace
+class FakeTestModel:
+    def __init__(self, failing=()) -> None:
+        self.failing = failing
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_running = {}
+        self.slot_errors = []
+
+    def __call__(self, workspace_ml_client, registry_ml_client, endpoint_lifecycle, queue, model, sku_override, sku_override_set):
+        workspace = queue['workspace']
+        slot = endpoint_lifecycle.queue_name.rsplit("/", 1)[1]
+        with self.lock:
+            running = self.running.setdefault(workspace, {})
+            if slot in running.values():
+                self.slot_errors.append((model, workspace, slot))
+            running[model] = slot
+            self.max_running[workspace] = max(self.max_running.get(workspace, 0), len(running))
+        # models of the first queue take longer, so slots are freed out of order
+        time.sleep(0.05 if queue['queue_name'].endswith("-0") else 0.02)
+        with self.lock:
+            del self.running[workspace][model]
+        if model in self.failing:
+            raise ValueError(f"{model} failed")
+        return SimpleNamespace(results={"metadata": (None, "Standard_DS3_v2"), "inference": True})
+
+
+class TestQueueRunner(unittest.TestCase):
+    def setUp(self):
+        # two queues share test-eastus, test-westus has one
+        self.queues = [self.make_queue("test-eastus-0", "test-eastus", 5), self.make_queue("test-eastus-1", "test-eastus", 4),
+                       self.make_queue("test-westus-0", "test-westus", 3)]
+
+    def make_queue(self, queue_name, workspace, count):
+        return {"queue_name": queue_name, "workspace": workspace, "subscription": "sub", "resource_group": "rg",
+                "registry": "HuggingFace", "models": [f"{queue_name}-model-{i}" for i in range(count)]}
+
+    def make_runner(self, endpoint_mode):
+        runner = QueueRunner(self.queues, None, None, endpoint_mode)
+        # the ml clients are cached per workspace and registry, the fakes are never called
+        runner.workspace_ml_clients = {"test-eastus": object(), "test-westus": object()}
+        runner.registry_ml_clients = {"HuggingFace": object()}
+        return runner
+
+    def test_concurrency_and_slots(self):
+        for endpoint_mode in ["per_model", "warm"]:
+            fake = FakeTestModel()
+            with mock.patch.object(run_queue.deploy, "test_model", fake):
+                results = self.make_runner(endpoint_mode).run({"test-eastus": 3, "test-westus": 1})
+            self.assertEqual(fake.max_running, {"test-eastus": 3, "test-westus": 1})
+            self.assertEqual(fake.slot_errors, [])
+            self.assertEqual([result["model"] for result in results], [model for queue in self.queues for model in queue["models"]])
+            self.assertTrue(all(result["success"] == 1 and result["instance_type"] == "Standard_DS3_v2" for result in results))
+
+    def test_failed_model_frees_slot(self):
+        fake = FakeTestModel(failing=["test-westus-0-model-0"])
+        with mock.patch.object(run_queue.deploy, "test_model", fake):
+            results = self.make_runner("per_model").run({"test-eastus": 2, "test-westus": 1})
+        self.assertEqual(fake.slot_errors, [])
+        self.assertEqual([result["model"] for result in results if result["failure"]], ["test-westus-0-model-0"])
+        self.assertEqual(sum(result["success"] for result in results), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
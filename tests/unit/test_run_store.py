@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "setup"))
+from run_store import RunStore, iter_runs, write_runs
+
+
+def make_run(id, minutes, conclusion="success", status="completed"):
+    created_at = f"2023-05-{1 + id:02d}T10:00:00Z"
+    return {"id": id, "name": "MLFlow-model", "status": status, "conclusion": conclusion, "created_at": created_at,
+            "updated_at": f"2023-05-{1 + id:02d}T{10 + minutes // 60:02d}:{minutes % 60:02d}:00Z"}
+
+
+class TestDurationBaselines(unittest.TestCase):
+    def setUp(self):
+        self.run_store = RunStore(":memory:")
+
+    def test_baseline_is_successful_runs(self):
+        # successful runs take 30 minutes, failed and cancelled runs stop after 2
+        runs = []
+        for i in range(12):
+            runs.append(make_run(2 * i, 30))
+            runs.append(make_run(2 * i + 1, 2, "failure" if i % 2 else "cancelled"))
+        # the latest run is in progress, the latest successful run takes as long as the others
+        runs.append(make_run(24, 0, None, "in_progress"))
+        self.run_store.add_runs(runs)
+        baseline = self.run_store.get_duration_baselines(["MLFlow-model"], 5)["MLFlow-model"]
+        self.assertEqual(baseline["duration"], 30)
+        self.assertEqual(baseline["created_at"], "2023-05-23T10:00:00Z")
+        self.assertEqual((baseline["median"], baseline["p95"], baseline["baseline_runs"]), (30, 30, 5))
+
+    def test_phase_baseline_is_successful_runs(self):
+        self.run_store.add_runs([make_run(i, 30, "failure" if i % 2 else "success") for i in range(8)])
+        self.run_store.add_phases([(i, "MLFlow-model", "deploy-model-job/deploy-model-step",
+                                    f"2023-05-{1 + i:02d}T10:00:00Z", 2 if i % 2 else 20) for i in range(8)])
+        baselines = self.run_store.get_duration_baselines(["MLFlow-model"], 5, by_phase=True)
+        baseline = baselines[("MLFlow-model", "deploy-model-job/deploy-model-step")]
+        self.assertEqual((baseline["duration"], baseline["median"], baseline["baseline_runs"]), (20, 20, 3))
+
+
+class TestIncrementalSince(unittest.TestCase):
+    def setUp(self):
+        self.run_store = RunStore(":memory:")
+
+    def test_empty_store(self):
+        self.assertIsNone(self.run_store.get_incremental_since())
+
+    def test_oldest_pending_run(self):
+        self.run_store.add_runs([make_run(1, 30), make_run(2, 30, None, "in_progress"), make_run(3, 30, None, "queued"), make_run(4, 30)])
+        self.assertEqual(self.run_store.get_incremental_since(), "2023-05-03T10:00:00Z")
+        # without runs in progress, the fetch starts at the newest run
+        self.run_store.add_runs([make_run(2, 30), make_run(3, 30)])
+        self.assertEqual(self.run_store.get_incremental_since(), "2023-05-05T10:00:00Z")
+
+    def test_stuck_run_is_capped(self):
+        # run 1 never completed, it is more than 48 hours older than the newest completed run and no longer pins the fetch
+        self.run_store.add_runs([make_run(1, 30, None, "in_progress"), make_run(5, 30), make_run(6, 30, None, "queued"), make_run(8, 30)])
+        self.assertEqual(self.run_store.get_incremental_since(), "2023-05-07T10:00:00Z")
+        self.assertEqual(self.run_store.get_incremental_since(lookback_hours=24 * 7), "2023-05-02T10:00:00Z")
+
+
+# 100k runs of 1000 models, about the run history the dashboard is built from
+class TestLargeRunStore(unittest.TestCase):
+    def test_latest_runs(self):
+        run_store = RunStore(":memory:")
+        start = datetime(2023, 1, 1)
+        def runs():
+            for i in range(100000):
+                created_at = start + timedelta(minutes=i)
+                yield {"id": i, "name": f"MLFlow-model-{i % 1000}", "status": "completed", "conclusion": "failure" if i % 7 == 0 else "success",
+                       "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                       "updated_at": (created_at + timedelta(minutes=30)).strftime("%Y-%m-%dT%H:%M:%SZ")}
+        run_store.add_runs(runs())
+        self.assertEqual(run_store.count_runs(), 100000)
+        models = [f"MLFlow-model-{i}" for i in range(1000)] + ["MLFlow-not-tested"]
+        latest_runs = run_store.get_latest_runs(models)
+        # the latest run of model m is run 99000 + m, models without runs are left out
+        self.assertEqual(len(latest_runs), 1000)
+        for m in [0, 1, 6, 999]:
+            created_at = (start + timedelta(minutes=99000 + m)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            self.assertEqual(latest_runs[f"MLFlow-model-{m}"]["created_at"], created_at)
+            self.assertEqual(latest_runs[f"MLFlow-model-{m}"]["conclusion"], "failure" if (99000 + m) % 7 == 0 else "success")
+            self.assertEqual(latest_runs[f"MLFlow-model-{m}"]["duration"], 30)
+        self.assertEqual(run_store.get_incremental_since(), (start + timedelta(minutes=99999)).strftime("%Y-%m-%dT%H:%M:%SZ"))
+
+
+class TestRunsDump(unittest.TestCase):
+    def test_read_appended_runs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            runs_file = os.path.join(temp_dir, "runs.jsonl.gz")
+            self.assertEqual(write_runs(runs_file, (make_run(i, 30) for i in range(5)), "wt"), 5)
+            offset = os.path.getsize(runs_file)
+            write_runs(runs_file, (make_run(i, 30) for i in range(5, 8)), "at")
+            self.assertEqual([run["id"] for run in iter_runs(runs_file)], list(range(8)))
+            # only the runs appended after offset
+            self.assertEqual([run["id"] for run in iter_runs(runs_file, offset)], [5, 6, 7])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SETUP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "setup")
+sys.path.append(SETUP_DIR)
+from scheduling import (assign_by_duration, assign_round_robin, format_minutes, get_default_duration, get_model_duration,
+                        load_model_list_file, predict_queue_durations, simulate_queues)
+
+
+class TestHelpers(unittest.TestCase):
+    def test_format_minutes(self):
+        self.assertEqual(format_minutes(365), "6h 5m")
+        self.assertEqual(format_minutes(59.9), "0h 59m")
+
+    def test_load_model_list_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name, content in [("models.txt", "bert-base-uncased\ngpt2\n"), ("models.json", json.dumps(["bert-base-uncased", "gpt2"]))]:
+                with open(os.path.join(temp_dir, name), "w") as f:
+                    f.write(content)
+                self.assertEqual(load_model_list_file(os.path.join(temp_dir, name)), ["bert-base-uncased", "gpt2"])
+
+
+class TestAssignByDuration(unittest.TestCase):
+    def test_longest_first(self):
+        # queue entries have the MLFlow- prefix, the durations don't
+        durations = {"a": 10, "b": 8, "c": 6, "d": 4, "e": 2}
+        models = ["MLFlow-" + model for model in ["e", "d", "c", "b", "a"]]
+        queue = assign_by_duration(models, ["w1", "w2"], 1, durations)
+        # a and b open the queues, c goes to the lighter w2, d to w1, and e to w1 on the 14 minute tie
+        self.assertEqual(queue, {"w1": {0: ["MLFlow-a", "MLFlow-d", "MLFlow-e"]}, "w2": {0: ["MLFlow-b", "MLFlow-c"]}})
+        self.assertEqual(predict_queue_durations(queue, durations), {"w1-0": 16, "w2-0": 14})
+
+    def test_ties_go_to_first_queue(self):
+        queue = assign_by_duration(["m0", "m1", "m2", "m3", "m4"], ["w1", "w2"], 2, {}, 10)
+        # equal durations keep the model order and fill the queues in config order
+        self.assertEqual(queue, {"w1": {0: ["m0", "m4"], 1: ["m1"]}, "w2": {0: ["m2"], 1: ["m3"]}})
+
+    def test_median_default_duration(self):
+        durations = {"a": 10, "b": 20, "c": 60}
+        self.assertEqual(get_default_duration(durations), 20)
+        self.assertEqual(get_default_duration(durations, 5), 5)
+        self.assertEqual(get_default_duration({}), 0)
+        # x has no history and is treated as taking the median
+        queue = assign_by_duration(["x", "a"], ["w1", "w2"], 1, durations)
+        self.assertEqual(queue, {"w1": {0: ["x"]}, "w2": {0: ["a"]}})
+        self.assertEqual(predict_queue_durations(queue, durations), {"w1-0": 20, "w2-0": 10})
+
+    def test_prefix_lookup(self):
+        self.assertEqual(get_model_duration("MLFlow-a", {"a": 10}, 0), 10)
+        self.assertEqual(get_model_duration("a", {"MLFlow-a": 10}, 0), 10)
+        self.assertEqual(get_model_duration("MLFlow-a", {"MLFlow-a": 10}, 0), 10)
+        self.assertEqual(get_model_duration("b", {"a": 10}, 7), 7)
+
+    def test_not_worse_than_round_robin(self):
+        # every third model takes 10 times longer, round robin deals them all to the first queue
+        durations = {f"m{i}": 100 if i % 3 == 0 else 10 for i in range(9)}
+        models = list(durations)
+        round_robin = max(predict_queue_durations(assign_round_robin(models, ["w1", "w2", "w3"], 1), durations).values())
+        by_duration = max(predict_queue_durations(assign_by_duration(models, ["w1", "w2", "w3"], 1, durations), durations).values())
+        self.assertEqual((round_robin, by_duration), (300, 120))
+
+
+class TestSimulateQueues(unittest.TestCase):
+    def test_static_and_pull(self):
+        # models take 10 minutes, w has 4 models and v has 1
+        queue = {"w": {0: ["a", "b", "c", "d"]}, "v": {0: ["e"]}}
+        static = simulate_queues(queue, {}, 10)
+        self.assertEqual((static["makespan"], static["stolen"], static["busy"], static["idle"]), (40, 0, 50, 30))
+        self.assertEqual(static["queues"]["v-0"], {"models": 1, "busy": 10, "finished_at": 10, "idle": 30})
+        # the runner of v steals c once e is done
+        pull = simulate_queues(queue, {}, 10, policy="pull")
+        self.assertEqual((pull["makespan"], pull["stolen"], pull["models"]), (30, 1, 5))
+        self.assertEqual(pull["queues"]["v-0"]["models"], 2)
+        self.assertAlmostEqual(pull["utilization"], 50 / 60)
+
+    def test_runner_startup(self):
+        queue = {"w": {0: ["a", "b", "c"]}}
+        # model workflows start a runner for every model, queue workflows once
+        self.assertEqual(simulate_queues(queue, {}, 10, runner_startup=5)["makespan"], 45)
+        self.assertEqual(simulate_queues(queue, {}, 10, runner_startup=5, startup_per_model=False)["makespan"], 35)
+
+    def test_provisioning_by_region(self):
+        queue = {"test-eastus": {0: ["a", "b"]}, "test-westus": {0: ["c"]}}
+        regions = {"test-eastus": "eastus", "test-westus": "westus"}
+        result = simulate_queues(queue, {"a": 10, "b": 10, "c": 10}, regions=regions, provisioning={"eastus": 3})
+        self.assertEqual(result["queues"]["test-eastus-0"]["busy"], 26)
+        self.assertEqual(result["queues"]["test-westus-0"]["busy"], 10)
+        # a stolen model is provisioned in the region of the runner that tests it
+        result = simulate_queues(queue, {"a": 10, "b": 10, "c": 1}, regions=regions, provisioning={"eastus": 3}, policy="pull")
+        self.assertEqual((result["stolen"], result["queues"]["test-westus-0"]["busy"], result["makespan"]), (1, 11, 13))
+
+    def test_empty_queues(self):
+        for queue in [{}, {"w": {0: []}}]:
+            result = simulate_queues(queue, {}, 10, policy="pull")
+            self.assertEqual((result["makespan"], result["models"], result["utilization"], result["stolen"]), (0, 0, 0.0, 0))
+
+
+# runs plan_capacity.py on 10 models of an hour each, with two workspaces in eastus and one in westus
+class TestPlanCapacity(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        workspace = {"instance_type": "Standard_E8s_v3", "max_parallel_tests": 4}
+        self.workspaces = {"test-eastus-a": dict(workspace, region="eastus"), "test-eastus-b": dict(workspace, region="eastus"),
+                           "test-westus": dict(workspace, region="westus")}
+        self.workspace_list = os.path.join(self.temp_dir.name, "workspaces.json")
+        with open(self.workspace_list, "w") as f:
+            json.dump(self.workspaces, f)
+        self.model_list = os.path.join(self.temp_dir.name, "models.txt")
+        with open(self.model_list, "w") as f:
+            f.write("\n".join(f"model-{i}" for i in range(10)))
+        self.output_file = os.path.join(self.temp_dir.name, "workspaces-plan.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def plan(self, *extra_args):
+        output = subprocess.run([sys.executable, os.path.join(SETUP_DIR, "plan_capacity.py"),
+                                 "--model_list_file", self.model_list, "--workspace_list", self.workspace_list,
+                                 "--default_duration", "60", "--target_hours", "3", "--output_file", self.output_file, *extra_args],
+                                cwd=SETUP_DIR, check=True, capture_output=True, text=True).stdout
+        with open(self.output_file) as f:
+            return output, list(json.load(f))
+
+    def test_without_quota(self):
+        # 4 runners test 10 models in 3 rounds, fewest workspaces first
+        output, workspaces = self.plan()
+        self.assertEqual(workspaces, ["test-eastus-a"])
+        self.assertIn("--parallel_tests 4", output)
+
+    def test_quota_is_shared_by_region(self):
+        # 16 cores fit 2 deployments of 8 cores per region, the eastus workspaces can't both run 2 tests
+        output, workspaces = self.plan("--quota_cores", "16")
+        self.assertEqual(workspaces, ["test-eastus-a", "test-westus"])
+        self.assertIn("--parallel_tests 2", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from registry_cache import RegistryCache
+from sku_index import TEMPLATES, build_template_index, resolve_instance_type
+
+
+# fake registry MLClient, models.list(name=...) lists one version of a template model with its default instance type
+class FakeModels:
+    def __init__(self, instance_types) -> None:
+        self.instance_types = instance_types
+        self.calls = []
+
+    def list(self, name=None):
+        self.calls.append(name)
+        if name not in self.instance_types:
+            return []
+        return [SimpleNamespace(name=name, version="1", id=f"azureml://registries/fake/models/{name}/versions/1",
+                                properties={"inference": json.dumps({"DefaultInstanceType": self.instance_types[name]})}, tags={}, flavors={},
+                                creation_context=SimpleNamespace(created_at=datetime(2023, 1, 1)))]
+
+
+class FakeMLClient:
+    def __init__(self, instance_types) -> None:
+        self.models = FakeModels(instance_types)
+
+
+class TestResolveInstanceType(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.registry_cache = RegistryCache(os.path.join(self.cache_dir.name, "registry-cache.sqlite"))
+        instance_types = {template: "Standard_DS3_v2" for template in TEMPLATES}
+        instance_types["transformers-gpu-large"] = "Standard_NC24s_v3"
+        self.client = FakeMLClient(instance_types)
+        self.template_index = build_template_index(self.client, "fake", self.registry_cache)
+        self.client.models.calls.clear()
+
+    def tearDown(self):
+        self.registry_cache.connection.close()
+        self.cache_dir.cleanup()
+
+    def test_index_hit(self):
+        instance_type = resolve_instance_type("demo", TEMPLATES[0], self.template_index, None, self.client, "fake", self.registry_cache)
+        self.assertEqual(instance_type, "Standard_DS3_v2")
+        self.assertEqual(self.client.models.calls, [])
+
+    def test_sku_override(self):
+        sku_override = {"demo": {"sku": "Standard_F8s_v2"}}
+        self.assertEqual(resolve_instance_type("demo", TEMPLATES[0], self.template_index, sku_override), "Standard_F8s_v2")
+
+    def test_template_outside_index(self):
+        # a template that is not in TEMPLATES is resolved from the registry once, then cached
+        for _ in range(2):
+            instance_type = resolve_instance_type("demo", "transformers-gpu-large", self.template_index, None,
+                                                  self.client, "fake", self.registry_cache)
+            self.assertEqual(instance_type, "Standard_NC24s_v3")
+        self.assertEqual(self.client.models.calls, ["transformers-gpu-large"])
+        self.assertEqual(self.registry_cache.get_template_index("fake")["transformers-gpu-large"], "Standard_NC24s_v3")
+        # without a client a miss stays a miss
+        self.assertIsNone(resolve_instance_type("demo", "transformers-gpu-extra-large", self.template_index))
+
+    def test_unknown_template(self):
+        instance_type = resolve_instance_type("demo", "no-such-template", self.template_index, None, self.client, "fake", self.registry_cache)
+        self.assertIsNone(instance_type)
+        self.assertNotIn("no-such-template", self.registry_cache.get_template_index("fake"))
+
+    def test_invalidate_template(self):
+        self.registry_cache.invalidate("fake", TEMPLATES[0])
+        template_index = self.registry_cache.get_template_index("fake")
+        self.assertNotIn(TEMPLATES[0], template_index)
+        self.assertEqual(len(template_index), len(TEMPLATES) - 1)
+        self.registry_cache.invalidate("fake")
+        self.assertIsNone(self.registry_cache.get_template_index("fake"))
+
+
+if __name__ == "__main__":
+    unittest.main()
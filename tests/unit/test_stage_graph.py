@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from stage_graph import StageGraph
+
+
+class TestStageGraph(unittest.TestCase):
+    def test_independent_stages_overlap(self):
+        # both stages wait for each other at the barrier, so they only finish when they run at the same time
+        barrier = threading.Barrier(2, timeout=5)
+        def stage(result):
+            barrier.wait()
+            time.sleep(0.1)
+            return result
+        graph = StageGraph("test")
+        graph.add("endpoint", lambda: stage("ep"))
+        graph.add("metadata", lambda: stage("model"))
+        graph.add("deploy", lambda endpoint, metadata: f"{endpoint}/{metadata}", depends_on=["endpoint", "metadata"])
+        results = graph.run()
+        self.assertEqual(results, {"endpoint": "ep", "metadata": "model", "deploy": "ep/model"})
+        # deploy starts after both, and is listed last in the timings
+        self.assertGreaterEqual(graph.timings["deploy"][0], max(graph.timings["endpoint"][1], graph.timings["metadata"][1]))
+        lines = graph.format_timings()
+        self.assertEqual(lines[0], "####Stage timings of test")
+        self.assertEqual(lines[5].split("|")[0], "deploy")
+
+    def test_failed_stage_stops_new_stages(self):
+        started = []
+        def fail():
+            started.append("fail")
+            raise ValueError("endpoint failed")
+        def slow():
+            started.append("slow")
+            time.sleep(0.3)
+            started.append("slow done")
+        graph = StageGraph("test")
+        graph.add("fail", fail)
+        graph.add("slow", slow)
+        graph.add("after", lambda result: started.append("after"), depends_on=["slow"])
+        with self.assertRaises(ValueError):
+            graph.run()
+        # the running stage finishes before the error is raised, the stage depending on it never starts
+        self.assertEqual(sorted(started), ["fail", "slow", "slow done"])
+        self.assertNotIn("after", graph.timings)
+
+    def test_first_error_is_raised(self):
+        def fail_later():
+            time.sleep(0.2)
+            raise RuntimeError("second")
+        def fail_first():
+            raise ValueError("first")
+        graph = StageGraph("test")
+        graph.add("later", fail_later)
+        graph.add("first", fail_first)
+        with self.assertRaises(ValueError) as context:
+            graph.run()
+        self.assertEqual(str(context.exception), "first")
+        self.assertIn("later", graph.timings)
+
+    def test_exit_in_stage(self):
+        def stage():
+            print ("::error:: Could not find instance_type")
+            exit (1)
+        graph = StageGraph("test")
+        graph.add("instance_type", stage)
+        graph.add("next", lambda result: result, depends_on=["instance_type"])
+        with self.assertRaises(SystemExit) as context:
+            graph.run()
+        self.assertEqual(context.exception.code, 1)
+        self.assertNotIn("next", graph.timings)
+
+    def test_add_checks_dependencies(self):
+        graph = StageGraph("test")
+        graph.add("a", lambda: None)
+        with self.assertRaises(ValueError):
+            graph.add("a", lambda: None)
+        with self.assertRaises(ValueError):
+            graph.add("b", lambda c: None, depends_on=["c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(TESTS_DIR, "setup"))
+sys.path.append(os.path.join(TESTS_DIR, "src"))
+from registry_cache import RegistryCache
+from util import call_with_retry, get_model_containers
+
+# seconds every fake list call takes, like a round trip to the registry
+LATENCY = 0.05
+
+
+# fake registry MLClient, models.list() lists the containers and models.list(name=...) the versions of one,
+# after sleeping LATENCY. containers with 0 versions are archived
+class FakeModels:
+    def __init__(self, version_counts) -> None:
+        self.version_counts = version_counts
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def list(self, name=None):
+        with self.lock:
+            self.calls += 1
+        time.sleep(LATENCY)
+        if name is None:
+            return [SimpleNamespace(name=container, latest_version=str(count) if count else None)
+                    for container, count in self.version_counts.items()]
+        created_at = datetime(2023, 1, 1)
+        return [SimpleNamespace(name=name, version=str(version), id=f"azureml://registries/fake/models/{name}/versions/{version}",
+                                properties={}, tags={"task": "fill-mask"}, flavors={},
+                                creation_context=SimpleNamespace(created_at=created_at + timedelta(days=version)))
+                for version in range(1, self.version_counts[name] + 1)]
+
+
+class FakeMLClient:
+    def __init__(self, version_counts) -> None:
+        self.models = FakeModels(version_counts)
+
+
+class TestGetModelContainers(unittest.TestCase):
+    def setUp(self):
+        # get_model_containers writes to ../logs, relative to the working directory
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.temp_dir.name, "setup"))
+        self.cwd = os.getcwd()
+        os.chdir(os.path.join(self.temp_dir.name, "setup"))
+        self.version_counts = {f"model-{i}": i % 4 for i in range(24)}
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.temp_dir.cleanup()
+
+    def get_model_containers(self, max_workers):
+        client = FakeMLClient(self.version_counts)
+        # a new cache for every call, so every version listing goes to the fake client
+        registry_cache = RegistryCache(os.path.join(self.temp_dir.name, f"registry-cache-{max_workers}.sqlite"))
+        start = time.time()
+        models = get_model_containers("fake", [], max_workers=max_workers, registry_ml_client=client, registry_cache=registry_cache)
+        return models, time.time() - start, client
+
+    def test_concurrent_matches_sequential(self):
+        sequential, sequential_time, _ = self.get_model_containers(1)
+        concurrent, concurrent_time, client = self.get_model_containers(16)
+        self.assertEqual(concurrent, sequential)
+        # archived containers have no versions and are left out, in registry order
+        self.assertEqual(concurrent, [name for name, count in self.version_counts.items() if count > 0])
+        self.assertEqual(client.models.calls, len(self.version_counts) + 1)
+        self.assertLess(concurrent_time, sequential_time / 3)
+
+
+class TestCallWithRetry(unittest.TestCase):
+    def test_retries_transient_error(self):
+        calls = []
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("Connection reset by peer")
+            return "versions"
+        self.assertEqual(call_with_retry(flaky, retries=5, backoff_factor=0), "versions")
+        self.assertEqual(len(calls), 3)
+
+    def test_raises_after_retries(self):
+        calls = []
+        def failing():
+            calls.append(1)
+            raise ConnectionError("Connection reset by peer")
+        with self.assertRaises(ConnectionError):
+            call_with_retry(failing, retries=2, backoff_factor=0)
+        self.assertEqual(len(calls), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.append(SRC_DIR)
+from work_queue import WorkQueue, open_work_queue
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.temp_dir.name, "work-queue.sqlite")
+        self.queue_dir = os.path.join(self.temp_dir.name, "queue")
+        os.makedirs(self.queue_dir)
+        # test-eastus-0 has 1 model, test-eastus-1 and test-westus-0 have 3
+        self.queues = {"test-eastus-0": ["a0"], "test-eastus-1": ["b0", "b1", "b2"], "test-westus-0": ["c0", "c1", "c2"]}
+        for queue_name in self.queues:
+            with open(os.path.join(self.queue_dir, f"{queue_name}.json"), "w") as f:
+                json.dump({"queue_name": queue_name, "workspace": queue_name.rsplit("-", 1)[0], "models": self.queues[queue_name]}, f)
+        self.work_queues = []
+
+    def tearDown(self):
+        for work_queue in self.work_queues:
+            work_queue.connection.close()
+        self.temp_dir.cleanup()
+
+    def open(self, **kwargs):
+        work_queue = WorkQueue(self.db_file, **kwargs)
+        self.work_queues.append(work_queue)
+        return work_queue
+
+    def get_model(self, work_queue, model):
+        return work_queue.connection.execute("SELECT * FROM models WHERE model = ?", (model,)).fetchone()
+
+    def test_load_keeps_status(self):
+        work_queue = self.open()
+        work_queue.load_queue_files(self.queue_dir)
+        work_queue.complete("b0")
+        work_queue.load_queue_files(self.queue_dir)
+        self.assertEqual(self.get_model(work_queue, "b0")["status"], "done")
+        self.assertEqual(work_queue.get_queue("test-eastus-1")["models"], ["b0", "b1", "b2"])
+        self.assertEqual(work_queue.get_queue("test-eastus-1")["workspace"], "test-eastus")
+
+    def test_lease_own_queue_then_steal(self):
+        work_queue = self.open()
+        work_queue.load_queue_files(self.queue_dir)
+        self.assertEqual(work_queue.lease("test-eastus-0"), "a0")
+        # test-eastus-0 is empty, the other queues both have 3 pending, ties go to the first queue by name
+        self.assertEqual(work_queue.lease("test-eastus-0"), "b0")
+        # test-westus-0 now has the most pending models
+        self.assertEqual(work_queue.lease("test-eastus-0"), "c0")
+        self.assertEqual(work_queue.lease("test-westus-0"), "c1")
+        self.assertEqual(self.get_model(work_queue, "c0")["leased_by"], "test-eastus-0")
+        leased = [work_queue.lease("test-eastus-0") for _ in range(4)]
+        self.assertEqual(leased, ["b1", "b2", "c2", None])
+
+    def test_start_returns_queue_of_runner(self):
+        work_queue = self.open()
+        work_queue.load_queue_files(self.queue_dir)
+        work_queue.lease("test-eastus-0")
+        # b0 is stolen by the runner of test-eastus-0, and tested in its workspace
+        self.assertEqual(work_queue.lease("test-eastus-0"), "b0")
+        self.assertEqual(work_queue.start("b0", "test-eastus-1")["queue_name"], "test-eastus-0")
+        self.assertEqual(self.get_model(work_queue, "b0")["attempts"], 1)
+        # the first model of a chain is started without a lease
+        self.assertEqual(work_queue.start("c0", "test-westus-0")["queue_name"], "test-westus-0")
+        self.assertEqual(self.get_model(work_queue, "c0")["attempts"], 1)
+
+    def test_expired_lease_is_requeued(self):
+        # leases expire as soon as they are taken
+        work_queue = self.open(lease_seconds=-1, max_attempts=2)
+        work_queue.load_queue_files(self.queue_dir)
+        self.assertEqual(work_queue.lease("test-eastus-0"), "a0")
+        # the expired lease goes back to pending and is leased again
+        self.assertEqual(work_queue.lease("test-eastus-0"), "a0")
+        self.assertEqual(self.get_model(work_queue, "a0")["attempts"], 2)
+        # out of attempts, a0 is failed and the runner steals
+        self.assertEqual(work_queue.lease("test-eastus-0"), "b0")
+        self.assertEqual(self.get_model(work_queue, "a0")["status"], "failed")
+        self.assertEqual(work_queue.requeue_expired(), 1)
+        self.assertEqual(self.get_model(work_queue, "b0")["status"], "pending")
+
+    def test_concurrent_leases(self):
+        self.open().load_queue_files(self.queue_dir)
+        leased = []
+        lock = threading.Lock()
+        # every runner has its own connection, like runners of different workflows
+        def runner(queue_name):
+            work_queue = WorkQueue(self.db_file)
+            while True:
+                model = work_queue.lease(queue_name)
+                if model is None:
+                    break
+                with lock:
+                    leased.append(model)
+            work_queue.connection.close()
+        threads = [threading.Thread(target=runner, args=(queue_name,)) for queue_name in self.queues for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(leased), sorted(model for queue_name in self.queues for model in self.queues[queue_name]))
+
+    def test_lease_waits_for_immediate_transaction(self):
+        first = self.open()
+        first.load_queue_files(self.queue_dir)
+        # the first connection holds the write lock, the lease of a second connection waits for it
+        first.connection.execute("BEGIN IMMEDIATE")
+        first.connection.execute("UPDATE models SET status = 'done' WHERE model = 'a0'")
+        result = []
+        def lease():
+            second = WorkQueue(self.db_file)
+            result.append(second.lease("test-eastus-0"))
+            second.connection.close()
+        thread = threading.Thread(target=lease)
+        thread.start()
+        time.sleep(0.3)
+        self.assertTrue(thread.is_alive())
+        first.connection.execute("COMMIT")
+        thread.join()
+        # the lease sees the committed update, a0 is done
+        self.assertEqual(result, ["b0"])
+
+    def test_complete_on_exit(self):
+        self.open().load_queue_files(self.queue_dir)
+        # the run completes a0 and exits with an error before testing b0
+        script = f"""
+import sys
+sys.path.append({SRC_DIR!r})
+from work_queue import WorkQueue
+work_queue = WorkQueue({self.db_file!r})
+work_queue.complete_on_exit("a0", "b0")
+work_queue.complete("a0")
+exit(1)
+"""
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 1)
+        work_queue = self.open()
+        self.assertEqual(self.get_model(work_queue, "a0")["status"], "done")
+        self.assertEqual(self.get_model(work_queue, "b0")["status"], "failed")
+
+    def test_open_missing_work_queue(self):
+        with self.assertRaises(SystemExit):
+            open_work_queue(os.path.join(self.temp_dir.name, "missing.sqlite"))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir.name, "missing.sqlite")))
+
+
+if __name__ == "__main__":
+    unittest.main()